@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+API_VERSION = '2024-09-01'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so pooled clients can reuse connections
+    disable_nagle_algorithm = True  # headers and body are separate writes
+
+    def setup(self):
+        super().setup()
+        self.server.stats['connections'] += 1
+
+    def do_GET(self):
+        if self.path == '/stats':
+            return self._send(200, self.server.stats)
+        self.server.pause()
+        if not self.path.startswith('/cards/'):
+            return self._send(404, {'message': 'Not found'})
+        card_id = self.path[len('/cards/'):]
+        if card_id.startswith('missing'):
+            return self._send(404, {'message': 'Card not found'})
+        hours = -1 if card_id.startswith('expired') else 24
+        self._send(200, {
+            'id': card_id,
+            'state': 'active',
+            'expiry_time': (datetime.utcnow() + timedelta(hours=hours)).isoformat() + 'Z',
+        })
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        self.server.pause()
+        if self.path != '/transactions':
+            return self._send(404, {'message': 'Not found'})
+        if self.headers.get('Revolut-Api-Version') != API_VERSION:
+            return self._send(400, {'message': 'Invalid API version'})
+        self.server.stats['transactions'] += 1
+        self._send(200, {
+            'id': str(uuid.uuid4()),
+            'status': 'declined' if body['card_id'].startswith('declined') else 'approved',
+            'card_id': body['card_id'],
+            'amount': body['amount'],
+            'merchant': body['merchant'],
+        })
+
+    def _send(self, status: int, data: Dict):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('Revolut-Api-Version', API_VERSION)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockRevolutServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Revolut card API, for tests and load tests
+
+    Serves ``GET /cards/<id>`` and ``POST /transactions`` over plain HTTP
+    with a fixed per-request ``latency``. Card ids starting with
+    ``missing``, ``expired`` or ``declined`` exercise the error paths.
+    ``stats`` counts accepted connections and transactions, and is also
+    served at ``GET /stats`` for a server running in another process
+    (see ``serve``).
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024  # load tests open many connections at once
+
+    def __init__(self, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.stats: Dict[str, int] = {'connections': 0, 'transactions': 0}
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def pause(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def start(self) -> 'MockRevolutServer':
+        self._thread = threading.Thread(target=self.serve_forever, name='mock-revolut', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> 'MockRevolutServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def serve(latency: float = 0.0, ready=None) -> None:
+    """
+    Run a server until the process is terminated
+
+    Target for ``multiprocessing.Process``: load tests keep the mock out of
+    the measured process so its handler threads don't compete with the
+    client for the GIL. ``ready`` is a queue that receives the base URL.
+    """
+    server = MockRevolutServer(latency=latency)
+    if ready is not None:
+        ready.put(server.base_url)
+    server.serve_forever()
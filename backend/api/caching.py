@@ -0,0 +1,225 @@
+import hashlib
+import json
+import time
+from calendar import timegm
+from typing import Dict
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+class ConditionalGetMixin:
+    """
+    Conditional GET (304 Not Modified) for viewset list and retrieve
+
+    Validators come from one small query instead of the full fetch and
+    serialization:
+
+    - list: ``max(updated_at)`` plus the row count of the filtered
+      queryset, so edits, inserts and deletes all change the ETag. Lists
+      send no Last-Modified because a delete doesn't move the timestamp.
+    - retrieve: the timestamps in ``detail_last_modified_fields``, which
+      may follow relations (e.g. the nested category), sent as both ETag
+      and Last-Modified.
+    """
+    last_modified_field = 'updated_at'
+    detail_last_modified_fields = ('updated_at',)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        stamp = queryset.aggregate(
+            last_modified=Max(self.last_modified_field),
+            count=Count('pk')
+        )
+        etag = self.make_etag(request, stamp['last_modified'], stamp['count'])
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        response = super().list(request, *args, **kwargs)
+        return self.set_validators(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            stamps = (
+                self.get_queryset()
+                .filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+                .values_list(*self.detail_last_modified_fields)
+                .first()
+            )
+        except (TypeError, ValueError, ValidationError):
+            stamps = None
+        if stamps is None:
+            # Let the regular path raise the 404
+            return super().retrieve(request, *args, **kwargs)
+
+        last_modified = max(stamp for stamp in stamps if stamp is not None)
+        etag = self.make_etag(request, *stamps)
+        last_modified = timegm(last_modified.utctimetuple())
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = super().retrieve(request, *args, **kwargs)
+        return self.set_validators(response, etag, last_modified)
+
+    def make_etag(self, request, *parts) -> str:
+        """Weak ETag over the request URL, negotiated format and version parts"""
+        renderer = getattr(request, 'accepted_renderer', None)
+        source = '|'.join(
+            [request.get_full_path(), getattr(renderer, 'format', '')] +
+            [part.isoformat() if hasattr(part, 'isoformat') else str(part) for part in parts]
+        )
+        return 'W/' + quote_etag(hashlib.md5(source.encode('utf-8')).hexdigest())
+
+    def set_validators(self, response, etag, last_modified=None):
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_vary_headers(response, ['Accept'])
+        return response
+
+
+# Versioned cache namespaces. Every cache key built from a namespace embeds
+# its current version, so bumping the version invalidates all of them at
+# once without having to track individual keys.
+NAMESPACE_VERSION_KEY = 'cache_version:{}'
+
+
+def get_namespace_versions(*namespaces) -> Dict[str, int]:
+    """Current version for each namespace (one cache round trip)"""
+    keys = {NAMESPACE_VERSION_KEY.format(ns): ns for ns in namespaces}
+    found = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    for key, ns in keys.items():
+        if ns not in versions:
+            # Seed from the clock so an evicted counter never reuses an old version
+            cache.add(key, time.time_ns())
+            versions[ns] = cache.get(key)
+    return versions
+
+
+def bump_namespace(*namespaces) -> None:
+    """Invalidate everything cached under the given namespaces"""
+    for ns in namespaces:
+        key = NAMESPACE_VERSION_KEY.format(ns)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns())
+
+
+def get_versioned_snapshot(key: str, namespace: str, build, timeout=None):
+    """
+    Read a blob cached together with the namespace version it was built at
+
+    The version counter and the blob come back in a single cache round
+    trip; the blob is rebuilt when the namespace has been bumped since.
+
+    Args:
+        key: Cache key of the blob
+        namespace: Namespace whose version invalidates the blob
+        build: Callable producing the value on a miss
+        timeout: Cache timeout (None keeps it until the version moves on)
+
+    Returns:
+        (version, value)
+    """
+    version_key = NAMESPACE_VERSION_KEY.format(namespace)
+    found = cache.get_many([version_key, key])
+    version, entry = found.get(version_key), found.get(key)
+    if version is not None and entry is not None and entry[0] == version:
+        return entry
+    if version is None:
+        version = get_namespace_versions(namespace)[namespace]
+    # Read the version before building so a concurrent bump is never masked
+    entry = (version, build())
+    cache.set(key, entry, timeout)
+    return entry
+
+
+def _record(prefix: str, outcome: str) -> None:
+    key = f'response_cache:stats:{prefix}:{outcome}'
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def get_response_cache_stats(prefix: str) -> Dict[str, int]:
+    """Hit/miss counters for a response cache"""
+    hits = cache.get(f'response_cache:stats:{prefix}:hits', 0)
+    misses = cache.get(f'response_cache:stats:{prefix}:misses', 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+    }
+
+
+class ResponseCacheMixin:
+    """
+    Cache list responses keyed on the normalized query parameters
+
+    Keys embed the versions of ``cache_namespaces``; the save/delete
+    signals in ``api.signals`` (and bulk writers via ``bump_namespace``)
+    bump those versions. A hit serves the stored data and ETag without
+    touching the database. Enabled by the ``RESPONSE_CACHE_ENABLED``
+    setting.
+    """
+    cache_prefix = None
+    cache_namespaces = ()
+
+    def list(self, request, *args, **kwargs):
+        if not getattr(settings, 'RESPONSE_CACHE_ENABLED', False):
+            return super().list(request, *args, **kwargs)
+
+        key = self.get_list_cache_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            _record(self.cache_prefix, 'hits')
+            etag, data = entry
+            if etag:
+                not_modified = get_conditional_response(request, etag=etag)
+                if not_modified is not None:
+                    return not_modified
+            response = Response(data)
+            if etag:
+                response['ETag'] = etag
+                patch_vary_headers(response, ['Accept'])
+            return response
+
+        _record(self.cache_prefix, 'misses')
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(
+                key,
+                (response.get('ETag'), response.data),
+                getattr(settings, 'RESPONSE_CACHE_TTL', 300)
+            )
+        return response
+
+    def get_list_cache_key(self, request, prefix=None) -> str:
+        params = sorted(
+            (name, sorted(value.strip() for value in values if value.strip()))
+            for name, values in request.query_params.lists()
+        )
+        params = [(name, values) for name, values in params if values]
+        renderer = getattr(request, 'accepted_renderer', None)
+        versions = get_namespace_versions(*self.cache_namespaces)
+        source = json.dumps([
+            request.get_host(),
+            params,
+            getattr(renderer, 'format', ''),
+            [versions[ns] for ns in self.cache_namespaces],
+        ])
+        digest = hashlib.md5(source.encode('utf-8')).hexdigest()
+        return f'response_cache:{prefix or self.cache_prefix}:{digest}'
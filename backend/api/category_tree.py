@@ -0,0 +1,111 @@
+"""
+Materialized paths for the category hierarchy
+
+Every category stores the ids from the root down to itself as
+``/1/5/12/``, so a whole subtree is one indexed ``path LIKE '/1/5/%'``
+and the ancestors of a node can be read off its own path.
+
+These helpers take the models as arguments so they work with
+historical models too; migration 0011 carries its own frozen copy of
+``rebuild_tree``.
+"""
+from collections import Counter
+from typing import Dict, List
+from django.db.models import Count
+
+ROOT_PATH = '/'
+
+# Cache namespace bumped whenever the tree or its product counts change
+CATEGORY_TREE_NAMESPACE = 'category_tree'
+
+
+def child_path(parent_path: str, pk: int) -> str:
+    return f'{parent_path or ROOT_PATH}{pk}/'
+
+
+def ancestor_ids(path: str) -> List[int]:
+    """Ids on the path from the root down to (and including) the node itself"""
+    return [int(part) for part in path.strip('/').split('/') if part]
+
+
+def path_depth(path: str) -> int:
+    return max(len(ancestor_ids(path)) - 1, 0)
+
+
+def rebuild_tree(category_model, product_model) -> int:
+    """
+    Recompute every category's path, depth and product counts from scratch
+
+    Used to populate the columns and to repair them after writes that skip
+    model save (bulk_create, queryset.update).
+
+    Returns:
+        int: Number of categories rebuilt
+
+    Raises:
+        ValueError: If the parent links contain a cycle
+    """
+    parents = dict(category_model.objects.values_list('pk', 'parent_id'))
+    direct = dict(
+        product_model.objects.filter(category__isnull=False)
+        .order_by()
+        .values('category_id')
+        .annotate(count=Count('pk'))
+        .values_list('category_id', 'count')
+    )
+
+    paths = {}
+    for pk in parents:
+        chain = []
+        node = pk
+        while node is not None and node not in paths:
+            if node in chain:
+                raise ValueError(f"Category {node} is its own ancestor")
+            chain.append(node)
+            node = parents.get(node)
+        path = paths.get(node, ROOT_PATH)
+        for node in reversed(chain):
+            path = child_path(path, node)
+            paths[node] = path
+
+    subtree = Counter()
+    for pk, count in direct.items():
+        for ancestor in ancestor_ids(paths.get(pk, '')):
+            subtree[ancestor] += count
+
+    categories = [
+        category_model(
+            pk=pk,
+            path=path,
+            depth=path_depth(path),
+            product_count=direct.get(pk, 0),
+            subtree_product_count=subtree[pk]
+        )
+        for pk, path in paths.items()
+    ]
+    category_model.objects.bulk_update(
+        categories, ['path', 'depth', 'product_count', 'subtree_product_count'], batch_size=500
+    )
+    return len(categories)
+
+
+def build_tree_snapshot(category_model) -> List[Dict]:
+    """Whole category tree as nested dicts with product counts, from one query"""
+    nodes = {}
+    roots = []
+    rows = category_model.objects.order_by('depth', 'name').values(
+        'id', 'name', 'parent_id', 'product_count', 'subtree_product_count'
+    )
+    # Parents sort before their children, so every parent is already placed
+    for row in rows:
+        node = {
+            'id': row['id'],
+            'name': row['name'],
+            'product_count': row['product_count'],
+            'subtree_product_count': row['subtree_product_count'],
+            'children': [],
+        }
+        nodes[row['id']] = node
+        parent = nodes.get(row['parent_id'])
+        (parent['children'] if parent is not None else roots).append(node)
+    return roots
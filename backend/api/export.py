@@ -0,0 +1,102 @@
+"""
+Streaming catalog export (NDJSON or CSV)
+
+Rows come from ``QuerySet.iterator(chunk_size=...)`` (a server-side
+cursor on Postgres) and are encoded as they are read, so memory use is
+bounded by the chunk size rather than the catalog size.
+"""
+import csv
+from datetime import datetime, timezone as dt_timezone
+from typing import Iterable, Iterator, Optional
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Product
+
+EXPORT_COLUMNS = (
+    'id', 'name', 'description', 'price', 'stock', 'image_url', 'source_url',
+    'category_id', 'category_name', 'avg_rating', 'review_count', 'views_count',
+    'created_at', 'updated_at',
+)
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def parse_updated_since(value: str) -> Optional[datetime]:
+    """Parse an ISO 8601 date or datetime; naive values are taken as UTC"""
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            parsed = datetime(day.year, day.month, day.day) if day else None
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def export_rows(updated_since: Optional[datetime] = None, chunk_size: int = 2000) -> Iterator[dict]:
+    """Products (with category name and rating aggregates) in id order"""
+    queryset = Product.objects.order_by('pk')
+    if updated_since is not None:
+        queryset = queryset.filter(updated_at__gte=updated_since)
+    columns = [column for column in EXPORT_COLUMNS if column != 'category_name']
+    return queryset.values(*columns, category_name=F('category__name')).iterator(chunk_size=chunk_size)
+
+
+def _ndjson_lines(rows: Iterable[dict]) -> Iterator[str]:
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode({column: row[column] for column in EXPORT_COLUMNS}) + '\n'
+
+
+class _Line:
+    """File-like object that hands back what csv.writer writes"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows: Iterable[dict]) -> Iterator[str]:
+    writer = csv.writer(_Line())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow([
+            row[column].isoformat() if isinstance(row[column], datetime) else row[column]
+            for column in EXPORT_COLUMNS
+        ])
+
+
+def stream_catalog(export_format: str,
+                   updated_since: Optional[datetime] = None,
+                   chunk_size: int = 2000) -> Iterator[str]:
+    """
+    Encode the catalog as a stream of text chunks
+
+    Args:
+        export_format: 'ndjson' or 'csv'
+        updated_since: Only products updated at or after this time
+        chunk_size: Rows fetched per round trip and emitted per chunk
+
+    Returns:
+        Iterator of strings, each holding up to ``chunk_size`` rows
+
+    Raises:
+        ValueError: If the format is not supported
+    """
+    if export_format not in CONTENT_TYPES:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    encode = _ndjson_lines if export_format == 'ndjson' else _csv_lines
+    buffer = []
+    for line in encode(export_rows(updated_since, chunk_size)):
+        buffer.append(line)
+        if len(buffer) >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
@@ -0,0 +1,77 @@
+from decimal import Decimal
+from typing import Dict, Sequence
+from django.db.models import BooleanField, Case, Count, IntegerField, Value, When
+
+# Lower bounds of the price histogram buckets; the last bucket is open-ended
+PRICE_BUCKETS = (
+    Decimal('0'), Decimal('25'), Decimal('50'), Decimal('100'),
+    Decimal('250'), Decimal('500'), Decimal('1000'),
+)
+
+
+def price_bucket(bounds: Sequence[Decimal] = PRICE_BUCKETS) -> Case:
+    """Index of the price bucket each product falls into"""
+    return Case(
+        *[When(price__lt=upper, then=Value(index)) for index, upper in enumerate(bounds[1:])],
+        default=Value(len(bounds) - 1),
+        output_field=IntegerField()
+    )
+
+
+def compute_facets(queryset, bounds: Sequence[Decimal] = PRICE_BUCKETS) -> Dict:
+    """
+    Facet counts for a filtered product queryset
+
+    Everything comes from one GROUP BY over (category, price bucket, in
+    stock), so there is a single scan however many categories exist; the
+    groups are folded into the three facets in Python.
+
+    Args:
+        queryset: Filtered Product queryset
+        bounds: Ascending lower bounds of the price buckets
+
+    Returns:
+        Dict: total, categories, price_buckets and stock counts
+    """
+    rows = (
+        queryset.order_by()
+        .annotate(
+            facet_price_bucket=price_bucket(bounds),
+            facet_in_stock=Case(
+                When(stock__gt=0, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField()
+            )
+        )
+        .values('category_id', 'category__name', 'facet_price_bucket', 'facet_in_stock')
+        .annotate(count=Count('pk'))
+    )
+
+    total = 0
+    categories = {}
+    buckets = [0] * len(bounds)
+    stock = {'in_stock': 0, 'out_of_stock': 0}
+    for row in rows:
+        count = row['count']
+        total += count
+        category = categories.setdefault(
+            row['category_id'],
+            {'id': row['category_id'], 'name': row['category__name'], 'count': 0}
+        )
+        category['count'] += count
+        buckets[row['facet_price_bucket']] += count
+        stock['in_stock' if row['facet_in_stock'] else 'out_of_stock'] += count
+
+    return {
+        'total': total,
+        'categories': sorted(categories.values(), key=lambda c: (-c['count'], c['name'] or '')),
+        'price_buckets': [
+            {
+                'min': str(lower),
+                'max': str(bounds[index + 1]) if index + 1 < len(bounds) else None,
+                'count': buckets[index],
+            }
+            for index, lower in enumerate(bounds)
+        ],
+        'stock': stock,
+    }
@@ -0,0 +1,260 @@
+"""
+Read-only serializer fast path over ``values()`` rows
+
+For list endpoints that render thousands of rows, most of the time goes
+into building model instances and into DRF's per-row, per-field
+``get_attribute``/``to_representation`` dispatch. ``compile_serializer``
+inspects a (pruned) serializer once and turns each field into a column
+path plus a converter, so a row from ``QuerySet.values()`` can be mapped
+straight to the same dict the serializer would have produced.
+
+Only serializers made of column-backed fields qualify: model fields,
+primary-key relations and nested serializers on forward relations.
+Anything else (properties, method fields, nested collections) makes
+``compile_serializer`` return None and callers use the regular path.
+"""
+import decimal
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from typing import Optional, Tuple
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+# Field classes whose to_representation is a plain type coercion, and the
+# model fields whose values() already have that type
+_COERCIONS = (
+    (serializers.IntegerField.to_representation, int, models.IntegerField),
+    (serializers.CharField.to_representation, str, (models.CharField, models.TextField)),
+    (serializers.FloatField.to_representation, float, models.FloatField),
+    (serializers.BooleanField.to_representation, bool, models.BooleanField),
+)
+
+# Compiled serializers, least recently used first
+_compiled: 'OrderedDict[Tuple, Optional[CompiledSerializer]]' = OrderedDict()
+_compiled_lock = threading.Lock()
+COMPILED_CACHE_SIZE = 256
+
+
+class _DateTimeConverter:
+    """
+    DateTimeField with ISO 8601 output
+
+    DRF looks up the active time zone for every value; here it is looked
+    up once per batch and bound into the converter.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def bind(self, default_timezone):
+        field = self.field
+        field_timezone = field.timezone if hasattr(field, 'timezone') else default_timezone
+        if field_timezone is None:
+            return field.to_representation
+        if getattr(field_timezone, 'key', None) == 'UTC':
+            # What the database backends return, so values need no astimezone()
+            field_timezone = dt_timezone.utc
+
+        def convert(value):
+            if not isinstance(value, datetime) or value.tzinfo is None:
+                return field.to_representation(value)
+            if value.tzinfo is not field_timezone:
+                value = value.astimezone(field_timezone)
+            value = value.isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert
+
+
+class _DecimalConverter:
+    """DecimalField rendered as a string, with the quantizing context built once per batch"""
+
+    def __init__(self, field):
+        self.field = field
+
+    def bind(self, default_timezone):
+        field = self.field
+        context = decimal.getcontext().copy()
+        if field.max_digits is not None:
+            context.prec = field.max_digits
+        exponent = Decimal('.1') ** field.decimal_places
+        rounding = field.rounding
+
+        def convert(value):
+            if not isinstance(value, Decimal):
+                return field.to_representation(value)
+            return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+        return convert
+
+
+def _represent(fields, row: dict) -> dict:
+    columns, converted = fields
+    # Copy every column in output order, then convert the non-null values that need it
+    data = {name: row[column] for name, column in columns}
+    for name, convert, nested in converted:
+        value = data[name]
+        if value is not None:
+            data[name] = _represent(nested, row) if nested is not None else convert(value)
+    return data
+
+
+class CompiledSerializer:
+    """Maps ``values()`` rows to a serializer's representation"""
+
+    def __init__(self, fields, columns):
+        # (output name, column, converter or None, nested CompiledSerializer or None)
+        self.fields = fields
+        # Every column path read, for QuerySet.values()
+        self.columns = columns
+
+    def bind(self, default_timezone=None):
+        """Field tuples with the time zone and decimal context resolved, ready for a batch of rows"""
+        if default_timezone is None and settings.USE_TZ:
+            default_timezone = timezone.get_current_timezone()
+        columns = tuple((name, column) for name, column, _, _ in self.fields)
+        converted = tuple(
+            (
+                name,
+                convert.bind(default_timezone) if hasattr(convert, 'bind') else convert,
+                nested.bind(default_timezone) if nested is not None else None,
+            )
+            for name, column, convert, nested in self.fields
+            if convert is not None or nested is not None
+        )
+        return columns, converted
+
+    def to_representation(self, row: dict) -> dict:
+        return _represent(self.bind(), row)
+
+    def serialize(self, rows) -> list:
+        fields = self.bind()
+        return [_represent(fields, row) for row in rows]
+
+    def values(self, queryset, *extra_fields):
+        """The queryset as dicts holding every column this serializer reads"""
+        return queryset.values(*dict.fromkeys((*self.columns, *extra_fields)))
+
+
+def _converter(field, model_field):
+    method = type(field).to_representation
+    for to_representation, coerce, native in _COERCIONS:
+        if method is to_representation:
+            # Nothing to convert unless a custom field builds its own values
+            if isinstance(model_field, native) and not hasattr(model_field, 'from_db_value'):
+                return None
+            return coerce
+    if (method is serializers.DateTimeField.to_representation and
+            getattr(field, 'format', api_settings.DATETIME_FORMAT).lower() == ISO_8601):
+        return _DateTimeConverter(field)
+    if (method is serializers.DecimalField.to_representation and field.decimal_places is not None and
+            getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING) and not field.localize):
+        return _DecimalConverter(field)
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        # values() already yields the related primary key
+        return None
+    if isinstance(field, serializers.JSONField) and not field.binary:
+        return None
+    if isinstance(field, (serializers.ManyRelatedField, serializers.RelatedField,
+                          serializers.SerializerMethodField, serializers.HiddenField)):
+        raise TypeError(f'{type(field).__name__} has no column')
+    return field.to_representation
+
+
+def _compile(serializer, model, prefix: str = '') -> CompiledSerializer:
+    fields = []
+    columns = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if field.source == '*' or '.' in field.source:
+            raise TypeError(f'{name} is not a model column')
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            raise TypeError(f'{name} is not a model column')
+        if model_field.one_to_many or model_field.many_to_many or not model_field.concrete:
+            raise TypeError(f'{name} is a collection')
+
+        column = prefix + field.source
+        columns.append(column)
+        if isinstance(field, serializers.BaseSerializer):
+            if isinstance(field, serializers.ListSerializer) or not model_field.is_relation:
+                raise TypeError(f'{name} is a collection')
+            nested = _compile(field, model_field.related_model, column + '__')
+            columns.extend(nested.columns)
+            fields.append((name, column, None, nested))
+        else:
+            fields.append((name, column, _converter(field, model_field), None))
+    return CompiledSerializer(tuple(fields), tuple(columns))
+
+
+def _signature(serializer) -> Tuple:
+    return tuple(
+        (name, _signature(field) if isinstance(field, serializers.Serializer) else None)
+        for name, field in serializer.fields.items()
+    )
+
+
+def compile_serializer(serializer) -> Optional[CompiledSerializer]:
+    """
+    Compile a model serializer for ``values()`` rows
+
+    Results are cached per serializer class and pruned field set, so a
+    ``?fields=`` selection compiles once however the client spells it.
+    The ``COMPILED_CACHE_SIZE`` most recently used field sets are kept.
+
+    Args:
+        serializer: Serializer instance (or ``many=True`` list serializer)
+
+    Returns:
+        CompiledSerializer, or None if some field isn't backed by a column
+    """
+    serializer = getattr(serializer, 'child', serializer)
+    key = (type(serializer), _signature(serializer))
+    with _compiled_lock:
+        if key in _compiled:
+            _compiled.move_to_end(key)
+            return _compiled[key]
+    try:
+        compiled = _compile(serializer, serializer.Meta.model)
+    except (AttributeError, TypeError):
+        compiled = None
+    with _compiled_lock:
+        _compiled[key] = compiled
+        if len(_compiled) > COMPILED_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return compiled
+
+
+class FastListMixin:
+    """
+    Serve ``list`` from ``values()`` through the compiled serializer
+
+    The paginator must accept dict rows. The primary key, ordering fields
+    and queryset annotations (e.g. a search rank) are fetched alongside
+    the rendered columns so the paginator can build cursors from them.
+    """
+
+    def list(self, request, *args, **kwargs):
+        compiled = compile_serializer(self.get_serializer())
+        if compiled is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        ordering_fields = getattr(self, 'ordering_fields', None)
+        extra = [
+            *(ordering_fields if isinstance(ordering_fields, (list, tuple)) else ()),
+            *queryset.query.annotations,
+        ]
+        rows = compiled.values(queryset, queryset.model._meta.pk.attname, *extra)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(compiled.serialize(page))
+        return Response(compiled.serialize(rows))
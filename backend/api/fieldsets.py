@@ -0,0 +1,146 @@
+"""
+Sparse fieldsets: ``?fields=id,name,items.product.price``
+
+Root serializers mixing in ``SparseFieldsetMixin`` drop every field the
+client did not ask for (dotted names select nested fields). Views then
+call ``project_queryset`` with the pruned serializer so the database only
+reads the columns that will actually be rendered.
+"""
+from typing import Dict, List, Optional, Tuple
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch, prefetch_related_objects
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+
+FieldTree = Dict[str, 'FieldTree']
+
+
+def parse_fields(value: Optional[str]) -> Optional[FieldTree]:
+    """Turn ``a,b.c,b.d`` into ``{'a': {}, 'b': {'c': {}, 'd': {}}}``"""
+    if not value:
+        return None
+    tree: FieldTree = {}
+    for path in value.split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree or None
+
+
+def _nested_serializer(field):
+    child = getattr(field, 'child', field)
+    return child if isinstance(child, serializers.BaseSerializer) else None
+
+
+def prune_fields(serializer, tree: FieldTree) -> None:
+    """Remove fields not selected by ``tree``; an empty subtree keeps the whole field"""
+    fields = serializer.fields
+    for name in list(fields):
+        if name not in tree:
+            fields.pop(name)
+            continue
+        nested = _nested_serializer(fields[name])
+        if tree[name] and nested is not None:
+            prune_fields(nested, tree[name])
+
+
+class SparseFieldsetMixin:
+    """Apply the request's ``?fields=`` selection to a root serializer on reads"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is not None and request.method in SAFE_METHODS:
+            tree = parse_fields(request.query_params.get(FIELDS_PARAM))
+            if tree:
+                prune_fields(self, tree)
+
+
+def _plan(serializer, model, prefix: str = '') -> Tuple[List[str], List[str], List]:
+    """
+    Work out what a (pruned) serializer reads from ``model``
+
+    Returns:
+        (only paths, select_related paths, prefetch lookups)
+    """
+    only: List[str] = []
+    select: List[str] = []
+    prefetch: List = []
+    meta = getattr(serializer, 'Meta', None)
+    requires = getattr(meta, 'sparse_requires', {})
+
+    def require(paths):
+        for path in paths:
+            only.append(prefix + path)
+            if '__' in path:
+                select.append(prefix + path.rsplit('__', 1)[0])
+
+    # Columns the model itself reads regardless of the selection
+    require(getattr(meta, 'sparse_always', ()))
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        # Computed fields (properties) declare the columns they read
+        require(requires.get(name, ()))
+        if field.source == '*' or '.' in field.source:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+
+        nested = _nested_serializer(field)
+        path = prefix + field.source
+        if model_field.one_to_many or model_field.many_to_many:
+            if nested is None:
+                prefetch.append(path)
+                continue
+            related_model = model_field.related_model
+            sub_only, sub_select, sub_prefetch = _plan(nested, related_model)
+            if model_field.one_to_many:
+                # Prefetching matches rows back to their parent via this FK
+                sub_only.append(model_field.field.name)
+            queryset = related_model._default_manager.select_related(*sub_select)
+            queryset = queryset.only(*sub_only).prefetch_related(*sub_prefetch)
+            prefetch.append(Prefetch(path, queryset=queryset))
+        elif model_field.is_relation:
+            only.append(path)
+            if nested is not None:
+                select.append(path)
+                sub_only, sub_select, sub_prefetch = _plan(nested, model_field.related_model, path + '__')
+                only.extend(sub_only)
+                select.extend(sub_select)
+                prefetch.extend(sub_prefetch)
+        elif model_field.concrete:
+            only.append(path)
+
+    return only, select, prefetch
+
+
+def project_queryset(queryset, serializer, extra_fields=()):
+    """
+    Restrict a queryset to the columns the serializer will render
+
+    Nested forward relations are joined with select_related and nested
+    collections are prefetched with their own projection.
+
+    Args:
+        queryset: Queryset of the serializer's model
+        serializer: Serializer instance, already pruned by ``?fields=``
+        extra_fields: Additional columns the view itself needs (e.g. ordering keys)
+    """
+    serializer = _nested_serializer(serializer) or serializer
+    only, select, prefetch = _plan(serializer, queryset.model)
+    if select:
+        queryset = queryset.select_related(*select)
+    return queryset.only(*only, *extra_fields).prefetch_related(*prefetch)
+
+
+def prefetch_for_instance(instance, serializer) -> None:
+    """Prefetch an already loaded instance's nested collections, with projection"""
+    _, _, prefetch = _plan(serializer, type(instance))
+    if prefetch:
+        prefetch_related_objects([instance], *prefetch)
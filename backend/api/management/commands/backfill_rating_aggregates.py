@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from api.models import Product, Review
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored rating_sum/review_count/avg_rating on products from their reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Products recomputed per transaction (default: 1000)')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = 0
+        total = 0
+        updated = 0
+
+        while True:
+            with transaction.atomic():
+                # Lock the chunk so concurrent review writes queue behind the recompute
+                current = list(
+                    Product.objects.select_for_update()
+                    .filter(pk__gt=last_id)
+                    .order_by('pk')
+                    .values_list('pk', 'rating_sum', 'review_count')[:chunk_size]
+                )
+                if not current:
+                    break
+                ids = [pk for pk, _, _ in current]
+
+                aggregates = {
+                    row['product_id']: row
+                    for row in Review.objects.filter(product_id__in=ids)
+                    .values('product_id')
+                    .annotate(rating_sum=Sum('rating'), review_count=Count('id'))
+                }
+
+                now = timezone.now()
+                products = []
+                for pk, stored_sum, stored_count in current:
+                    row = aggregates.get(pk)
+                    rating_sum = row['rating_sum'] if row else 0
+                    review_count = row['review_count'] if row else 0
+                    if (rating_sum, review_count) == (stored_sum, stored_count):
+                        continue
+                    products.append(Product(
+                        pk=pk,
+                        rating_sum=rating_sum,
+                        review_count=review_count,
+                        avg_rating=rating_sum / review_count if review_count else 0,
+                        updated_at=now
+                    ))
+                Product.objects.bulk_update(
+                    products, ['rating_sum', 'review_count', 'avg_rating', 'updated_at']
+                )
+
+            last_id = ids[-1]
+            total += len(ids)
+            updated += len(products)
+            self.stdout.write(f"Checked {total} products, updated {updated}")
+
+        self.stdout.write(self.style.SUCCESS(f"Rating aggregates backfilled: {updated} of {total} products updated"))
@@ -0,0 +1,121 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from api.models import Cart, CartItem, OrderItem, Product
+from api.services.cart_checkout import CartCheckoutService, InsufficientStockError
+
+BENCH_SOURCE_PREFIX = 'https://bench.invalid/checkout/'
+BENCH_EMAIL_DOMAIN = 'checkout.bench.invalid'
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Benchmark concurrent cart checkouts competing for a few low-stock products '
+            'and verify nothing is oversold (use Postgres; SQLite serializes writers)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200,
+                            help='Number of shoppers, each checking out one cart (default: 200)')
+        parser.add_argument('--items', type=int, default=20,
+                            help='Lines per cart (default: 20)')
+        parser.add_argument('--products', type=int, default=50,
+                            help='Number of products the carts draw from (default: 50)')
+        parser.add_argument('--stock', type=int, default=60,
+                            help='Initial stock per product (default: 60)')
+        parser.add_argument('--threads', type=int, default=16,
+                            help='Concurrent checkouts (default: 16)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the synthetic users, orders and products after the run')
+
+    def handle(self, *args, **options):
+        users, products = self.seed(options)
+        initial = dict(Product.objects.filter(pk__in=products).values_list('pk', 'stock'))
+        service = CartCheckoutService()
+
+        def checkout(user):
+            try:
+                service.checkout(user, {'city': 'Benchmark'})
+                return 'placed'
+            except InsufficientStockError:
+                return 'short'
+            finally:
+                close_old_connections()
+
+        self.stdout.write(f"Database backend: {connection.vendor}")
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                outcomes = Counter(pool.map(checkout, users))
+            elapsed = time.perf_counter() - started
+
+            self.stdout.write(
+                f"{len(users)} checkouts of {options['items']} lines on {options['threads']} threads "
+                f"in {elapsed:.2f}s ({len(users) / elapsed:.0f}/s): "
+                f"{outcomes['placed']} placed, {outcomes['short']} out of stock"
+            )
+            self.verify(initial)
+        finally:
+            if not options['keep']:
+                self.cleanup()
+
+    def seed(self, options):
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'Checkout Product {i}',
+                description='Synthetic product for the checkout benchmark',
+                price=Decimal(100 + i) / 100,
+                stock=options['stock'],
+                image_url='https://dummyimage.com/300x300',
+                source_url=f'{BENCH_SOURCE_PREFIX}{i}',
+                source_key=f'{BENCH_SOURCE_PREFIX[len("https://"):]}{i}',
+            )
+            for i in range(options['products'])
+        ])
+        product_ids = list(Product.objects.filter(
+            source_url__startswith=BENCH_SOURCE_PREFIX
+        ).values_list('pk', flat=True))
+
+        users = User.objects.bulk_create([
+            User(email=f'shopper{i}@{BENCH_EMAIL_DOMAIN}', username=f'checkout-shopper{i}', name='Shopper')
+            for i in range(options['users'])
+        ])
+        users = list(User.objects.filter(email__endswith=f'@{BENCH_EMAIL_DOMAIN}'))
+        Cart.objects.bulk_create([Cart(user=user) for user in users])
+        carts = Cart.objects.filter(user__in=users).values_list('pk', flat=True)
+        lines = min(options['items'], len(product_ids))
+        CartItem.objects.bulk_create([
+            CartItem(cart_id=cart_id, product_id=product_ids[(n + i) % len(product_ids)], quantity=1 + i % 3)
+            for n, cart_id in enumerate(carts)
+            for i in range(lines)
+        ], batch_size=1000)
+        self.stdout.write(f"Seeded {len(products)} products and {len(users)} carts")
+        return users, product_ids
+
+    def verify(self, initial):
+        sold = Counter()
+        for product_id, quantity in OrderItem.objects.filter(product_id__in=initial).values_list(
+                'product_id', 'quantity'):
+            sold[product_id] += quantity
+        final = dict(Product.objects.filter(pk__in=initial).values_list('pk', 'stock'))
+        for pk, stock in initial.items():
+            if final[pk] < 0 or stock - final[pk] != sold[pk]:
+                raise CommandError(
+                    f"Product {pk}: started with {stock}, sold {sold[pk]}, {final[pk]} left"
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f"No overselling: {sum(sold.values())} units sold, stock matches every order"
+        ))
+
+    def cleanup(self):
+        self.stdout.write("\nRemoving synthetic users, orders and products...")
+        User.objects.filter(email__endswith=f'@{BENCH_EMAIL_DOMAIN}').delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {Product._meta.db_table} WHERE source_url LIKE %s',
+                [f'{BENCH_SOURCE_PREFIX}%']
+            )
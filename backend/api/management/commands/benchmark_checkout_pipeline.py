@@ -0,0 +1,92 @@
+import asyncio
+import multiprocessing
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from api.benchmarks.mock_revolut import serve
+from api.services.aio import run_coroutine
+from api.services.checkout_service import CheckoutService
+from api.services.revolut_service import RevolutService
+
+ITEMS = [
+    {'id': '1', 'name': 'Product 1', 'price': '25.00', 'quantity': 2},
+    {'id': '2', 'name': 'Product 2', 'price': '15.00', 'quantity': 1}
+]
+ADDRESS = {'street': '123 Test St', 'city': 'Test City', 'country': 'US'}
+
+
+class Command(BaseCommand):
+    help = ('Load test checkout against a local mock provider: process_checkout on a thread pool '
+            'vs aprocess_checkout on the shared event loop')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkouts', type=int, default=500,
+                            help='Checkouts per pipeline (default: 500)')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Checkouts in flight at once (default: 50)')
+        parser.add_argument('--latency-ms', type=float, default=100.0,
+                            help='Mock provider latency per request (default: 100ms)')
+
+    def handle(self, *args, **options):
+        checkouts, concurrency = options['checkouts'], options['concurrency']
+        latency = options['latency_ms'] / 1000
+        self.stdout.write(f"{checkouts} checkouts, {concurrency} in flight, {options['latency_ms']:.0f} ms provider latency\n")
+
+        # The mock runs in its own process so its handler threads don't share our GIL
+        ready = multiprocessing.Queue()
+        server = multiprocessing.Process(target=serve, args=(latency, ready), daemon=True)
+        server.start()
+        try:
+            base_url = ready.get(timeout=10)
+            service = CheckoutService()
+            service.payment_service = RevolutService(api_key='test-api-key', base_url=base_url)
+
+            def sync_checkout(n):
+                started = time.perf_counter()
+                result = service.process_checkout(ITEMS, ADDRESS, f'card-{n}')
+                return result['status'], time.perf_counter() - started
+
+            def sync_pipeline():
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    return list(pool.map(sync_checkout, range(checkouts)))
+
+            async def async_pipeline():
+                slots = asyncio.Semaphore(concurrency)
+
+                async def checkout(n):
+                    async with slots:
+                        started = time.perf_counter()
+                        result = await service.aprocess_checkout(ITEMS, ADDRESS, f'card-{n}')
+                        return result['status'], time.perf_counter() - started
+
+                return await asyncio.gather(*(checkout(n) for n in range(checkouts)))
+
+            sync_time = self.run_pipeline('process_checkout', base_url, sync_pipeline)
+            async_time = self.run_pipeline('aprocess_checkout', base_url, lambda: run_coroutine(async_pipeline()))
+            run_coroutine(service.payment_service.aclose())
+        finally:
+            server.terminate()
+
+        self.stdout.write(f"\n{'speedup':<20} {sync_time / async_time:>8.1f}x")
+
+    def run_pipeline(self, label, base_url, pipeline):
+        before = requests.get(f'{base_url}/stats').json()
+        started = time.perf_counter()
+        results = pipeline()
+        elapsed = time.perf_counter() - started
+        # Less the connection this stats request opens
+        connections = requests.get(f'{base_url}/stats').json()['connections'] - before['connections'] - 1
+
+        failed = sum(status != 'success' for status, _ in results)
+        if failed:
+            raise CommandError(f'{label}: {failed} checkouts failed')
+        latencies = sorted(seconds for _, seconds in results)
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        self.stdout.write(
+            f"{label:<20} {len(results) / elapsed:>8.0f} checkouts/s  "
+            f"p50 {statistics.median(latencies) * 1000:>6.1f} ms  p95 {p95 * 1000:>6.1f} ms  "
+            f"{connections:>5} connections"
+        )
+        return elapsed
@@ -0,0 +1,67 @@
+import random
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connection
+from api.models import Product
+from api.services.ingest import ProductIngestService
+from api import search
+
+BENCH_SOURCE_PREFIX = 'https://bench.invalid/ingest/'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the bulk product upsert: initial load, unchanged re-scrape and price update'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000,
+                            help='Number of synthetic scraped products (default: 100,000)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Products per upsert batch (default: 1,000)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the synthetic products after the run')
+
+    def handle(self, *args, **options):
+        count = options['products']
+        service = ProductIngestService(batch_size=options['batch_size'])
+        rng = random.Random(42)
+        items = [
+            {
+                'name': f'Ingest Product {i}',
+                'description': f'Synthetic scraped product {i}',
+                'price': Decimal(rng.randint(1000, 300000)) / 100,
+                'stock': 1,
+                'image_url': 'https://dummyimage.com/300x300',
+                # Tracking parameters must not create duplicates
+                'source_url': f'{BENCH_SOURCE_PREFIX}{i}?utm_source=bench',
+            }
+            for i in range(count)
+        ]
+
+        self.stdout.write(f"Database backend: {connection.vendor}")
+        try:
+            self.run_pass('initial load', service, items)
+            self.run_pass('re-scrape (no changes)', service, items)
+            for item in items[::10]:
+                item['price'] += 1
+            self.run_pass('re-scrape (10% repriced)', service, items)
+        finally:
+            if not options['keep']:
+                self.cleanup()
+
+    def run_pass(self, label, service, items):
+        started = time.perf_counter()
+        result = service.ingest(items)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{label:<26} {elapsed:>7.2f}s  {len(items) / elapsed:>9.0f} products/s  ({result})"
+        )
+
+    def cleanup(self):
+        self.stdout.write("\nRemoving synthetic products...")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {Product._meta.db_table} WHERE source_url LIKE %s',
+                [f'{BENCH_SOURCE_PREFIX}%']
+            )
+        search.index_products()
@@ -0,0 +1,64 @@
+import random
+import time
+from decimal import Decimal
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from api.services.order_calculator import order_calculator
+
+FIELDS = ('subtotal', 'fulfillment_commission', 'shipping_fee', 'total')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark re-quoting many carts: calculate_order_totals per cart vs the vectorized batch API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carts', type=int, default=100_000,
+                            help='Number of synthetic carts (default: 100,000)')
+        parser.add_argument('--products', type=int, default=200,
+                            help='Catalog size the carts draw from (default: 200)')
+        parser.add_argument('--max-items', type=int, default=8,
+                            help='Most lines in one cart (default: 8)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prices = [f"{rng.randint(99, 99_999) / 100:.2f}" for _ in range(options['products'])]
+        quantities = np.zeros((options['carts'], options['products']), dtype=np.int64)
+        carts = []
+        for row in quantities:
+            items = []
+            for product in rng.sample(range(options['products']), rng.randint(1, options['max_items'])):
+                row[product] = rng.randint(1, 3)
+                items.append({'id': product, 'price': prices[product], 'quantity': int(row[product])})
+            carts.append(items)
+        self.stdout.write(f"{len(carts)} carts over {len(prices)} products\n")
+
+        def scalar():
+            return [
+                order_calculator.calculate_order_totals(
+                    sum((Decimal(item['price']) * item['quantity'] for item in items), Decimal('0')), items
+                )
+                for items in carts
+            ]
+
+        scalar_time, expected = self.run_path('calculate_order_totals', scalar)
+        carts_time, by_cart = self.run_path('quote_carts', lambda: order_calculator.quote_carts(carts))
+        matrix_time, by_matrix = self.run_path('quote_matrix', lambda: order_calculator.quote_matrix(prices, quantities))
+
+        for field in FIELDS:
+            if by_cart[field].tolist() != by_matrix[field].tolist():
+                raise CommandError(f'quote_carts and quote_matrix disagree on {field}')
+            minor = [int(totals[field] * 100) for totals in expected]
+            if minor != by_cart[field].tolist():
+                raise CommandError(f'Batch {field} differs from calculate_order_totals')
+        self.stdout.write(f"\n{'speedup (carts)':<24} {scalar_time / carts_time:>8.1f}x")
+        self.stdout.write(f"{'speedup (matrix)':<24} {scalar_time / matrix_time:>8.1f}x")
+        self.stdout.write(self.style.SUCCESS('Batch results identical to calculate_order_totals'))
+
+    def run_path(self, label, quote):
+        started = time.perf_counter()
+        result = quote()
+        elapsed = time.perf_counter() - started
+        carts = len(result) if isinstance(result, list) else len(result['total'])
+        self.stdout.write(f"{label:<24} {elapsed * 1000:>8.1f} ms  {carts / elapsed:>10.0f} carts/s")
+        return elapsed, result
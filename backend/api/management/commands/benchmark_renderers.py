@@ -0,0 +1,63 @@
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from api.models import Product
+from api.renderers import MessagePackRenderer, ORJSONRenderer
+from api.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark render time and payload size of ProductSerializer(many=True) per renderer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10_000,
+                            help='Number of products to render (default: 10,000)')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Renders per renderer; the best run is reported (default: 5)')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        # Unsaved instances: this measures rendering, not the database
+        products = [
+            Product(
+                pk=i,
+                name=f'Render Product {i}',
+                description=f'Synthetic product {i} for the renderer benchmark',
+                price=Decimal(1000 + i % 300000) / 100,
+                stock=i % 50,
+                image_url='https://dummyimage.com/300x300',
+                source_url=f'https://bench.invalid/render/{i}',
+                avg_rating=(i % 50) / 10,
+                review_count=i % 17,
+                views_count=i,
+                created_at=now,
+                updated_at=now,
+            )
+            for i in range(1, options['products'] + 1)
+        ]
+
+        started = time.perf_counter()
+        data = ProductSerializer(products, many=True).data
+        self.stdout.write(f"Serialized {len(products)} products in {time.perf_counter() - started:.3f}s\n")
+
+        renderers = (
+            ('DRF JSONRenderer', JSONRenderer()),
+            ('ORJSONRenderer', ORJSONRenderer()),
+            ('MessagePackRenderer', MessagePackRenderer()),
+        )
+        baseline = None
+        for label, renderer in renderers:
+            best = None
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                payload = renderer.render(data)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            baseline = baseline or best
+            self.stdout.write(
+                f"{label:<20} {best * 1000:>8.1f} ms  {len(payload) / 1024:>9.1f} KiB  "
+                f"{baseline / best:>5.1f}x"
+            )
+        self.stdout.write(self.style.SUCCESS('Done'))
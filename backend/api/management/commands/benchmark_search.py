@@ -0,0 +1,109 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from api.models import Product
+from api import search
+
+BENCH_SOURCE_PREFIX = 'https://bench.invalid/product/'
+
+BRANDS = ['Apple', 'Samsung', 'Google', 'Dell', 'Lenovo', 'Sony', 'Asus', 'Acer', 'HP', 'Microsoft']
+KINDS = ['Laptop', 'Phone', 'Tablet', 'Monitor', 'Headphones', 'Keyboard', 'Mouse', 'Console', 'Camera', 'Watch']
+ADJECTIVES = ['Pro', 'Ultra', 'Max', 'Mini', 'Plus', 'Lite', 'Gaming', 'Wireless', 'Refurbished', 'Slim']
+FEATURES = [
+    'OLED display', 'USB-C charging', 'noise cancellation', 'fast SSD storage', 'long battery life',
+    'water resistant', 'Bluetooth 5.3', 'mechanical switches', '4K HDR video', 'aluminium chassis',
+]
+
+DEFAULT_QUERIES = ['wireless', 'gaming laptop', 'oled', 'samsung phone', 'refurb', 'sony watch 4242']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ?search= latency on a synthetic catalog: icontains scan vs full-text index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1_000_000,
+                            help='Number of synthetic products to generate (default: 1,000,000)')
+        parser.add_argument('--batch-size', type=int, default=10_000,
+                            help='bulk_create batch size (default: 10,000)')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Timed runs per query (default: 5)')
+        parser.add_argument('--query', action='append', dest='queries',
+                            help='Search text to benchmark (repeatable)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the synthetic products after the run')
+
+    def handle(self, *args, **options):
+        queries = options['queries'] or DEFAULT_QUERIES
+
+        self.stdout.write(f"Database backend: {connection.vendor}")
+        self.seed(options['products'], options['batch_size'])
+
+        self.stdout.write(f"\n{'query':<20} {'icontains p50 (ms)':>20} {'fts p50 (ms)':>14} {'speedup':>9}")
+        try:
+            for text in queries:
+                before = self.time_query(lambda: self.icontains_page(text), options['repeat'])
+                after = self.time_query(lambda: self.fts_page(text), options['repeat'])
+                speedup = before / after if after else float('inf')
+                self.stdout.write(f"{text:<20} {before:>20.2f} {after:>14.2f} {speedup:>8.1f}x")
+        finally:
+            if not options['keep']:
+                self.cleanup()
+
+    def seed(self, count: int, batch_size: int):
+        rng = random.Random(42)
+        self.stdout.write(f"Generating {count} synthetic products...")
+        started = time.perf_counter()
+        for offset in range(0, count, batch_size):
+            batch = []
+            for i in range(offset, min(offset + batch_size, count)):
+                brand, kind, adjective = rng.choice(BRANDS), rng.choice(KINDS), rng.choice(ADJECTIVES)
+                batch.append(Product(
+                    name=f'{brand} {kind} {adjective} {i}',
+                    description=f'{brand} {kind} with {rng.choice(FEATURES)} and {rng.choice(FEATURES)}.',
+                    price=Decimal(rng.randint(1000, 300000)) / 100,
+                    stock=rng.randint(0, 50),
+                    image_url='https://dummyimage.com/300x300',
+                    source_url=f'{BENCH_SOURCE_PREFIX}{i}',
+                ))
+            Product.objects.bulk_create(batch)
+        # bulk_create skips signals, so build the index in one pass
+        search.index_products()
+        self.stdout.write(f"Seeded and indexed in {time.perf_counter() - started:.1f}s")
+
+    # Each run fetches the first page of 20 plus the total match count,
+    # which is what a paginated ?search= request costs.
+
+    @staticmethod
+    def icontains_page(text: str):
+        queryset = Product.objects.all()
+        for term in text.split():
+            queryset = queryset.filter(Q(name__icontains=term) | Q(description__icontains=term))
+        return queryset.count(), list(queryset.order_by('-pk')[:20])
+
+    @staticmethod
+    def fts_page(text: str):
+        queryset = search.search_products(Product.objects.all(), text)
+        return queryset.count(), list(queryset.order_by('-search_rank', '-pk')[:20])
+
+    @staticmethod
+    def time_query(run, repeat: int) -> float:
+        run()  # warm caches
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def cleanup(self):
+        self.stdout.write("\nRemoving synthetic products...")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {Product._meta.db_table} WHERE source_url LIKE %s',
+                [f'{BENCH_SOURCE_PREFIX}%']
+            )
+        search.index_products()
@@ -0,0 +1,79 @@
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from api.fast_serializers import compile_serializer
+from api.models import Product
+from api.serializers import ProductSerializer
+
+BENCH_SOURCE_PREFIX = 'https://bench.invalid/serializers/'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the product list: ProductSerializer over instances vs the compiled values() path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10_000,
+                            help='Number of synthetic products (default: 10,000)')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Runs per path; the best run is reported (default: 5)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the synthetic products after the run')
+
+    def handle(self, *args, **options):
+        count = options['products']
+        Product.objects.bulk_create([
+            Product(
+                name=f'Serializer Product {i}',
+                description=f'Synthetic product {i} for the serializer benchmark',
+                price=Decimal(1000 + i % 300000) / 100,
+                stock=i % 50,
+                image_url='https://dummyimage.com/300x300',
+                source_url=f'{BENCH_SOURCE_PREFIX}{i}',
+                source_key=f'bench.invalid/serializers/{i}',
+            )
+            for i in range(count)
+        ], batch_size=1000)
+        queryset = Product.objects.filter(source_url__startswith=BENCH_SOURCE_PREFIX).order_by('pk')
+
+        self.stdout.write(f"Database backend: {connection.vendor}\n")
+        try:
+            compiled = compile_serializer(ProductSerializer())
+            self.stdout.write('Fetch and serialize:')
+            regular = self.run_path('ProductSerializer', lambda: ProductSerializer(queryset.all(), many=True).data,
+                                    options['repeat'])
+            fast = self.run_path('compiled values()', lambda: compiled.serialize(compiled.values(queryset)),
+                                 options['repeat'])
+            if regular[1] != fast[1]:
+                raise CommandError('Compiled output differs from ProductSerializer')
+            self.stdout.write(f"{'speedup':<20} {regular[0] / fast[0]:>8.1f}x\n")
+
+            self.stdout.write('Serialize only (rows already fetched):')
+            instances = list(queryset)
+            rows = list(compiled.values(queryset))
+            regular = self.run_path('ProductSerializer', lambda: ProductSerializer(instances, many=True).data,
+                                    options['repeat'])
+            fast = self.run_path('compiled values()', lambda: compiled.serialize(rows), options['repeat'])
+            self.stdout.write(f"{'speedup':<20} {regular[0] / fast[0]:>8.1f}x")
+            self.stdout.write(self.style.SUCCESS('Outputs identical'))
+        finally:
+            if not options['keep']:
+                self.cleanup()
+
+    def run_path(self, label, serialize, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = serialize()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        self.stdout.write(f"{label:<20} {best * 1000:>8.1f} ms  {len(data) / best:>9.0f} products/s")
+        return best, data
+
+    def cleanup(self):
+        self.stdout.write("\nRemoving synthetic products...")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {Product._meta.db_table} WHERE source_url LIKE %s',
+                [f'{BENCH_SOURCE_PREFIX}%']
+            )
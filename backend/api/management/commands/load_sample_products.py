@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from api.models import Product, Category
+from api.services.ingest import product_ingest_service
 
 SAMPLE_CATEGORIES = [
     {
@@ -135,6 +136,8 @@ SAMPLE_PRODUCTS = [
     }
 ]
 
+FLASH_SALE_PRODUCTS = ('PlayStation 5', 'Xbox Series X')
+
 class Command(BaseCommand):
     help = 'Load sample product data into the database.'
 
@@ -150,9 +153,14 @@ class Command(BaseCommand):
             categories[cat_data['name']] = category
         
         # Create products
-        for prod in SAMPLE_PRODUCTS:
-            category_name = prod.pop('category_name')
-            category = categories[category_name]
-            Product.objects.create(category=category, **prod)
+        result = product_ingest_service.ingest(
+            {
+                **{key: value for key, value in prod.items() if key != 'category_name'},
+                'category': categories[prod['category_name']],
+            }
+            for prod in SAMPLE_PRODUCTS
+        )
+        # Low-stock launches are sold through time-limited reservations
+        Product.objects.filter(name__in=FLASH_SALE_PRODUCTS).update(reserve_stock=True)
             
-        self.stdout.write(self.style.SUCCESS(f'Loaded {len(SAMPLE_CATEGORIES)} categories and {len(SAMPLE_PRODUCTS)} sample products.')) 
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f'Loaded {len(SAMPLE_CATEGORIES)} categories and {result.created} sample products.'))
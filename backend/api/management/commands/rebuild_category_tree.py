@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.caching import bump_namespace
+from api.category_tree import CATEGORY_TREE_NAMESPACE, rebuild_tree
+from api.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = 'Recompute category paths and product counts, e.g. after bulk product imports'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # Block concurrent category moves while the tree is rewritten
+            list(Category.objects.select_for_update().values_list('pk', flat=True))
+            rebuilt = rebuild_tree(Category, Product)
+        bump_namespace('category', CATEGORY_TREE_NAMESPACE)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} categories"))
@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from api.models import Product
+from api.services.ingest import product_ingest_service
 from scrapers import NeweggScraper, BackMarketScraper
 import logging
 
@@ -28,7 +28,7 @@ class Command(BaseCommand):
         if site == 'all' or site == 'backmarket':
             scrapers.append(('Back Market', BackMarketScraper()))
 
-        total_products = 0
+        scraped = []
         for site_name, scraper in scrapers:
             try:
                 self.stdout.write(f"\nScraping {site_name}...")
@@ -44,24 +44,14 @@ class Command(BaseCommand):
                         if not details:
                             continue
 
-                        # Create or update product in database
-                        product, created = Product.objects.update_or_create(
-                            source_url=details['source_url'],
-                            defaults={
-                                'name': details['name'],
-                                'description': details.get('description', ''),
-                                'price': details['price'],
-                                'image_url': details['image_url'],
-                                'stock': 1  # Default stock value
-                            }
-                        )
-
-                        if created:
-                            self.stdout.write(self.style.SUCCESS(f"Created product: {product.name}"))
-                        else:
-                            self.stdout.write(f"Updated product: {product.name}")
-                        
-                        total_products += 1
+                        scraped.append({
+                            'name': details['name'],
+                            'description': details.get('description', ''),
+                            'price': details['price'],
+                            'image_url': details['image_url'],
+                            'source_url': details['source_url'],
+                            'stock': 1  # Default stock value
+                        })
 
                     except Exception as e:
                         logger.error(f"Error processing product {product_data.get('name', 'Unknown')}: {str(e)}")
@@ -72,4 +62,10 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.ERROR(f"Error scraping {site_name}: {str(e)}"))
                 continue
 
-        self.stdout.write(self.style.SUCCESS(f"\nSuccessfully processed {total_products} products")) 
\ No newline at end of file
+        # Upsert everything in batches keyed on the normalized source URL
+        result = product_ingest_service.ingest(
+            scraped,
+            on_batch=lambda batch: self.stdout.write(f"Batch: {batch}")
+        )
+
+        self.stdout.write(self.style.SUCCESS(f"\nSuccessfully processed {result.total} products ({result})"))
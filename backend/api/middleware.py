@@ -1,9 +1,12 @@
+import json
 import time
 from typing import Callable
 from django.http import JsonResponse, HttpRequest
 from django.core.cache import cache
 from django.conf import settings
 from functools import wraps
+from rest_framework.response import Response
+from .services.idempotency import IDEMPOTENCY_HEADER, REPLAYED_HEADER, idempotency_service, request_fingerprint
 
 class RateLimitExceeded(Exception):
     """Raised when rate limit is exceeded"""
@@ -86,4 +89,61 @@ def handle_api_errors(view_func: Callable) -> Callable:
                 'error': 'Internal server error',
                 'error_type': 'server_error'
             }, status=500)
-    return wrapped_view 
\ No newline at end of file
+    return wrapped_view
+
+def idempotent(scope: str) -> Callable:
+    """
+    Idempotency-Key decorator for JSON function views
+
+    A retry carrying the same key and body gets the first response back
+    (with ``Idempotent-Replayed: true``) instead of running the view
+    again. Requests without the header are unaffected.
+
+    Args:
+        scope: Endpoint name; keys are also scoped to the user
+    """
+    def decorator(view_func: Callable) -> Callable:
+        @wraps(view_func)
+        def wrapped_view(request: HttpRequest, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if key is None:
+                return view_func(request, *args, **kwargs)
+
+            def handler():
+                response = view_func(request, *args, **kwargs)
+                return response.status_code, json.loads(response.content)
+
+            fingerprint = request_fingerprint(request.method, request.path, request.body.decode('utf-8', 'replace'))
+            status_code, data, replayed = idempotency_service.run(
+                f"{scope}:user_{request.user.id}", key, fingerprint, handler
+            )
+            response = JsonResponse(data, status=status_code, safe=False)
+            if replayed:
+                response[REPLAYED_HEADER] = 'true'
+            return response
+        return wrapped_view
+    return decorator
+
+def idempotent_action(scope: str) -> Callable:
+    """Idempotency-Key decorator for DRF viewset actions (see ``idempotent``)"""
+    def decorator(action_func: Callable) -> Callable:
+        @wraps(action_func)
+        def wrapped_action(self, request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if key is None:
+                return action_func(self, request, *args, **kwargs)
+
+            def handler():
+                response = action_func(self, request, *args, **kwargs)
+                return response.status_code, response.data
+
+            data = request.data
+            body = sorted(data.lists()) if hasattr(data, 'lists') else data
+            status_code, data, replayed = idempotency_service.run(
+                f"{scope}:user_{request.user.id}", key, request_fingerprint(request.method, request.path, body),
+                handler
+            )
+            return Response(data, status=status_code, headers={REPLAYED_HEADER: 'true'} if replayed else None)
+        return wrapped_action
+    return decorator
+
@@ -0,0 +1,65 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+SEARCH_INDEX_NAME = 'product_search_vector_gin'
+FTS_TABLE = 'api_product_fts'
+
+
+def create_search_backend(apps, schema_editor):
+    """Create the GIN index on Postgres, or the FTS5 table elsewhere, and populate it"""
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX {SEARCH_INDEX_NAME} ON api_product USING gin (search_vector)'
+        )
+        schema_editor.execute(
+            "UPDATE api_product SET search_vector = "
+            "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+        )
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+            f'USING fts5(name, description, tokenize="porter unicode61")'
+        )
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE}(rowid, name, description) '
+            f'SELECT id, name, description FROM api_product'
+        )
+
+
+def drop_search_backend(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {SEARCH_INDEX_NAME}')
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_product_views_count_category_product_category_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # GIN only exists on Postgres; SQLite gets an FTS5 table instead
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='product',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name=SEARCH_INDEX_NAME),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_search_backend, drop_search_backend),
+            ],
+        ),
+    ]
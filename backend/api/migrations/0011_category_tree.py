@@ -0,0 +1,85 @@
+from collections import Counter
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def build_tree(apps, schema_editor):
+    """Frozen copy of api.category_tree.rebuild_tree as of this migration"""
+    Category = apps.get_model('api', 'Category')
+    Product = apps.get_model('api', 'Product')
+    parents = dict(Category.objects.values_list('pk', 'parent_id'))
+    direct = dict(
+        Product.objects.filter(category__isnull=False)
+        .order_by()
+        .values('category_id')
+        .annotate(count=Count('pk'))
+        .values_list('category_id', 'count')
+    )
+
+    paths = {}
+    for pk in parents:
+        chain = []
+        node = pk
+        while node is not None and node not in paths:
+            if node in chain:
+                raise ValueError(f"Category {node} is its own ancestor")
+            chain.append(node)
+            node = parents.get(node)
+        path = paths.get(node, '/')
+        for node in reversed(chain):
+            path = f'{path}{node}/'
+            paths[node] = path
+
+    def ancestor_ids(path):
+        return [int(part) for part in path.strip('/').split('/') if part]
+
+    subtree = Counter()
+    for pk, count in direct.items():
+        for ancestor in ancestor_ids(paths.get(pk, '')):
+            subtree[ancestor] += count
+
+    Category.objects.bulk_update(
+        [
+            Category(
+                pk=pk,
+                path=path,
+                depth=max(len(ancestor_ids(path)) - 1, 0),
+                product_count=direct.get(pk, 0),
+                subtree_product_count=subtree[pk]
+            )
+            for pk, path in paths.items()
+        ],
+        ['path', 'depth', 'product_count', 'subtree_product_count'],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_category_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='subtree_product_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(build_tree, migrations.RunPython.noop),
+    ]
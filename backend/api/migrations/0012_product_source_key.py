@@ -0,0 +1,54 @@
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from django.db import migrations, models
+
+# Frozen copy of api.models.normalize_source_url as of this migration, so
+# later changes to the live function don't change what the backfill does
+TRACKING_PARAMS = {'gclid', 'fbclid', 'mc_cid', 'mc_eid', 'ref'}
+
+
+def normalize_source_url(url):
+    parts = urlsplit((url or '').strip())
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f'{host}:{parts.port}'
+    query = urlencode(sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.startswith('utm_') and name not in TRACKING_PARAMS
+    ))
+    key = f"{host}{parts.path.rstrip('/') or '/'}"
+    return f'{key}?{query}' if query else key
+
+
+def backfill_source_keys(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+    seen = set()
+    batch = []
+    # The oldest product keeps a key shared by duplicate rows; the others stay NULL
+    for pk, source_url in Product.objects.order_by('pk').values_list('pk', 'source_url').iterator(chunk_size=2000):
+        key = normalize_source_url(source_url)
+        if key in seen or len(key) > 255:
+            continue
+        seen.add(key)
+        batch.append(Product(pk=pk, source_key=key))
+        if len(batch) >= 1000:
+            Product.objects.bulk_update(batch, ['source_key'])
+            batch = []
+    Product.objects.bulk_update(batch, ['source_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_category_tree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='source_key',
+            field=models.CharField(editable=False, max_length=255, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_source_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-16 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_product_source_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='stock_pending',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reserve_stock',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(condition=models.Q(('stock_pending', True)), fields=['product'], name='orderitem_stock_pending_idx'),
+        ),
+    ]
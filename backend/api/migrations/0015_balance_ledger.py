@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-16 19:14
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_order_user_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3, unique=True)),
+                ('reconciled_balance', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('held', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=20)),
+                ('reconciled_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BalanceEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('status', models.CharField(choices=[('reserved', 'Reserved'), ('debited', 'Debited'), ('released', 'Released'), ('settled', 'Settled')], default='reserved', max_length=10)),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('ledger', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='api.balanceledger')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ledger', 'status', 'updated_at'], name='balanceentry_open_idx')],
+            },
+        ),
+    ]
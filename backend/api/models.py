@@ -1,7 +1,39 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Case, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Concat, NullIf, Substr
+from django.utils import timezone
 from decimal import Decimal
+from urllib.parse import parse_qsl, urlencode, urlsplit
 from django.core.validators import MinValueValidator, MaxValueValidator
+from . import category_tree
+
+# Query parameters that vary between links to the same product page
+TRACKING_PARAMS = {'gclid', 'fbclid', 'mc_cid', 'mc_eid', 'ref'}
+
+
+def normalize_source_url(url: str) -> str:
+    """
+    Canonical key for a scraped product URL
+
+    Scheme, ``www.``, host case, default ports, trailing slashes, fragments,
+    tracking parameters and query parameter order don't distinguish products.
+    """
+    parts = urlsplit((url or '').strip())
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f'{host}:{parts.port}'
+    query = urlencode(sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.startswith('utm_') and name not in TRACKING_PARAMS
+    ))
+    key = f"{host}{parts.path.rstrip('/') or '/'}"
+    return f'{key}?{query}' if query else key
 
 class FXTransaction(models.Model):
     """Model for storing foreign exchange transaction logs"""
@@ -26,12 +58,59 @@ class FXTransaction(models.Model):
     
     def __str__(self):
         return f"FX Transaction {self.transaction_id} - {self.source_amount} {self.source_currency} → {self.target_amount} {self.target_currency}"
+
     
     @property
     def total_cost(self) -> Decimal:
         """Calculate total cost including fee"""
         return self.target_amount + self.fee 
 
+class BalanceLedger(models.Model):
+    """
+    Local view of a provider account balance (api.services.balance_ledger)
+
+    ``held`` is the total of reservations and of debits the provider
+    balance didn't include yet when it was last reconciled.
+    """
+
+    currency = models.CharField(max_length=3, unique=True)
+    reconciled_balance = models.DecimalField(max_digits=20, decimal_places=2)
+    held = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0.00'))
+    reconciled_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def available(self):
+        return self.reconciled_balance - self.held
+
+    def __str__(self):
+        return f"{self.currency} ledger - {self.available} available"
+
+class BalanceEntry(models.Model):
+    """A reservation against a BalanceLedger, and what became of it"""
+
+    STATUS_CHOICES = [
+        ('reserved', 'Reserved'),  # Operation in flight
+        ('debited', 'Debited'),  # Operation succeeded; awaiting reconciliation
+        ('released', 'Released'),  # Operation failed or was abandoned
+        ('settled', 'Settled'),  # Included in a reconciled provider balance
+    ]
+
+    ledger = models.ForeignKey(BalanceLedger, on_delete=models.CASCADE, related_name='entries')
+    amount = models.DecimalField(max_digits=20, decimal_places=2)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='reserved')
+    reference = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ledger', 'status', 'updated_at'], name='balanceentry_open_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.amount} {self.ledger.currency} {self.status} ({self.reference})"
+
 class User(AbstractUser):
     email = models.EmailField(unique=True)
     name = models.CharField(max_length=255)
@@ -49,7 +128,14 @@ class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='children')
+    # Materialized path (see api.category_tree), maintained by save()
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Products filed directly under this category / anywhere in its subtree
+    product_count = models.IntegerField(default=0, editable=False)
+    subtree_product_count = models.IntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name_plural = "Categories"
@@ -57,27 +143,152 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    # Kept up to date with F() updates and _move_subtree, never from an instance
+    MAINTAINED_FIELDS = ('path', 'depth', 'product_count', 'subtree_product_count')
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'parent' not in update_fields:
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            parent_path = category_tree.ROOT_PATH
+            if self.parent_id is not None:
+                parent_path = Category.objects.values_list('path', flat=True).get(pk=self.parent_id)
+            old = None
+            if not self._state.adding:
+                old = Category.objects.filter(pk=self.pk).values_list(
+                    'path', 'product_count', 'subtree_product_count'
+                ).first()
+            if old and old[0] and parent_path.startswith(old[0]):
+                raise ValidationError('A category cannot be moved under itself or its descendants')
+
+            if old is not None:
+                # A stale instance mustn't write back the tree and counter columns
+                if update_fields is None:
+                    kwargs['update_fields'] = [
+                        field.name for field in self._meta.concrete_fields
+                        if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+                    ]
+                self.product_count, self.subtree_product_count = old[1], old[2]
+            super().save(*args, **kwargs)
+
+            path = category_tree.child_path(parent_path, self.pk)
+            if old is None or not old[0]:
+                Category.objects.filter(pk=self.pk).update(path=path, depth=category_tree.path_depth(path))
+            elif path != old[0]:
+                self._move_subtree(old[0], path, old[2])
+            self.path, self.depth = path, category_tree.path_depth(path)
+
+    def _move_subtree(self, old_path: str, new_path: str, moved_count: int) -> None:
+        """Rewrite the paths under a moved category and shift its products between ancestors"""
+        Category.objects.filter(path__startswith=old_path).update(
+            path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+            depth=F('depth') + (category_tree.path_depth(new_path) - category_tree.path_depth(old_path))
+        )
+        if moved_count:
+            now = timezone.now()
+            Category.objects.filter(pk__in=category_tree.ancestor_ids(old_path)[:-1]).update(
+                subtree_product_count=F('subtree_product_count') - moved_count, updated_at=now
+            )
+            Category.objects.filter(pk__in=category_tree.ancestor_ids(new_path)[:-1]).update(
+                subtree_product_count=F('subtree_product_count') + moved_count, updated_at=now
+            )
+
+    @classmethod
+    def adjust_product_count(cls, category_id, delta: int) -> None:
+        """
+        Atomically count products into (or out of) a category and its ancestors
+
+        Args:
+            category_id: Category the products were filed under
+            delta: Change to the number of products
+        """
+        if category_id is None or not delta:
+            return
+        path = cls.objects.filter(pk=category_id).values_list('path', flat=True).first()
+        if not path:
+            return
+        cls.objects.filter(pk__in=category_tree.ancestor_ids(path)).update(
+            subtree_product_count=F('subtree_product_count') + delta,
+            product_count=Case(
+                When(pk=category_id, then=F('product_count') + delta),
+                default=F('product_count')
+            ),
+            updated_at=timezone.now()
+        )
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.IntegerField(default=0)
+    # Flash-sale product: carting places a time-limited stock hold
+    # (api.services.stock_reservations) and checkout confirms it
+    reserve_stock = models.BooleanField(default=False)
     image_url = models.URLField()
     source_url = models.URLField()
+    # normalize_source_url(source_url), the upsert key for scraped products
+    source_key = models.CharField(max_length=255, unique=True, null=True, editable=False)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='products')
     views_count = models.IntegerField(default=0)
+    # Review aggregates, maintained by Product.apply_review_delta
+    rating_sum = models.IntegerField(default=0)
+    review_count = models.IntegerField(default=0)
+    avg_rating = models.FloatField(default=0, db_index=True)
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+            # Keyset pagination (api.pagination.ProductCursorPagination)
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+        ]
+
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'source_url' in update_fields:
+            self.source_key = normalize_source_url(self.source_url)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'source_key'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'category_id' in instance.__dict__:
+            # Lets a later save tell whether the product changed category
+            instance._loaded_category_id = instance.category_id
+        return instance
     
     @property
     def average_rating(self):
-        reviews = self.reviews.all()
-        if not reviews:
-            return 0
-        return sum(review.rating for review in reviews) / len(reviews)
+        return self.avg_rating
+
+    @classmethod
+    def apply_review_delta(cls, product_id, rating_delta: int, count_delta: int) -> None:
+        """
+        Atomically adjust the stored review aggregates for a product
+
+        Args:
+            product_id: Product to update
+            rating_delta: Change to the sum of ratings
+            count_delta: Change to the number of reviews
+        """
+        new_sum = F('rating_sum') + rating_delta
+        new_count = F('review_count') + count_delta
+        cls.objects.filter(pk=product_id).update(
+            rating_sum=new_sum,
+            review_count=new_count,
+            avg_rating=Coalesce(Cast(new_sum, FloatField()) / NullIf(new_count, 0), 0.0),
+            updated_at=timezone.now()
+        )
 
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -86,7 +297,12 @@ class Cart(models.Model):
     
     @property
     def total(self):
-        return sum(item.subtotal for item in self.items.all())
+        prefetched = getattr(self, '_prefetched_objects_cache', {})
+        if 'items' in prefetched:
+            return sum(item.subtotal for item in prefetched['items'])
+        # Sum in the database rather than loading every item and its product
+        total = self.items.aggregate(total=Sum(F('quantity') * F('product__price')))['total']
+        return total or Decimal('0.00')
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
@@ -113,6 +329,12 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Order history keyset pagination (api.pagination.OrderCursorPagination)
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_id_idx'),
+        ]
+    
     def __str__(self):
         return f"Order {self.id} - {self.user.email}"
 
@@ -121,6 +343,13 @@ class OrderItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)  # Price at time of order
+    # Sold from a stock reservation; taken off Product.stock at the next reconciliation
+    stock_pending = models.BooleanField(default=False)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['product'], condition=Q(stock_pending=True), name='orderitem_stock_pending_idx'),
+        ]
     
     @property
     def subtotal(self):
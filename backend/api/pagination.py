@@ -0,0 +1,166 @@
+import base64
+import json
+from collections import OrderedDict
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on ``(ordering field, id)``
+
+    Each page is fetched with ``WHERE (field, id) < (last_field, last_id)``
+    against a composite index, so deep pages cost the same as page one.
+    Unlike DRF's CursorPagination there is no offset fallback for rows that
+    tie on the ordering field (common for prices).
+    """
+    cursor_query_param = 'cursor'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-created_at'
+    ordering_fields = ('created_at', 'price')
+    tie_breaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(request, queryset, view)
+
+        cursor = self.decode_cursor(request, queryset)
+        self.reverse = bool(cursor and cursor['r'])
+
+        # Walking backwards flips both the comparison and the sort order
+        descending = self.descending != self.reverse
+        if cursor is not None:
+            queryset = queryset.filter(self._after(cursor, descending))
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.field}', f'{prefix}{self.tie_breaker}')
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, request, queryset, view):
+        """Resolve the keyset field from ``?ordering=``, falling back to relevance or the default"""
+        allowed = set(getattr(view, 'ordering_fields', None) or self.ordering_fields)
+        param = OrderingFilter.ordering_param
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                param = backend.ordering_param
+
+        requested = request.query_params.get(param, '')
+        for term in requested.split(','):
+            term = term.strip()
+            if term.lstrip('-') in allowed:
+                return term.lstrip('-'), term.startswith('-')
+
+        # Full-text matches are ordered by relevance unless asked otherwise
+        if 'search_rank' in queryset.query.annotations:
+            return 'search_rank', True
+        return self.ordering.lstrip('-'), self.ordering.startswith('-')
+
+    def _after(self, cursor, descending):
+        op = 'lt' if descending else 'gt'
+        return (
+            Q(**{f'{self.field}__{op}': cursor['v']}) |
+            Q(**{self.field: cursor['v'], f'{self.tie_breaker}__{op}': cursor['id']})
+        )
+
+    def get_cursor_field(self, queryset):
+        """Model field (or annotation output field) the keyset is ordered on"""
+        annotation = queryset.query.annotations.get(self.field)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(self.field)
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            if cursor['f'] != self.field:
+                raise ValueError('Cursor was issued for a different ordering')
+            # Parsed here so a tampered value is a bad cursor rather than a database error
+            value = self.get_cursor_field(queryset).to_python(cursor['v'])
+            return {'v': value, 'id': int(cursor['id']), 'r': bool(cursor.get('r'))}
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, item, reverse):
+        # Rows are model instances, or dicts on the values() fast path
+        get = item.get if isinstance(item, dict) else lambda name: getattr(item, name)
+        value = get(self.field)
+        cursor = {
+            'f': self.field,
+            'v': value if isinstance(value, (int, float)) or value is None else str(value),
+            'id': get(self.tie_breaker),
+            'r': reverse,
+        }
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('ascii'))
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response_data(self, data):
+        return OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_response_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ProductCursorPagination(KeysetPagination):
+    """Catalog pages keyed on (created_at, id), (price, id) or search relevance"""
+    ordering = '-created_at'
+    ordering_fields = ('created_at', 'price')
+
+
+class OrderCursorPagination(KeysetPagination):
+    """Order history pages keyed on (created_at, id) within one user's orders"""
+    ordering = '-created_at'
+    ordering_fields = ('created_at',)
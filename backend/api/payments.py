@@ -8,6 +8,12 @@ class FlutterwavePaymentError(APIException):
     default_detail = 'Payment processing failed'
     default_code = 'payment_error'
 
+class FlutterwaveUnavailableError(FlutterwavePaymentError):
+    """Flutterwave couldn't be reached or failed; safe to retry"""
+    status_code = 502
+    default_detail = 'Payment provider unavailable'
+    default_code = 'payment_unavailable'
+
 class FlutterwavePayment:
     def __init__(self):
         self.public_key = settings.FLUTTERWAVE_PUBLIC_KEY
@@ -42,8 +48,11 @@ class FlutterwavePayment:
             )
             response.raise_for_status()
             return response.json()
+        except requests.exceptions.HTTPError as e:
+            error = FlutterwaveUnavailableError if e.response.status_code >= 500 else FlutterwavePaymentError
+            raise error(f'Failed to initialize payment: {str(e)}')
         except requests.exceptions.RequestException as e:
-            raise FlutterwavePaymentError(f'Failed to initialize payment: {str(e)}')
+            raise FlutterwaveUnavailableError(f'Failed to initialize payment: {str(e)}')
     
     def verify_payment(self, transaction_id):
         """Verify a payment transaction"""
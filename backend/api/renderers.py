@@ -0,0 +1,87 @@
+"""
+orjson / MessagePack renderers and parsers
+
+Clients pick a format with the Accept header (``application/json`` or
+``application/msgpack``). Values the encoders don't handle natively go
+through ``encode_default``, which mirrors DRF's JSONEncoder except that
+raw ``Decimal`` values follow ``COERCE_DECIMAL_TO_STRING`` like
+serializer DecimalFields do, so a price or total is the same string in
+every format.
+"""
+from decimal import Decimal
+import msgpack
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+_drf_encoder = JSONEncoder()
+
+
+def encode_default(obj):
+    """Fallback encoder shared by every format"""
+    if isinstance(obj, Decimal):
+        return str(obj) if api_settings.COERCE_DECIMAL_TO_STRING else float(obj)
+    # datetimes (with the 'Z' suffix), UUIDs, lazy strings, querysets, ...
+    return _drf_encoder.default(obj)
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+    # Datetimes are passed to encode_default so they match DRF's format
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        options = self.options
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=encode_default, option=options)
+
+    def get_indent(self, accepted_media_type, renderer_context):
+        if accepted_media_type:
+            params = dict(
+                param.strip().split('=', 1)
+                for param in accepted_media_type.split(';')[1:]
+                if '=' in param
+            )
+            if 'indent' in params:
+                return True
+        return bool(renderer_context.get('indent'))
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True, datetime=False)
+
+
+class ORJSONParser(BaseParser):
+    media_type = 'application/json'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {str(exc)}')
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, strict_map_key=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError(f'MessagePack parse error - {str(exc)}')
@@ -4,8 +4,10 @@ from decimal import Decimal
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-from ..services.vcc_service import vcc_service, VCCServiceError, CardNotFoundError, InsufficientBalanceError
-from ..middleware import require_auth, rate_limit, handle_api_errors
+from ..services.vcc_service import (
+    vcc_service, VCCServiceError, CardNotFoundError, InsufficientBalanceError, ProviderUnavailableError
+)
+from ..middleware import require_auth, rate_limit, handle_api_errors, idempotent
 
 # Rate limit settings
 CARD_CREATE_LIMIT = 10  # 10 cards per hour
@@ -15,6 +17,7 @@ CARD_DETAIL_LIMIT = 30  # 30 requests per minute
 @csrf_exempt
 @require_http_methods(['POST'])
 @require_auth
+@idempotent('card_create')  # replays don't count towards the rate limit
 @rate_limit('card_create', CARD_CREATE_LIMIT, 3600)  # 1 hour
 @handle_api_errors
 def create_card(request):
@@ -49,6 +52,13 @@ def create_card(request):
             'error': str(e),
             'error_type': 'insufficient_balance'
         }, status=400)
+    except ProviderUnavailableError as e:
+        # 502 so an idempotent retry creates the card again
+        return JsonResponse({
+            'status': 'failed',
+            'error': str(e),
+            'error_type': 'provider_unavailable'
+        }, status=502)
     except VCCServiceError as e:
         return JsonResponse({
             'status': 'failed',
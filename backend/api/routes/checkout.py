@@ -1,9 +1,46 @@
-from flask import Blueprint, request, jsonify
-from ..services.checkout_service import checkout_service, CheckoutError, PaymentError
+from functools import wraps
+from flask import Blueprint, request, jsonify, make_response
+from ..services.aio import run_coroutine
+from ..services.checkout_service import (
+    checkout_service, CheckoutError, PaymentError, PaymentUnavailableError, QuoteExpiredError
+)
+from ..services.idempotency import IDEMPOTENCY_HEADER, REPLAYED_HEADER, idempotency_service, request_fingerprint
 from ..services.privacy_service import PrivacyServiceError, InvalidAPIVersionError, CardNotFoundError
 
 checkout_bp = Blueprint('checkout', __name__)
 
+def client_id():
+    """The caller, for scoping idempotency keys: this app has no user accounts, so the client IP"""
+    forwarded_for = request.headers.get('X-Forwarded-For')
+    if forwarded_for:
+        return forwarded_for.split(',')[0].strip()
+    return request.remote_addr or 'unknown'
+
+def idempotent(scope):
+    """Replay the first response to a retried request carrying the same Idempotency-Key and body"""
+    def decorator(route):
+        @wraps(route)
+        def wrapped_route(*args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if key is None:
+                return route(*args, **kwargs)
+
+            def handler():
+                response = make_response(route(*args, **kwargs))
+                return response.status_code, response.get_json()
+
+            fingerprint = request_fingerprint(request.method, request.path, request.get_data(as_text=True))
+            status_code, data, replayed = idempotency_service.run(
+                f"{scope}:{client_id()}", key, fingerprint, handler
+            )
+            response = jsonify(data)
+            response.status_code = status_code
+            if replayed:
+                response.headers[REPLAYED_HEADER] = 'true'
+            return response
+        return wrapped_route
+    return decorator
+
 @checkout_bp.route('/api/checkout/summary', methods=['POST'])
 def get_order_summary():
     try:
@@ -14,7 +51,7 @@ def get_order_summary():
         if not items:
             return jsonify({'error': 'No items provided'}), 400
 
-        summary = checkout_service.get_order_summary(
+        summary = checkout_service.quote(
             items=items,
             shipping_address=shipping_address
         )
@@ -26,26 +63,45 @@ def get_order_summary():
         return jsonify({'error': 'Internal server error'}), 500
 
 @checkout_bp.route('/api/checkout/process', methods=['POST'])
+@idempotent('checkout_process')
 def process_checkout():
     try:
         data = request.get_json()
         items = data.get('items', [])
         shipping_address = data.get('shipping_address')
         payment_card_id = data.get('payment_card_id')
+        quote_id = data.get('quote_id')
 
-        if not all([items, shipping_address, payment_card_id]):
-            return jsonify({'error': 'Missing required fields'}), 400
+        if quote_id:
+            # A quoted cart is charged exactly as quoted
+            if not payment_card_id:
+                return jsonify({'error': 'Missing required fields'}), 400
+            result = run_coroutine(checkout_service.aprocess_quote(
+                quote_id=quote_id,
+                payment_card_id=payment_card_id
+            ))
+        else:
+            if not all([items, shipping_address, payment_card_id]):
+                return jsonify({'error': 'Missing required fields'}), 400
 
-        result = checkout_service.process_checkout(
-            items=items,
-            shipping_address=shipping_address,
-            payment_card_id=payment_card_id
-        )
+            # Runs on the shared background loop so provider connections are reused across requests
+            result = run_coroutine(checkout_service.aprocess_checkout(
+                items=items,
+                shipping_address=shipping_address,
+                payment_card_id=payment_card_id
+            ))
 
         if result['status'] == 'failed':
             return jsonify(result), 400
 
         return jsonify(result)
+    except PaymentUnavailableError as e:
+        # 502 so an idempotent retry runs the checkout again
+        return jsonify({
+            'status': 'failed',
+            'error': str(e),
+            'error_type': 'payment_unavailable'
+        }), 502
     except PaymentError as e:
         return jsonify({
             'status': 'failed',
@@ -64,6 +120,12 @@ def process_checkout():
             'error': str(e),
             'error_type': 'card_not_found'
         }), 404
+    except QuoteExpiredError as e:
+        return jsonify({
+            'status': 'failed',
+            'error': str(e),
+            'error_type': 'quote_expired'
+        }), 409
     except CheckoutError as e:
         return jsonify({
             'status': 'failed',
@@ -0,0 +1,149 @@
+"""
+Full-text search over the product catalog.
+
+On Postgres every product carries a weighted ``tsvector`` in
+``Product.search_vector`` backed by a GIN index. SQLite (dev and tests) keeps
+an FTS5 table instead. Both are refreshed from the product signals in
+``api.signals`` and, for bulk writes that bypass signals, through
+``index_products``.
+"""
+import re
+from typing import Iterable, List, Optional
+
+from django.db import connection
+from django.db.models import F, FloatField, QuerySet
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+from rest_framework import filters
+
+from .models import Product
+
+FTS_TABLE = 'api_product_fts'
+SEARCH_CONFIG = 'english'
+INDEXED_FIELDS = ('name', 'description')
+
+# SQLite caps the number of bound parameters per statement
+_ID_CHUNK_SIZE = 500
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _is_postgres() -> bool:
+    return connection.vendor == 'postgresql'
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _chunks(ids: List[int]):
+    for start in range(0, len(ids), _ID_CHUNK_SIZE):
+        yield ids[start:start + _ID_CHUNK_SIZE]
+
+
+def _search_vector():
+    from django.contrib.postgres.search import SearchVector
+
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG) +
+        SearchVector('description', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+def index_products(ids: Optional[Iterable[int]] = None) -> None:
+    """
+    Refresh the search index for the given products
+
+    Args:
+        ids: Product primary keys to reindex, or None to rebuild everything
+    """
+    if _is_postgres():
+        queryset = Product.objects.all()
+        if ids is not None:
+            queryset = queryset.filter(pk__in=list(ids))
+        queryset.update(search_vector=_search_vector())
+        return
+
+    table = Product._meta.db_table
+    with connection.cursor() as cursor:
+        if ids is None:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE}(rowid, name, description) '
+                f'SELECT id, name, description FROM {table}'
+            )
+            return
+
+        for chunk in _chunks(list(ids)):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE}(rowid, name, description) '
+                f'SELECT id, name, description FROM {table} WHERE id IN ({placeholders})',
+                chunk
+            )
+
+
+def remove_products(ids: Iterable[int]) -> None:
+    """Drop deleted products from the SQLite index (Postgres rows carry their own vector)"""
+    if _is_postgres():
+        return
+
+    with connection.cursor() as cursor:
+        for chunk in _chunks(list(ids)):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
+
+
+def search_products(queryset: QuerySet, text: str) -> QuerySet:
+    """
+    Filter a product queryset down to full-text matches
+
+    Every term must match, with prefix matching so partially typed words
+    still hit. Matches are annotated with ``search_rank`` (higher is better).
+
+    Args:
+        queryset: Product queryset to filter
+        text: Raw search text from the client
+
+    Returns:
+        Filtered queryset annotated with ``search_rank``
+    """
+    tokens = _tokens(text)
+    if not tokens:
+        return queryset
+
+    if _is_postgres():
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        query = SearchQuery(
+            ' & '.join(f'{token}:*' for token in tokens),
+            config=SEARCH_CONFIG,
+            search_type='raw'
+        )
+        # Cast to double so rank values round-trip exactly through pagination cursors
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=Cast(SearchRank(F('search_vector'), query), FloatField())
+        )
+
+    match = ' '.join(f'"{token}"*' for token in tokens)
+    table = Product._meta.db_table
+    # Join against the FTS table so bm25() statistics are computed once per
+    # query rather than once per product row. bm25() is lower-is-better;
+    # negate it so both backends rank descending.
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE} MATCH %s', f'{FTS_TABLE}.rowid = {table}.id'],
+        params=[match]
+    ).annotate(
+        search_rank=RawSQL(f'-bm25({FTS_TABLE}, 10.0, 1.0)', (), output_field=FloatField())
+    )
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """``?search=`` backed by the full-text index, ordered by relevance"""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return search_products(queryset, ' '.join(terms)).order_by('-search_rank', '-pk')
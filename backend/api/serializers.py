@@ -1,9 +1,11 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from .fieldsets import SparseFieldsetMixin
 from .models import (
     Product, Cart, CartItem, Order, OrderItem,
-    Category, Review, Wishlist, UserActivity
+    Category, Review, Wishlist, UserActivity,
+    normalize_source_url
 )
 
 User = get_user_model()
@@ -41,10 +43,19 @@ class UserPreferencesSerializer(serializers.ModelSerializer):
         model = User
         fields = ('preferences',)
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ('search_vector', 'source_key')
+        read_only_fields = ('rating_sum', 'review_count', 'avg_rating')
+
+    def validate_source_url(self, value):
+        duplicates = Product.objects.filter(source_key=normalize_source_url(value))
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError('A product with this source URL already exists')
+        return value
 
 class CartItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
@@ -54,8 +65,11 @@ class CartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
         fields = ('id', 'product', 'product_id', 'quantity', 'subtotal')
+        # Cart.total sums subtotals over the prefetched items, so their
+        # inputs are loaded whatever ?fields= selects
+        sparse_always = ('quantity', 'product', 'product__price')
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
 
@@ -70,8 +84,9 @@ class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = ('id', 'product', 'quantity', 'price', 'subtotal')
+        sparse_requires = {'subtotal': ('quantity', 'price')}
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     user = UserSerializer(read_only=True)
 
@@ -81,11 +96,26 @@ class OrderSerializer(serializers.ModelSerializer):
                  'items', 'created_at', 'updated_at')
         read_only_fields = ('id', 'user', 'total_amount', 'created_at', 'updated_at')
 
+class OrderSummarySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """Order history row; ``item_count`` and ``thumbnail`` are annotated by OrderViewSet"""
+    item_count = serializers.IntegerField(read_only=True)
+    thumbnail = serializers.URLField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = Order
+        fields = ('id', 'status', 'total_amount', 'item_count', 'thumbnail', 'created_at')
+        read_only_fields = fields
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
 
+    def validate_parent(self, parent):
+        if parent is not None and self.instance is not None and parent.path.startswith(self.instance.path):
+            raise serializers.ValidationError('A category cannot be moved under itself or its descendants')
+        return parent
+
 class ReviewSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     
@@ -100,9 +130,10 @@ class ProductDetailSerializer(ProductSerializer):
     average_rating = serializers.FloatField(read_only=True)
     
     class Meta(ProductSerializer.Meta):
-        fields = list(ProductSerializer.Meta.fields) + ['category', 'reviews', 'average_rating', 'views_count']
+        # Declared fields (category, reviews, average_rating) are added on top of the excluded model fields
+        sparse_requires = {'average_rating': ('avg_rating',)}
 
-class WishlistSerializer(serializers.ModelSerializer):
+class WishlistSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     products = ProductSerializer(many=True, read_only=True)
     
     class Meta:
@@ -0,0 +1,31 @@
+import asyncio
+import threading
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar('T')
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """
+    The process-wide event loop that synchronous code (Flask, Celery,
+    WSGI Django) runs coroutines on
+
+    One long-lived loop means async HTTP clients bound to it keep their
+    connection pools between requests, which ``asyncio.run`` per call
+    would throw away.
+    """
+    global _loop
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='background-loop', daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+def run_coroutine(coroutine: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """Run a coroutine on the background loop from synchronous code and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coroutine, background_loop()).result(timeout)
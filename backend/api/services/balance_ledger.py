@@ -0,0 +1,152 @@
+from datetime import timedelta
+from decimal import Decimal
+from typing import Callable, Optional
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from ..models import BalanceEntry, BalanceLedger
+
+
+class BalanceLedgerError(Exception):
+    """Base exception for balance ledger errors"""
+    pass
+
+
+class InsufficientFundsError(BalanceLedgerError):
+    """Raised when a reservation is larger than the available balance"""
+
+    def __init__(self, amount: Decimal, available: Decimal):
+        super().__init__(f"Required: {amount}, Available: {available}")
+        self.amount = amount
+        self.available = available
+
+
+class LedgerNotReconciledError(BalanceLedgerError):
+    """Raised when the ledger has never been reconciled against the provider"""
+    pass
+
+
+class BalanceLedgerService:
+    """
+    Provider balance tracked locally so spending doesn't need a balance call
+
+    The ledger keeps the balance last read from the provider and ``held``,
+    the sum of open reservations and unreconciled debits. A reservation
+    is one conditional UPDATE that only matches while the available
+    balance (reconciled minus held) covers it, so concurrent operations
+    can't overspend between two provider calls.
+
+    ``reconcile`` replaces the reconciled balance with a fresh provider
+    read, settles the debits that read already reflects and releases
+    reservations abandoned for longer than ``RESERVATION_TIMEOUT``.
+    """
+
+    RESERVATION_TIMEOUT = 15 * 60  # seconds before an unfinished reservation is released
+
+    def __init__(self, currency: str):
+        self.currency = currency
+
+    def available(self) -> Decimal:
+        """
+        Balance left for new reservations
+
+        Raises:
+            LedgerNotReconciledError: If the ledger was never reconciled
+        """
+        try:
+            return BalanceLedger.objects.get(currency=self.currency).available
+        except BalanceLedger.DoesNotExist:
+            raise LedgerNotReconciledError(f"No reconciled {self.currency} balance yet")
+
+    def reserve(self, amount: Decimal, reference: str = '') -> BalanceEntry:
+        """
+        Hold part of the available balance for an operation
+
+        Args:
+            amount: Amount to hold
+            reference: What the hold is for (card, conversion)
+
+        Returns:
+            BalanceEntry: The reservation, to ``debit`` or ``release`` later
+
+        Raises:
+            InsufficientFundsError: If the available balance doesn't cover it
+            LedgerNotReconciledError: If the ledger was never reconciled
+        """
+        amount = Decimal(amount)
+        with transaction.atomic():
+            held = BalanceLedger.objects.filter(
+                currency=self.currency,
+                reconciled_balance__gte=F('held') + amount
+            ).update(held=F('held') + amount, updated_at=timezone.now())
+            if not held:
+                raise InsufficientFundsError(amount, self.available())
+            ledger = BalanceLedger.objects.only('id').get(currency=self.currency)
+            return BalanceEntry.objects.create(ledger=ledger, amount=amount, reference=reference)
+
+    def debit(self, entry: BalanceEntry, reference: Optional[str] = None) -> None:
+        """The reserved operation went through: keep the amount held until reconciliation"""
+        if reference is not None:
+            entry.reference = reference
+        entry.status = 'debited'
+        BalanceEntry.objects.filter(pk=entry.pk, status='reserved').update(
+            status='debited', reference=entry.reference, updated_at=timezone.now()
+        )
+
+    def release(self, entry: BalanceEntry) -> None:
+        """The reserved operation failed: return the amount to the available balance"""
+        with transaction.atomic():
+            released = BalanceEntry.objects.filter(pk=entry.pk, status='reserved').update(
+                status='released', updated_at=timezone.now()
+            )
+            if released:
+                BalanceLedger.objects.filter(pk=entry.ledger_id).update(
+                    held=F('held') - entry.amount, updated_at=timezone.now()
+                )
+        entry.status = 'released'
+
+    def reconcile(self, fetch_balance: Callable[[], Decimal]) -> BalanceLedger:
+        """
+        Reset the ledger to the provider's balance
+
+        Debits recorded before the provider balance was read are assumed
+        to be included in it and are settled; later ones stay held.
+
+        Args:
+            fetch_balance: Reads the current provider balance
+
+        Returns:
+            BalanceLedger: The reconciled ledger
+        """
+        read_at = timezone.now()
+        balance = Decimal(fetch_balance())
+        abandoned_before = read_at - timedelta(seconds=self.RESERVATION_TIMEOUT)
+
+        with transaction.atomic():
+            ledger, _ = BalanceLedger.objects.select_for_update().get_or_create(
+                currency=self.currency,
+                defaults={'reconciled_balance': balance, 'reconciled_at': read_at}
+            )
+            entries = BalanceEntry.objects.filter(ledger=ledger)
+            freed = (
+                self._close(entries.filter(status='debited', updated_at__lte=read_at), 'settled', read_at) +
+                self._close(entries.filter(status='reserved', created_at__lte=abandoned_before), 'released', read_at)
+            )
+
+            ledger.reconciled_balance = balance
+            ledger.held = F('held') - freed
+            ledger.reconciled_at = read_at
+            ledger.save(update_fields=['reconciled_balance', 'held', 'reconciled_at', 'updated_at'])
+            ledger.refresh_from_db()
+        return ledger
+
+    def _close(self, entries, status: str, at) -> Decimal:
+        """Move entries to a final status, returning their total"""
+        # Locked so a concurrent debit or release can't change them in between
+        rows = list(entries.select_for_update().values_list('pk', 'amount'))
+        BalanceEntry.objects.filter(pk__in=[pk for pk, _ in rows]).update(status=status, updated_at=at)
+        return sum((amount for _, amount in rows), Decimal('0'))
+
+
+# Create a singleton instance
+usd_ledger = BalanceLedgerService('USD')
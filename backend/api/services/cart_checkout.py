@@ -0,0 +1,180 @@
+from decimal import Decimal
+from typing import Dict, List
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from ..caching import bump_namespace
+from ..models import Cart, CartItem, Order, OrderItem, Product
+from .stock_reservations import stock_reservations
+
+
+class CartCheckoutError(Exception):
+    """Base exception for cart checkout errors"""
+    pass
+
+
+class EmptyCartError(CartCheckoutError):
+    """Raised when there is nothing in the cart to order"""
+    pass
+
+
+class InsufficientStockError(CartCheckoutError):
+    """Raised when some products don't have enough stock left"""
+
+    def __init__(self, product_ids: List[int]):
+        super().__init__(f"Not enough stock for products {product_ids}")
+        self.product_ids = product_ids
+
+
+class OrderNotCancellableError(CartCheckoutError):
+    """Raised when an order is past the point where it can be cancelled"""
+    pass
+
+
+class CartCheckoutService:
+    """
+    Turn a user's persisted cart into an order in one transaction
+
+    The query count doesn't depend on the cart size: the items are read
+    and re-priced in one query, stock is taken with one conditional
+    UPDATE, order items are bulk inserted and the cart is emptied with
+    one DELETE. The stock UPDATE only matches rows that still have
+    enough stock, so concurrent checkouts can't oversell: the losers
+    roll back before anything else is written.
+
+    Products sold through stock reservations skip the UPDATE: the
+    user's holds are confirmed instead and the order items are marked
+    ``stock_pending`` for the next reconciliation.
+    """
+
+    def checkout(self, user, shipping_address: Dict) -> Order:
+        """
+        Place an order for everything in the user's cart
+
+        Args:
+            user: Cart owner
+            shipping_address: Shipping address stored on the order
+
+        Returns:
+            Order: The new order
+
+        Raises:
+            EmptyCartError: If the cart has no items
+            InsufficientStockError: If any product is short; nothing is written
+        """
+        with transaction.atomic():
+            # Serializes concurrent checkouts of the same cart
+            cart = Cart.objects.select_for_update().filter(user=user).first()
+            if cart is None:
+                raise EmptyCartError("Cart is empty")
+
+            quantities: Dict[int, int] = {}
+            reserved: Dict[int, int] = {}
+            prices: Dict[int, Decimal] = {}
+            for product_id, quantity, price, reserve_stock in (
+                CartItem.objects.filter(cart=cart).order_by('pk')
+                .values_list('product_id', 'quantity', 'product__price', 'product__reserve_stock')
+            ):
+                lines = reserved if reserve_stock else quantities
+                lines[product_id] = lines.get(product_id, 0) + quantity
+                prices[product_id] = price
+            if not quantities and not reserved:
+                raise EmptyCartError("Cart is empty")
+
+            if reserved:
+                short = stock_reservations.confirm(user.pk, reserved)
+                if short:
+                    raise InsufficientStockError(short)
+            if quantities:
+                self._take_stock(quantities)
+
+            order = Order.objects.create(
+                user=user,
+                total_amount=sum(
+                    prices[pk] * quantity for lines in (quantities, reserved) for pk, quantity in lines.items()
+                ),
+                shipping_address=shipping_address
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=pk, quantity=quantity, price=prices[pk],
+                          stock_pending=lines is reserved)
+                for lines in (quantities, reserved)
+                for pk, quantity in lines.items()
+            ])
+            CartItem.objects.filter(cart=cart).delete()
+            if quantities:
+                transaction.on_commit(lambda: bump_namespace('product'))
+            if reserved:
+                # The pending items are committed before the holds go
+                transaction.on_commit(lambda: stock_reservations.release(user.pk, list(reserved)))
+        return order
+
+    def cancel(self, order: Order) -> Order:
+        """
+        Cancel a pending order and put its stock back
+
+        Items still waiting for reconciliation just stop being pending;
+        the rest are added back to product stock in one UPDATE.
+
+        Args:
+            order: Order to cancel
+
+        Returns:
+            Order: The cancelled order
+
+        Raises:
+            OrderNotCancellableError: If the order isn't pending
+        """
+        with transaction.atomic():
+            order = Order.objects.select_for_update().get(pk=order.pk)
+            if order.status != 'pending':
+                raise OrderNotCancellableError("Only pending orders can be cancelled")
+
+            restock: Dict[int, int] = {}
+            for product_id, quantity, stock_pending in (
+                OrderItem.objects.select_for_update().filter(order=order)
+                .values_list('product_id', 'quantity', 'stock_pending')
+            ):
+                if not stock_pending:
+                    restock[product_id] = restock.get(product_id, 0) + quantity
+            OrderItem.objects.filter(order=order, stock_pending=True).update(stock_pending=False)
+            if restock:
+                quantity = Case(
+                    *[When(pk=pk, then=Value(qty)) for pk, qty in restock.items()],
+                    output_field=IntegerField()
+                )
+                Product.objects.filter(pk__in=list(restock)).update(
+                    stock=F('stock') + quantity, updated_at=timezone.now()
+                )
+                transaction.on_commit(lambda: bump_namespace('product'))
+
+            order.status = 'cancelled'
+            order.save()
+        return order
+
+    def _take_stock(self, quantities: Dict[int, int]) -> None:
+        """Decrement stock for every product, or raise without changing any"""
+        quantity = Case(
+            *[When(pk=pk, then=Value(qty)) for pk, qty in quantities.items()],
+            output_field=IntegerField()
+        )
+        try:
+            # A savepoint, so the rows that did match are put back before
+            # the shortfall is looked up
+            with transaction.atomic():
+                updated = (
+                    Product.objects
+                    .filter(pk__in=list(quantities), stock__gte=quantity)
+                    .update(stock=F('stock') - quantity, updated_at=timezone.now())
+                )
+                if updated != len(quantities):
+                    raise InsufficientStockError([])
+        except InsufficientStockError:
+            stock = dict(Product.objects.filter(pk__in=list(quantities)).values_list('pk', 'stock'))
+            raise InsufficientStockError(sorted(
+                pk for pk, qty in quantities.items() if stock.get(pk, 0) < qty
+            ))
+
+
+# Create a singleton instance
+cart_checkout_service = CartCheckoutService()
@@ -0,0 +1,471 @@
+import atexit
+import logging
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from ..models import Cart, CartItem, Product
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+@dataclass
+class CartSnapshot:
+    """A user's live cart: the Cart row it persists to and product id -> quantity"""
+    cart_id: int
+    created_at: datetime
+    updated_at: datetime
+    items: Dict[int, int] = field(default_factory=dict)
+
+
+class CartStore(ABC):
+    """
+    Cache-resident carts with write-behind persistence
+
+    The live cart is kept in memory or Redis, so adding or removing an
+    item is one store operation instead of several queries. Changed carts
+    are marked dirty and periodically written to the Cart/CartItem tables
+    as one diff per batch; checkout persists its cart synchronously, so
+    orders are always built from the database, and then settles the
+    ordered quantities out of the resident cart. A cart that isn't
+    resident is loaded from the database on first use.
+    """
+
+    def __init__(self, batch_size: int = 500):
+        self.batch_size = batch_size
+
+    def get(self, user_id: int) -> CartSnapshot:
+        """The user's cart, loaded from the database if it isn't resident"""
+        return self._resident(user_id, lambda: self._read(user_id))
+
+    def add(self, user_id: int, product_id: int, quantity: int) -> CartSnapshot:
+        """Add ``quantity`` of a product to the cart"""
+        return self._resident(user_id, lambda: self._add(user_id, product_id, quantity, timezone.now()))
+
+    def remove(self, user_id: int, product_id: int) -> Tuple[bool, CartSnapshot]:
+        """
+        Remove a product from the cart
+
+        Returns:
+            (whether the product was in the cart, the cart afterwards)
+        """
+        return self._resident(user_id, lambda: self._remove(user_id, product_id, timezone.now()))
+
+    @abstractmethod
+    def discard(self, user_id: int) -> None:
+        """Drop the resident cart without persisting it (the database copy is reloaded on next use)"""
+
+    @abstractmethod
+    def settle(self, user_id: int, ordered: Dict[int, int]) -> None:
+        """
+        Take checked-out quantities (product id -> quantity) out of the resident cart
+
+        Items added while the order was being placed stay, and are written
+        back to the emptied database cart; a cart left empty is dropped.
+        """
+
+    def persist(self, user_id: int) -> None:
+        """Write one cart to the database now (used before checkout)"""
+        self._mark_clean([user_id])
+        snapshot = self._read(user_id)
+        if snapshot is None:
+            return
+        try:
+            self._persist({user_id: snapshot})
+        except Exception:
+            self.requeue([user_id])
+            raise
+
+    def flush(self) -> int:
+        """
+        Write all dirty carts to the database
+
+        Returns:
+            int: Number of carts flushed
+        """
+        flushed = 0
+        while True:
+            user_ids = self.drain()
+            if not user_ids:
+                return flushed
+            snapshots = {}
+            for user_id in user_ids:
+                snapshot = self._read(user_id)
+                # Discarded since it was changed
+                if snapshot is not None:
+                    snapshots[user_id] = snapshot
+            try:
+                self._persist(snapshots)
+            except Exception:
+                self.requeue(user_ids)
+                raise
+            flushed += len(snapshots)
+
+    @abstractmethod
+    def drain(self) -> List[int]:
+        """Atomically take up to one batch of dirty cart owners"""
+
+    @abstractmethod
+    def requeue(self, user_ids: Iterable[int]) -> None:
+        """Mark carts dirty again after a failed flush"""
+
+    @abstractmethod
+    def _read(self, user_id: int) -> Optional[CartSnapshot]:
+        """A copy of the resident cart; None if the cart isn't resident"""
+
+    @abstractmethod
+    def _populate(self, user_id: int, snapshot: CartSnapshot) -> None:
+        """Make a cart resident unless another request already did"""
+
+    @abstractmethod
+    def _add(self, user_id: int, product_id: int, quantity: int, now: datetime) -> Optional[CartSnapshot]:
+        """Apply an add to a resident cart; None if the cart isn't resident"""
+
+    @abstractmethod
+    def _remove(self, user_id: int, product_id: int, now: datetime) -> Optional[Tuple[bool, CartSnapshot]]:
+        """Apply a removal to a resident cart; None if the cart isn't resident"""
+
+    @abstractmethod
+    def _mark_clean(self, user_ids: Iterable[int]) -> None:
+        """Unmark carts whose current state is about to be written"""
+
+    def _resident(self, user_id: int, operation: Callable[[], Optional[T]]) -> T:
+        result = operation()
+        while result is None:
+            self._populate(user_id, self._load(user_id))
+            result = operation()
+        return result
+
+    def _load(self, user_id: int) -> CartSnapshot:
+        cart, _ = Cart.objects.get_or_create(user_id=user_id)
+        items: Dict[int, int] = {}
+        for product_id, quantity in cart.items.order_by('pk').values_list('product_id', 'quantity'):
+            items[product_id] = items.get(product_id, 0) + quantity
+        return CartSnapshot(cart.pk, cart.created_at, cart.updated_at, items)
+
+    def _persist(self, snapshots: Dict[int, CartSnapshot]) -> None:
+        if not snapshots:
+            return
+        with transaction.atomic():
+            # Carts and products deleted while the cart was resident are skipped
+            carts = set(
+                Cart.objects.filter(pk__in=[s.cart_id for s in snapshots.values()]).values_list('pk', flat=True)
+            )
+            snapshots = [s for s in snapshots.values() if s.cart_id in carts]
+            products = set(
+                Product.objects.filter(pk__in={pk for s in snapshots for pk in s.items})
+                .values_list('pk', flat=True)
+            )
+            wanted = {
+                (s.cart_id, product_id): quantity
+                for s in snapshots
+                for product_id, quantity in s.items.items()
+                if product_id in products
+            }
+            existing = {}
+            stale = []
+            for pk, cart_id, product_id, quantity in (
+                CartItem.objects.filter(cart_id__in=carts).order_by('pk')
+                .values_list('pk', 'cart_id', 'product_id', 'quantity')
+            ):
+                key = (cart_id, product_id)
+                if key in wanted and key not in existing:
+                    existing[key] = (pk, quantity)
+                else:
+                    stale.append(pk)
+
+            if stale:
+                CartItem.objects.filter(pk__in=stale).delete()
+            CartItem.objects.bulk_update([
+                CartItem(pk=existing[key][0], quantity=quantity)
+                for key, quantity in wanted.items()
+                if key in existing and existing[key][1] != quantity
+            ], ['quantity'], batch_size=self.batch_size)
+            CartItem.objects.bulk_create([
+                CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+                for (cart_id, product_id), quantity in wanted.items()
+                if (cart_id, product_id) not in existing
+            ], batch_size=self.batch_size)
+            Cart.objects.bulk_update(
+                [Cart(pk=s.cart_id, updated_at=s.updated_at) for s in snapshots],
+                ['updated_at'],
+                batch_size=self.batch_size
+            )
+
+
+class LocalCartStore(CartStore):
+    """
+    In-process store, flushed by a per-process background thread
+
+    Every worker process keeps its own copy of a resident cart, so with
+    more than one worker a user sees whichever copy their request reaches.
+    Use the Redis store then.
+    """
+
+    def __init__(self, batch_size: int = 500, flush_interval: float = 5):
+        super().__init__(batch_size)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._carts: Dict[int, CartSnapshot] = {}
+        self._dirty: Set[int] = set()
+        self._flusher: Optional[threading.Thread] = None
+
+    def discard(self, user_id: int) -> None:
+        with self._lock:
+            self._carts.pop(user_id, None)
+            self._dirty.discard(user_id)
+
+    def settle(self, user_id: int, ordered: Dict[int, int]) -> None:
+        with self._lock:
+            snapshot = self._carts.get(user_id)
+            if snapshot is None:
+                return
+            for product_id, quantity in ordered.items():
+                left = snapshot.items.get(product_id, 0) - quantity
+                if left > 0:
+                    snapshot.items[product_id] = left
+                else:
+                    snapshot.items.pop(product_id, None)
+            if snapshot.items:
+                snapshot.updated_at = timezone.now()
+                self._changed(user_id)
+            else:
+                del self._carts[user_id]
+                self._dirty.discard(user_id)
+
+    def drain(self) -> List[int]:
+        with self._lock:
+            user_ids = list(self._dirty)[:self.batch_size]
+            self._dirty.difference_update(user_ids)
+        return user_ids
+
+    def requeue(self, user_ids: Iterable[int]) -> None:
+        with self._lock:
+            self._dirty.update(user_ids)
+
+    def _read(self, user_id: int) -> Optional[CartSnapshot]:
+        with self._lock:
+            snapshot = self._carts.get(user_id)
+            return replace(snapshot, items=dict(snapshot.items)) if snapshot is not None else None
+
+    def _populate(self, user_id: int, snapshot: CartSnapshot) -> None:
+        with self._lock:
+            self._carts.setdefault(user_id, snapshot)
+
+    def _add(self, user_id: int, product_id: int, quantity: int, now: datetime) -> Optional[CartSnapshot]:
+        with self._lock:
+            snapshot = self._carts.get(user_id)
+            if snapshot is None:
+                return None
+            snapshot.items[product_id] = snapshot.items.get(product_id, 0) + quantity
+            snapshot.updated_at = now
+            self._changed(user_id)
+            return replace(snapshot, items=dict(snapshot.items))
+
+    def _remove(self, user_id: int, product_id: int, now: datetime) -> Optional[Tuple[bool, CartSnapshot]]:
+        with self._lock:
+            snapshot = self._carts.get(user_id)
+            if snapshot is None:
+                return None
+            removed = snapshot.items.pop(product_id, None) is not None
+            if removed:
+                snapshot.updated_at = now
+                self._changed(user_id)
+            return removed, replace(snapshot, items=dict(snapshot.items))
+
+    def _mark_clean(self, user_ids: Iterable[int]) -> None:
+        with self._lock:
+            self._dirty.difference_update(user_ids)
+
+    def _changed(self, user_id: int) -> None:
+        self._dirty.add(user_id)
+        if self._flusher is None and self.flush_interval > 0:
+            self._start_flusher()
+
+    def _start_flusher(self) -> None:
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(self.flush_interval):
+                self._safe_flush()
+
+        self._flusher = threading.Thread(target=run, name='cart-store-flush', daemon=True)
+        self._flusher.start()
+        atexit.register(lambda: (stop.set(), self._safe_flush()))
+
+    def _safe_flush(self) -> None:
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Cart flush failed: {str(e)}")
+
+
+class RedisCartStore(CartStore):
+    """
+    Redis hashes shared by all workers and flushed by Celery
+
+    Each cart is one hash (``id``, ``created_at``, ``updated_at`` and a
+    ``p:<product id>`` quantity per line). Every operation is a single Lua
+    script call, so it is atomic and costs one round trip.
+    """
+
+    CART_KEY = 'cart:{}'
+    DIRTY_KEY = 'carts:dirty'
+    ITEM_PREFIX = 'p:'
+
+    POPULATE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+    redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+    return 1
+    """
+    ADD_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+    redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+    redis.call('HSET', KEYS[1], 'updated_at', ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    redis.call('SADD', KEYS[2], ARGV[5])
+    return redis.call('HGETALL', KEYS[1])
+    """
+    REMOVE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+    local removed = redis.call('HDEL', KEYS[1], ARGV[1])
+    if removed == 1 then
+        redis.call('HSET', KEYS[1], 'updated_at', ARGV[2])
+        redis.call('SADD', KEYS[2], ARGV[4])
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return {removed, redis.call('HGETALL', KEYS[1])}
+    """
+    SETTLE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+    for i = 4, #ARGV, 2 do
+        if redis.call('HINCRBY', KEYS[1], ARGV[i], -tonumber(ARGV[i + 1])) <= 0 then
+            redis.call('HDEL', KEYS[1], ARGV[i])
+        end
+    end
+    -- Only id, created_at and updated_at left
+    if redis.call('HLEN', KEYS[1]) <= 3 then
+        redis.call('DEL', KEYS[1])
+        redis.call('SREM', KEYS[2], ARGV[3])
+        return 1
+    end
+    redis.call('HSET', KEYS[1], 'updated_at', ARGV[1])
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    redis.call('SADD', KEYS[2], ARGV[3])
+    return 1
+    """
+
+    def __init__(self, redis_url: str, batch_size: int = 500, ttl: int = 7 * 24 * 3600):
+        super().__init__(batch_size)
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url)
+        # Idle carts leave Redis after this long and are reloaded from the
+        # database; it must be far longer than the flush interval
+        self.ttl = ttl
+        self._populate_script = self.client.register_script(self.POPULATE_SCRIPT)
+        self._add_script = self.client.register_script(self.ADD_SCRIPT)
+        self._remove_script = self.client.register_script(self.REMOVE_SCRIPT)
+        self._settle_script = self.client.register_script(self.SETTLE_SCRIPT)
+
+    def discard(self, user_id: int) -> None:
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(self.CART_KEY.format(user_id))
+        pipe.srem(self.DIRTY_KEY, user_id)
+        pipe.execute()
+
+    def settle(self, user_id: int, ordered: Dict[int, int]) -> None:
+        args = [timezone.now().isoformat(), self.ttl, user_id]
+        for product_id, quantity in ordered.items():
+            args.extend((f'{self.ITEM_PREFIX}{product_id}', quantity))
+        self._settle_script(keys=[self.CART_KEY.format(user_id), self.DIRTY_KEY], args=args)
+
+    def drain(self) -> List[int]:
+        return [int(user_id) for user_id in self.client.spop(self.DIRTY_KEY, self.batch_size) or []]
+
+    def requeue(self, user_ids: Iterable[int]) -> None:
+        user_ids = list(user_ids)
+        if user_ids:
+            self.client.sadd(self.DIRTY_KEY, *user_ids)
+
+    def _read(self, user_id: int) -> Optional[CartSnapshot]:
+        return self._decode(self.client.hgetall(self.CART_KEY.format(user_id)))
+
+    def _populate(self, user_id: int, snapshot: CartSnapshot) -> None:
+        mapping = {
+            'id': snapshot.cart_id,
+            'created_at': snapshot.created_at.isoformat(),
+            'updated_at': snapshot.updated_at.isoformat(),
+        }
+        mapping.update({f'{self.ITEM_PREFIX}{pk}': quantity for pk, quantity in snapshot.items.items()})
+        args = [self.ttl]
+        for name, value in mapping.items():
+            args.extend((name, value))
+        self._populate_script(keys=[self.CART_KEY.format(user_id)], args=args)
+
+    def _add(self, user_id: int, product_id: int, quantity: int, now: datetime) -> Optional[CartSnapshot]:
+        raw = self._add_script(
+            keys=[self.CART_KEY.format(user_id), self.DIRTY_KEY],
+            args=[f'{self.ITEM_PREFIX}{product_id}', quantity, now.isoformat(), self.ttl, user_id]
+        )
+        return self._decode(self._pairs(raw)) if raw else None
+
+    def _remove(self, user_id: int, product_id: int, now: datetime) -> Optional[Tuple[bool, CartSnapshot]]:
+        raw = self._remove_script(
+            keys=[self.CART_KEY.format(user_id), self.DIRTY_KEY],
+            args=[f'{self.ITEM_PREFIX}{product_id}', now.isoformat(), self.ttl, user_id]
+        )
+        if not raw:
+            return None
+        removed, fields = raw
+        return bool(removed), self._decode(self._pairs(fields))
+
+    def _mark_clean(self, user_ids: Iterable[int]) -> None:
+        self.client.srem(self.DIRTY_KEY, *user_ids)
+
+    @staticmethod
+    def _pairs(flat: List[bytes]) -> Dict[bytes, bytes]:
+        return dict(zip(flat[::2], flat[1::2]))
+
+    def _decode(self, raw: Dict[bytes, bytes]) -> Optional[CartSnapshot]:
+        if not raw:
+            return None
+        fields = {name.decode(): value.decode() for name, value in raw.items()}
+        prefix = self.ITEM_PREFIX
+        return CartSnapshot(
+            cart_id=int(fields['id']),
+            created_at=datetime.fromisoformat(fields['created_at']),
+            updated_at=datetime.fromisoformat(fields['updated_at']),
+            items={
+                int(name[len(prefix):]): int(value)
+                for name, value in fields.items()
+                if name.startswith(prefix)
+            }
+        )
+
+
+def create_cart_store() -> CartStore:
+    """Build the store configured by CART_STORE_BACKEND ('local' or 'redis')"""
+    backend = getattr(settings, 'CART_STORE_BACKEND', 'local')
+    batch_size = getattr(settings, 'CART_STORE_BATCH_SIZE', 500)
+    if backend == 'redis':
+        return RedisCartStore(
+            settings.CART_STORE_REDIS_URL,
+            batch_size=batch_size,
+            ttl=getattr(settings, 'CART_STORE_TTL', 7 * 24 * 3600)
+        )
+    return LocalCartStore(
+        batch_size=batch_size,
+        flush_interval=getattr(settings, 'CART_STORE_FLUSH_INTERVAL', 5)
+    )
+
+
+# Create a singleton instance
+cart_store = create_cart_store()
@@ -1,7 +1,11 @@
+import asyncio
 from typing import Dict, List, Optional
 from decimal import Decimal
 from .order_calculator import order_calculator
-from .revolut_service import revolut_service, RevolutServiceError, InvalidAPIVersionError, CardNotFoundError
+from .quote_cache import quote_cache, quote_id_for
+from .revolut_service import (
+    revolut_service, RevolutServiceError, RevolutUnavailableError, InvalidAPIVersionError, CardNotFoundError
+)
 
 class CheckoutError(Exception):
     """Base exception for checkout service errors"""
@@ -11,15 +15,25 @@ class PaymentError(CheckoutError):
     """Raised when payment processing fails"""
     pass
 
+class PaymentUnavailableError(PaymentError):
+    """Raised when the payment provider can't be reached or fails, so the checkout can be retried"""
+    pass
+
+class QuoteExpiredError(CheckoutError):
+    """Raised when a quote id is unknown, expired or was invalidated by a fee or FX change"""
+    pass
+
 class CheckoutService:
     def __init__(self):
         self.order_calculator = order_calculator
         self.payment_service = revolut_service
+        self.quote_cache = quote_cache
 
     def process_checkout(self,
                         items: List[Dict],
                         shipping_address: Dict,
-                        payment_card_id: str) -> Dict:
+                        payment_card_id: str,
+                        order_totals: Optional[Dict] = None) -> Dict:
         """
         Process a complete checkout including order calculations and payment
         
@@ -27,6 +41,7 @@ class CheckoutService:
             items: List of items in the order
             shipping_address: Customer's shipping address
             payment_card_id: ID of the payment card to use
+            order_totals: Totals from a redeemed quote; calculated when omitted
         
         Returns:
             Dict containing order and payment details
@@ -34,21 +49,14 @@ class CheckoutService:
         Raises:
             CheckoutError: If checkout processing fails
             PaymentError: If payment processing fails
+            PaymentUnavailableError: If the payment provider can't be reached or fails
             InvalidAPIVersionError: If API version is invalid
             CardNotFoundError: If payment card is not found
         """
         try:
             # Calculate order totals
-            subtotal = sum(
-                Decimal(item['price']) * item['quantity']
-                for item in items
-            )
-            
-            order_totals = self.order_calculator.calculate_order_totals(
-                subtotal=subtotal,
-                items=items,
-                shipping_address=shipping_address
-            )
+            if order_totals is None:
+                order_totals = self._calculate_totals(items, shipping_address)
 
             try:
                 # Process payment
@@ -59,34 +67,117 @@ class CheckoutService:
                     description=f"Order total: ${order_totals['total']}"
                 )
 
-                # Create order record
-                order = {
-                    'items': items,
-                    'totals': order_totals,
-                    'shipping_address': shipping_address,
-                    'payment': {
-                        'card_id': payment_card_id,
-                        'transaction_id': payment['id'],
-                        'status': payment['status']
-                    }
-                }
-
-                return {
-                    'order': order,
-                    'payment': payment,
-                    'status': 'success' if payment['status'] == 'approved' else 'failed'
-                }
+                return self._order_result(items, shipping_address, payment_card_id, order_totals, payment)
 
             except InvalidAPIVersionError as e:
                 raise PaymentError(f"Payment service API version error: {str(e)}")
             except CardNotFoundError as e:
                 raise PaymentError(f"Payment card not found: {str(e)}")
+            except RevolutUnavailableError as e:
+                raise PaymentUnavailableError(f"Payment processing failed: {str(e)}")
             except RevolutServiceError as e:
                 raise PaymentError(f"Payment processing failed: {str(e)}")
 
+        except PaymentUnavailableError:
+            raise
         except Exception as e:
             raise CheckoutError(f"Checkout processing failed: {str(e)}")
 
+    async def aprocess_checkout(self,
+                                items: List[Dict],
+                                shipping_address: Dict,
+                                payment_card_id: str,
+                                order_totals: Optional[Dict] = None) -> Dict:
+        """
+        Async ``process_checkout``: card validation and pricing run
+        concurrently, and both provider calls go over the payment service's
+        pooled keep-alive connections instead of a new connection each.
+        Safe to await from async Django views as well, since the pooled
+        client is kept per event loop.
+        
+        Args:
+            items: List of items in the order
+            shipping_address: Shipping address details
+            payment_card_id: ID of the payment card to use
+            order_totals: Totals already calculated for these items (e.g. a quote)
+        
+        Returns:
+            Dict containing order and payment details
+        
+        Raises:
+            CheckoutError: If checkout processing fails
+            PaymentError: If payment processing fails
+            PaymentUnavailableError: If the payment provider can't be reached or fails
+        """
+        try:
+            if order_totals is None:
+                pricing = asyncio.to_thread(self._calculate_totals, items, shipping_address)
+            else:
+                pricing = asyncio.sleep(0, order_totals)
+
+            try:
+                card, order_totals = await asyncio.gather(
+                    self.payment_service.avalidate_card(payment_card_id),
+                    pricing
+                )
+                payment = await self.payment_service.aprocess_transaction(
+                    card_id=payment_card_id,
+                    amount=int(order_totals['total'] * 100),  # Convert to cents
+                    merchant="CopIt Store",
+                    description=f"Order total: ${order_totals['total']}",
+                    card=card
+                )
+                return self._order_result(items, shipping_address, payment_card_id, order_totals, payment)
+
+            except InvalidAPIVersionError as e:
+                raise PaymentError(f"Payment service API version error: {str(e)}")
+            except CardNotFoundError as e:
+                raise PaymentError(f"Payment card not found: {str(e)}")
+            except RevolutUnavailableError as e:
+                raise PaymentUnavailableError(f"Payment processing failed: {str(e)}")
+            except RevolutServiceError as e:
+                raise PaymentError(f"Payment processing failed: {str(e)}")
+
+        except PaymentUnavailableError:
+            raise
+        except Exception as e:
+            raise CheckoutError(f"Checkout processing failed: {str(e)}")
+
+    def _calculate_totals(self, items: List[Dict], shipping_address: Optional[Dict]) -> Dict:
+        subtotal = sum(
+            Decimal(item['price']) * item['quantity']
+            for item in items
+        )
+        return self.order_calculator.calculate_order_totals(
+            subtotal=subtotal,
+            items=items,
+            shipping_address=shipping_address
+        )
+
+    def _order_result(self,
+                      items: List[Dict],
+                      shipping_address: Dict,
+                      payment_card_id: str,
+                      order_totals: Dict,
+                      payment: Dict) -> Dict:
+        # Create order record
+        order = {
+            'items': items,
+            'totals': order_totals,
+            'shipping_address': shipping_address,
+            'payment': {
+                'card_id': payment_card_id,
+                'transaction_id': payment['id'],
+                'status': payment['status']
+            }
+        }
+
+        return {
+            'order': order,
+            'payment': payment,
+            'status': 'success' if payment['status'] == 'approved' else 'failed'
+        }
+
     def get_order_summary(self,
                          items: List[Dict],
                          shipping_address: Optional[Dict] = None) -> Dict:
@@ -104,18 +195,76 @@ class CheckoutService:
             CheckoutError: If order summary calculation fails
         """
         try:
-            subtotal = sum(
-                Decimal(item['price']) * item['quantity']
-                for item in items
-            )
-            
-            return self.order_calculator.calculate_order_totals(
-                subtotal=subtotal,
-                items=items,
-                shipping_address=shipping_address
-            )
+            return self._calculate_totals(items, shipping_address)
         except Exception as e:
             raise CheckoutError(f"Failed to calculate order summary: {str(e)}")
 
+    def quote(self,
+              items: List[Dict],
+              shipping_address: Optional[Dict] = None) -> Dict:
+        """
+        Order summary with a ``quote_id``, served from the quote cache when the
+        same cart was quoted under the current fees
+        
+        Args:
+            items: List of items in the order
+            shipping_address: Optional shipping address for shipping calculations
+        
+        Returns:
+            Dict containing the order summary and its quote_id
+        
+        Raises:
+            CheckoutError: If order summary calculation fails
+        """
+        config_version = self.order_calculator.config_version()
+        quote_id = quote_id_for(items, shipping_address, config_version)
+        cached = self.quote_cache.get(quote_id, config_version)
+        if cached is not None:
+            return {**cached['summary'], 'quote_id': quote_id}
+
+        generation = self.quote_cache.generation()
+        summary = self.get_order_summary(items=items, shipping_address=shipping_address)
+        self.quote_cache.put(quote_id, items, shipping_address, summary, config_version, generation)
+        return {**summary, 'quote_id': quote_id}
+
+    def process_quote(self, quote_id: str, payment_card_id: str) -> Dict:
+        """
+        Process checkout for a quoted cart without recalculating it
+        
+        Args:
+            quote_id: Id returned by ``quote``
+            payment_card_id: ID of the payment card to use
+        
+        Returns:
+            Dict containing order and payment details
+        
+        Raises:
+            QuoteExpiredError: If the quote is no longer valid
+            CheckoutError: If checkout processing fails
+        """
+        quote = self.quote_cache.get(quote_id, self.order_calculator.config_version())
+        if quote is None:
+            raise QuoteExpiredError("Quote has expired, please request a new summary")
+        return self.process_checkout(
+            items=quote['items'],
+            shipping_address=quote['shipping_address'],
+            payment_card_id=payment_card_id,
+            order_totals=quote['summary']
+        )
+
+    async def aprocess_quote(self, quote_id: str, payment_card_id: str) -> Dict:
+        """Async ``process_quote``"""
+        quote = await asyncio.to_thread(
+            self.quote_cache.get, quote_id, self.order_calculator.config_version()
+        )
+        if quote is None:
+            raise QuoteExpiredError("Quote has expired, please request a new summary")
+        return await self.aprocess_checkout(
+            items=quote['items'],
+            shipping_address=quote['shipping_address'],
+            payment_card_id=payment_card_id,
+            order_totals=quote['summary']
+        )
+
 # Create a singleton instance
 checkout_service = CheckoutService() 
\ No newline at end of file
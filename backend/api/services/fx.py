@@ -1,11 +1,17 @@
 import logging
-from typing import Dict, Optional, Tuple, List
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple, List
 from decimal import Decimal
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime
 from django.conf import settings
 from django.core.cache import cache
-from .models import FXTransaction
+from ..models import BalanceEntry, FXTransaction
+from .balance_ledger import InsufficientFundsError, LedgerNotReconciledError, usd_ledger
+from .quote_cache import quote_cache
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +39,16 @@ class FXService:
     TARGET_CURRENCY = 'USD'
     RATE_CACHE_KEY = 'fx_rate_ngn_usd'
     RATE_CACHE_TTL = 300  # 5 minutes in seconds
+    # Past its TTL a rate is still served for this long while one worker refreshes it
+    RATE_GRACE_PERIOD = 600
+    # The beat task refreshes a rate once it is this close to its TTL
+    RATE_REFRESH_AHEAD = 90
+    RATE_LOCK_KEY = 'fx_rate_ngn_usd:refresh_lock'
+    RATE_LOCK_TIMEOUT = 30  # seconds; also how long a worker waits on another's fetch
+    RATE_WAIT_INTERVAL = 0.05
+    # The cached rate is shared by every amount; background refreshes quote this one
+    RATE_REFERENCE_AMOUNT = Decimal('100000')
+    RATE_STATS_PREFIX = 'fx_rate:stats:'
     
     def __init__(self, api_key: str):
         self.api_key = api_key
@@ -77,10 +93,60 @@ class FXService:
         except Exception as e:
             raise FXServiceError(f"Failed to get USD balance: {str(e)}")
 
+    def reconcile_usd_balance(self) -> Decimal:
+        """
+        Reset the local USD ledger to the Payoneer balance
+        
+        Returns:
+            Decimal: USD available for new reservations
+        
+        Raises:
+            FXServiceError: If balance check fails
+        """
+        return usd_ledger.reconcile(self.get_usd_balance).available
+
+    @contextmanager
+    def hold_usd(self, amount: Decimal, reference: str = '') -> Iterator[BalanceEntry]:
+        """
+        Reserve USD on the local ledger for the duration of an operation
+        
+        Replaces a Payoneer balance call per operation: the hold is debited
+        if the block completes and released if it raises, and the ledger is
+        reconciled periodically. The ledger is reconciled first if it never
+        has been.
+        
+        Args:
+            amount: USD the operation may spend
+            reference: What the hold is for; the block may set ``entry.reference``
+        
+        Raises:
+            InsufficientBalanceError: If the available USD doesn't cover it
+        """
+        try:
+            try:
+                entry = usd_ledger.reserve(amount, reference)
+            except LedgerNotReconciledError:
+                self.reconcile_usd_balance()
+                entry = usd_ledger.reserve(amount, reference)
+        except InsufficientFundsError as e:
+            raise InsufficientBalanceError(f"Insufficient USD balance. {str(e)}")
+        
+        try:
+            yield entry
+        except BaseException:
+            usd_ledger.release(entry)
+            raise
+        usd_ledger.debit(entry)
+
     def get_exchange_rate(self, amount: Decimal) -> Tuple[Decimal, Decimal]:
         """
         Get best available exchange rate for NGN to USD conversion
-        Uses caching to minimize API calls
+        
+        A cached rate is returned while it is fresh. For ``RATE_GRACE_PERIOD``
+        after its TTL the stale rate is still returned at once and a single
+        worker, holding the refresh lock, fetches a new one in the background.
+        Only with no usable rate does the caller fetch, and then only one
+        caller does; the rest wait for its result.
         
         Args:
             amount: Amount in NGN to convert
@@ -93,15 +159,115 @@ class FXService:
             InvalidRateError: If rate is invalid
         """
         try:
-            # Try to get rate from cache first
             cached_data = cache.get(self.RATE_CACHE_KEY)
             if cached_data:
-                rate, fee, timestamp = cached_data
-                # Check if cache is still valid
-                if datetime.utcnow() - timestamp < timedelta(seconds=self.RATE_CACHE_TTL):
+                rate, fee, fetched_at = cached_data
+                age = (datetime.utcnow() - fetched_at).total_seconds()
+                if age < self.RATE_CACHE_TTL:
+                    return rate, fee
+                if age < self.RATE_CACHE_TTL + self.RATE_GRACE_PERIOD:
+                    self._record('stale_served')
+                    self._refresh_in_background()
                     return rate, fee
             
-            # If not in cache or expired, fetch from API
+            return self._fetch_or_wait(amount)
+        except Exception as e:
+            raise FXServiceError(f"Failed to get exchange rate: {str(e)}")
+
+    def refresh_rate(self, force: bool = False) -> bool:
+        """
+        Fetch a new rate if the cached one is within ``RATE_REFRESH_AHEAD`` of
+        its TTL (or missing), unless another worker is already fetching
+        
+        Args:
+            force: Refresh regardless of the cached rate's age
+        
+        Returns:
+            bool: Whether this call fetched a rate
+        
+        Raises:
+            FXServiceError: If the fetch fails
+        """
+        age = self.get_rate_age()
+        if not force and age is not None and age < self.RATE_CACHE_TTL - self.RATE_REFRESH_AHEAD:
+            return False
+        token = self._acquire_refresh_lock()
+        if token is None:
+            return False
+        try:
+            self._fetch_rate(self.RATE_REFERENCE_AMOUNT)
+            return True
+        finally:
+            self._release_refresh_lock(token)
+
+    def get_rate_age(self) -> Optional[float]:
+        """Seconds since the cached rate was fetched, or None if there is none"""
+        cached_data = cache.get(self.RATE_CACHE_KEY)
+        if not cached_data:
+            return None
+        return (datetime.utcnow() - cached_data[2]).total_seconds()
+
+    def get_rate_stats(self) -> Dict:
+        """Rate age, refresh latency and refresh/stale-serve counters"""
+        stats = cache.get_many([
+            self.RATE_STATS_PREFIX + name
+            for name in ('refreshes', 'refresh_failures', 'stale_served', 'waits',
+                         'refresh_us_total', 'last_refresh_us')
+        ])
+        counter = lambda name: stats.get(self.RATE_STATS_PREFIX + name, 0)
+        age = self.get_rate_age()
+        refreshes = counter('refreshes')
+        return {
+            'rate_age_seconds': age,
+            'stale': age is None or age >= self.RATE_CACHE_TTL,
+            'refreshes': refreshes,
+            'refresh_failures': counter('refresh_failures'),
+            'stale_served': counter('stale_served'),
+            'waits': counter('waits'),
+            'last_refresh_ms': counter('last_refresh_us') / 1000,
+            'avg_refresh_ms': counter('refresh_us_total') / refreshes / 1000 if refreshes else 0.0,
+        }
+
+    def _fetch_or_wait(self, amount: Decimal) -> Tuple[Decimal, Decimal]:
+        """Fetch with the refresh lock, or wait for the worker that holds it"""
+        token = self._acquire_refresh_lock()
+        if token is not None:
+            try:
+                return self._fetch_rate(amount)
+            finally:
+                self._release_refresh_lock(token)
+
+        self._record('waits')
+        deadline = time.monotonic() + self.RATE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(self.RATE_WAIT_INTERVAL)
+            cached_data = cache.get(self.RATE_CACHE_KEY)
+            if cached_data:
+                return cached_data[0], cached_data[1]
+            if cache.get(self.RATE_LOCK_KEY) is None:
+                # The other fetch failed
+                break
+        return self._fetch_rate(amount)
+
+    def _refresh_in_background(self) -> None:
+        token = self._acquire_refresh_lock()
+        if token is None:
+            return
+
+        def refresh():
+            try:
+                self._fetch_rate(self.RATE_REFERENCE_AMOUNT)
+            except Exception as e:
+                logger.warning(f"Background FX rate refresh failed: {str(e)}")
+            finally:
+                self._release_refresh_lock(token)
+
+        threading.Thread(target=refresh, name='fx-rate-refresh', daemon=True).start()
+
+    def _fetch_rate(self, amount: Decimal) -> Tuple[Decimal, Decimal]:
+        """Fetch the rate from Payoneer and cache it for its TTL plus the grace period"""
+        started = time.perf_counter()
+        try:
             response = requests.get(
                 f'{self.BASE_URL}/fx/rates',
                 headers=self.default_headers,
@@ -118,17 +284,46 @@ class FXService:
             
             if rate <= 0:
                 raise InvalidRateError('Invalid exchange rate received')
-            
-            # Cache the rate
-            cache.set(
-                self.RATE_CACHE_KEY,
-                (rate, fee, datetime.utcnow()),
-                self.RATE_CACHE_TTL
-            )
-            
-            return rate, fee
-        except Exception as e:
-            raise FXServiceError(f"Failed to get exchange rate: {str(e)}")
+        except Exception:
+            self._record('refresh_failures')
+            raise
+        
+        elapsed_us = int((time.perf_counter() - started) * 1_000_000)
+        self._record('refreshes')
+        self._record('refresh_us_total', elapsed_us)
+        cache.set(self.RATE_STATS_PREFIX + 'last_refresh_us', elapsed_us, None)
+        
+        # Quotes priced under the previous rate are no longer valid
+        cached_data = cache.get(self.RATE_CACHE_KEY)
+        if not cached_data or cached_data[:2] != (rate, fee):
+            quote_cache.invalidate()
+        
+        cache.set(
+            self.RATE_CACHE_KEY,
+            (rate, fee, datetime.utcnow()),
+            self.RATE_CACHE_TTL + self.RATE_GRACE_PERIOD
+        )
+        logger.info(f"FX rate refreshed: {rate} (fee {fee}) in {elapsed_us / 1000:.1f}ms")
+        return rate, fee
+
+    def _acquire_refresh_lock(self) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if cache.add(self.RATE_LOCK_KEY, token, self.RATE_LOCK_TIMEOUT):
+            return token
+        return None
+
+    def _release_refresh_lock(self, token: str) -> None:
+        # Only our own lock: if the fetch outlived the timeout another worker may hold it now
+        if cache.get(self.RATE_LOCK_KEY) == token:
+            cache.delete(self.RATE_LOCK_KEY)
+
+    def _record(self, name: str, amount: int = 1) -> None:
+        key = self.RATE_STATS_PREFIX + name
+        if not cache.add(key, amount, None):
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                cache.set(key, amount, None)
 
     def convert_currency(self, ngn_amount: Decimal) -> Dict:
         """
@@ -145,34 +340,27 @@ class FXService:
             InsufficientBalanceError: If insufficient USD balance
         """
         try:
-            # Check USD balance first
-            usd_balance = self.get_usd_balance()
-            
             # Get best available rate
             rate, fee = self.get_exchange_rate(ngn_amount)
             
             # Calculate converted amount
             converted_amount = (ngn_amount * rate) - fee
             
-            # Verify sufficient balance
-            if converted_amount > usd_balance:
-                raise InsufficientBalanceError(
-                    f"Insufficient USD balance. Required: {converted_amount}, Available: {usd_balance}"
+            # Hold the USD on the local ledger while converting
+            with self.hold_usd(converted_amount, reference='fx_convert') as hold:
+                response = requests.post(
+                    f'{self.BASE_URL}/fx/convert',
+                    headers=self.default_headers,
+                    json={
+                        'source_currency': self.SOURCE_CURRENCY,
+                        'target_currency': self.TARGET_CURRENCY,
+                        'amount': str(ngn_amount),
+                        'rate': str(rate)
+                    }
                 )
-            
-            # Execute conversion
-            response = requests.post(
-                f'{self.BASE_URL}/fx/convert',
-                headers=self.default_headers,
-                json={
-                    'source_currency': self.SOURCE_CURRENCY,
-                    'target_currency': self.TARGET_CURRENCY,
-                    'amount': str(ngn_amount),
-                    'rate': str(rate)
-                }
-            )
-            
-            data = self._handle_response(response)
+                
+                data = self._handle_response(response)
+                hold.reference = data['transaction_id']
             
             # Log FX transaction
             self._log_fx_transaction(
@@ -233,32 +421,26 @@ class FXService:
                     'fee': fee
                 })
             
-            # Check if we have enough balance
-            usd_balance = self.get_usd_balance()
-            if total_converted > usd_balance:
-                raise InsufficientBalanceError(
-                    f"Insufficient USD balance. Required: {total_converted}, Available: {usd_balance}"
+            # Hold the USD for the whole batch on the local ledger
+            with self.hold_usd(total_converted, reference='fx_batch_convert'):
+                response = requests.post(
+                    f'{self.BASE_URL}/fx/batch-convert',
+                    headers=self.default_headers,
+                    json={
+                        'conversions': [
+                            {
+                                'source_currency': self.SOURCE_CURRENCY,
+                                'target_currency': self.TARGET_CURRENCY,
+                                'amount': str(conv['source_amount']),
+                                'rate': str(rate)
+                            }
+                            for conv in conversions
+                        ]
+                    }
                 )
-            
-            # Execute batch conversion
-            response = requests.post(
-                f'{self.BASE_URL}/fx/batch-convert',
-                headers=self.default_headers,
-                json={
-                    'conversions': [
-                        {
-                            'source_currency': self.SOURCE_CURRENCY,
-                            'target_currency': self.TARGET_CURRENCY,
-                            'amount': str(conv['source_amount']),
-                            'rate': str(rate)
-                        }
-                        for conv in conversions
-                    ]
-                }
-            )
-            
-            data = self._handle_response(response)
-            transaction_ids = data['transaction_ids']
+                
+                data = self._handle_response(response)
+                transaction_ids = data['transaction_ids']
             
             # Log all transactions
             results = []
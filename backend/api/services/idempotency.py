@@ -0,0 +1,343 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyError(Exception):
+    """Base exception for idempotency key errors"""
+    pass
+
+
+class InvalidIdempotencyKeyError(IdempotencyError):
+    """Raised when the Idempotency-Key header is empty or too long"""
+    pass
+
+
+class IdempotencyKeyReusedError(IdempotencyError):
+    """Raised when a key is sent again with a different request"""
+    pass
+
+
+class IdempotencyInProgressError(IdempotencyError):
+    """Raised when the first request with a key is still running after the wait timeout"""
+    pass
+
+
+# Status code and error_type each error is reported with
+IDEMPOTENCY_ERRORS = (
+    (InvalidIdempotencyKeyError, 400, 'validation_error'),
+    (IdempotencyKeyReusedError, 422, 'idempotency_key_reused'),
+    (IdempotencyInProgressError, 409, 'idempotency_in_progress'),
+)
+
+
+@dataclass
+class IdempotencyRecord:
+    """What is stored under an idempotency key: the request it was first used with and its outcome"""
+    fingerprint: str
+    token: str
+    status: str = 'in_progress'
+    status_code: Optional[int] = None
+    data: Any = None
+
+    @property
+    def completed(self) -> bool:
+        return self.status == 'completed'
+
+
+def request_fingerprint(*parts) -> str:
+    """Stable hash of the parts of a request that must match on a retry"""
+    payload = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class IdempotencyStore(ABC):
+    """
+    Shared records for idempotency keys
+
+    A key is claimed with an in-progress record that expires after
+    ``lock_timeout`` (so a crashed worker doesn't block retries forever)
+    and is then either completed with the response, kept for ``ttl``, or
+    released so the next retry runs the request again.
+    """
+
+    def __init__(self, ttl: int = 24 * 3600, lock_timeout: int = 120):
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+
+    @abstractmethod
+    def claim(self, key: str, record: IdempotencyRecord) -> Optional[IdempotencyRecord]:
+        """
+        Store an in-progress record unless the key is taken
+
+        Returns:
+            The record already stored under the key, or None if claimed
+        """
+
+    @abstractmethod
+    def complete(self, key: str, record: IdempotencyRecord) -> None:
+        """Replace the in-progress record with the outcome, if the claim is still ours"""
+
+    @abstractmethod
+    def release(self, key: str, token: str) -> None:
+        """Drop an in-progress record, if the claim is still ours"""
+
+    @abstractmethod
+    def wait(self, key: str, timeout: float) -> Optional[IdempotencyRecord]:
+        """
+        Wait for an in-progress record to complete or go away
+
+        Returns:
+            The record at the end of the wait, or None if the key is free
+        """
+
+
+class LocalIdempotencyStore(IdempotencyStore):
+    """
+    In-process records; duplicates wait on a condition variable
+
+    A retry that reaches a different worker process than the first
+    request runs again, so deployments with several workers need the
+    Redis store. Expired records are swept out at most every
+    ``sweep_interval`` seconds.
+    """
+
+    def __init__(self, ttl: int = 24 * 3600, lock_timeout: int = 120, sweep_interval: float = 60):
+        super().__init__(ttl, lock_timeout)
+        self.sweep_interval = sweep_interval
+        self._changed = threading.Condition()
+        self._records: Dict[str, Tuple[IdempotencyRecord, float]] = {}
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def claim(self, key: str, record: IdempotencyRecord) -> Optional[IdempotencyRecord]:
+        with self._changed:
+            self._sweep()
+            existing = self._get(key)
+            if existing is not None:
+                return existing
+            self._records[key] = (record, time.monotonic() + self.lock_timeout)
+            return None
+
+    def complete(self, key: str, record: IdempotencyRecord) -> None:
+        with self._changed:
+            if self._owned(key, record.token):
+                self._records[key] = (record, time.monotonic() + self.ttl)
+            self._changed.notify_all()
+
+    def release(self, key: str, token: str) -> None:
+        with self._changed:
+            if self._owned(key, token):
+                del self._records[key]
+            self._changed.notify_all()
+
+    def wait(self, key: str, timeout: float) -> Optional[IdempotencyRecord]:
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                record = self._get(key)
+                remaining = deadline - time.monotonic()
+                if record is None or record.completed or remaining <= 0:
+                    return record
+                # Wakes up for completions and at the latest when the claim expires
+                self._changed.wait(min(remaining, self._records[key][1] - time.monotonic()))
+
+    def _get(self, key: str) -> Optional[IdempotencyRecord]:
+        entry = self._records.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self._records[key]
+            return None
+        return entry[0]
+
+    def _owned(self, key: str, token: str) -> bool:
+        record = self._get(key)
+        return record is not None and record.token == token
+
+    def _sweep(self) -> None:
+        """Drop expired records, which are otherwise only removed when their key comes back"""
+        now = time.monotonic()
+        if now < self._next_sweep:
+            return
+        self._records = {key: entry for key, entry in self._records.items() if entry[1] > now}
+        self._next_sweep = now + self.sweep_interval
+
+
+class RedisIdempotencyStore(IdempotencyStore):
+    """
+    Records shared by every Django and Flask worker through Redis
+
+    Claims are ``SET NX`` with the lock timeout; completing and
+    releasing check the claim token in a Lua script so a worker whose
+    claim expired can't overwrite a newer one. Duplicates poll the key.
+    """
+
+    KEY_PREFIX = 'idempotency:'
+    COMPLETE_SCRIPT = """
+    local current = redis.call('GET', KEYS[1])
+    if not current or cjson.decode(current)['token'] ~= ARGV[1] then return 0 end
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+    """
+    RELEASE_SCRIPT = """
+    local current = redis.call('GET', KEYS[1])
+    if not current or cjson.decode(current)['token'] ~= ARGV[1] then return 0 end
+    return redis.call('DEL', KEYS[1])
+    """
+
+    def __init__(self, redis_url: str, ttl: int = 24 * 3600, lock_timeout: int = 120,
+                 poll_interval: float = 0.05):
+        super().__init__(ttl, lock_timeout)
+        import redis
+        self.client = redis.Redis.from_url(redis_url)
+        self.poll_interval = poll_interval
+        self._complete = self.client.register_script(self.COMPLETE_SCRIPT)
+        self._release = self.client.register_script(self.RELEASE_SCRIPT)
+
+    def claim(self, key: str, record: IdempotencyRecord) -> Optional[IdempotencyRecord]:
+        key = self.KEY_PREFIX + key
+        while True:
+            if self.client.set(key, json.dumps(asdict(record), default=str), nx=True, ex=self.lock_timeout):
+                return None
+            existing = self._get(key)
+            # Expired between the SET and the GET: try again
+            if existing is not None:
+                return existing
+
+    def complete(self, key: str, record: IdempotencyRecord) -> None:
+        value = json.dumps(asdict(record), default=str)
+        self._complete(keys=[self.KEY_PREFIX + key], args=[record.token, value, self.ttl])
+
+    def release(self, key: str, token: str) -> None:
+        self._release(keys=[self.KEY_PREFIX + key], args=[token])
+
+    def wait(self, key: str, timeout: float) -> Optional[IdempotencyRecord]:
+        key = self.KEY_PREFIX + key
+        deadline = time.monotonic() + timeout
+        interval = self.poll_interval
+        while True:
+            record = self._get(key)
+            if record is None or record.completed or time.monotonic() >= deadline:
+                return record
+            time.sleep(interval)
+            interval = min(interval * 2, 0.5)
+
+    def _get(self, key: str) -> Optional[IdempotencyRecord]:
+        value = self.client.get(key)
+        return IdempotencyRecord(**json.loads(value)) if value is not None else None
+
+
+class IdempotencyService:
+    """
+    Run a request at most once per idempotency key
+
+    The first request with a key runs and its response is stored; a
+    retry with the same key and request gets the stored response without
+    running again, and a retry that arrives while the first is still
+    running waits for it. Responses of 500 and above aren't kept, since
+    those are the failures a retry is meant to get past; views report a
+    provider that timed out or failed as 502 for that reason.
+    """
+
+    def __init__(self, store: IdempotencyStore, wait_timeout: float = 30):
+        self.store = store
+        self.wait_timeout = wait_timeout
+
+    def execute(self, scope: str, key: str, fingerprint: str,
+                handler: Callable[[], Tuple[int, Any]]) -> Tuple[int, Any, bool]:
+        """
+        Run ``handler`` once for this key, or return what it returned the first time
+
+        Args:
+            scope: Endpoint and caller the key belongs to (keys are per scope)
+            key: Client-supplied idempotency key
+            fingerprint: Hash of the request (see ``request_fingerprint``)
+            handler: Runs the request; returns (status code, JSON-compatible body)
+
+        Returns:
+            (status code, body, whether it was replayed)
+
+        Raises:
+            InvalidIdempotencyKeyError: If the key is empty or too long
+            IdempotencyKeyReusedError: If the key was used for a different request
+            IdempotencyInProgressError: If the first request is still running after the wait
+        """
+        key = (key or '').strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise InvalidIdempotencyKeyError(f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters")
+        store_key = f'{scope}:{key}'
+        claim = IdempotencyRecord(fingerprint=fingerprint, token=uuid.uuid4().hex)
+
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            existing = self.store.claim(store_key, claim)
+            if existing is None:
+                break
+            if existing.fingerprint != fingerprint:
+                raise IdempotencyKeyReusedError(f"{IDEMPOTENCY_HEADER} was already used for a different request")
+            if not existing.completed:
+                existing = self.store.wait(store_key, max(deadline - time.monotonic(), 0))
+            if existing is not None and existing.completed:
+                return existing.status_code, existing.data, True
+            if existing is not None:
+                raise IdempotencyInProgressError("A request with this idempotency key is still in progress")
+            # The first request failed and released the key: run it here
+
+        try:
+            status_code, data = handler()
+        except BaseException:
+            self.store.release(store_key, claim.token)
+            raise
+        if status_code >= 500:
+            self.store.release(store_key, claim.token)
+        else:
+            self.store.complete(store_key, IdempotencyRecord(
+                fingerprint=fingerprint, token=claim.token, status='completed',
+                status_code=status_code, data=data
+            ))
+        return status_code, data, False
+
+    def run(self, scope: str, key: str, fingerprint: str,
+            handler: Callable[[], Tuple[int, Any]]) -> Tuple[int, Any, bool]:
+        """
+        ``execute`` for request handlers: key errors become error responses
+
+        Returns:
+            (status code, body, replayed), or (status code, error body, False)
+            for a bad or conflicting key (see ``IDEMPOTENCY_ERRORS``)
+        """
+        try:
+            return self.execute(scope, key, fingerprint, handler)
+        except IdempotencyError as e:
+            status_code, error_type = next(
+                (code, kind) for error, code, kind in IDEMPOTENCY_ERRORS if isinstance(e, error)
+            )
+            return status_code, {'status': 'failed', 'error': str(e), 'error_type': error_type}, False
+
+
+def create_idempotency_store() -> IdempotencyStore:
+    """
+    Redis when REDIS_URL is set, in-process otherwise
+
+    Configured from the environment rather than Django settings because
+    the Flask checkout app shares the store.
+    """
+    ttl = int(os.environ.get('IDEMPOTENCY_TTL', 24 * 3600))
+    redis_url = os.environ.get('REDIS_URL')
+    if redis_url:
+        return RedisIdempotencyStore(redis_url, ttl=ttl)
+    return LocalIdempotencyStore(ttl=ttl)
+
+
+# Create a singleton instance
+idempotency_service = IdempotencyService(create_idempotency_store())
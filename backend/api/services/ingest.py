@@ -0,0 +1,190 @@
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional
+from django.db import transaction
+from .. import search
+from ..caching import bump_namespace
+from ..category_tree import CATEGORY_TREE_NAMESPACE
+from ..models import Category, Product, normalize_source_url
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IngestResult:
+    """Outcome counts for one batch (or the sum of several)"""
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    skipped: int = 0
+
+    def __add__(self, other: 'IngestResult') -> 'IngestResult':
+        return IngestResult(
+            created=self.created + other.created,
+            updated=self.updated + other.updated,
+            unchanged=self.unchanged + other.unchanged,
+            skipped=self.skipped + other.skipped,
+        )
+
+    @property
+    def total(self) -> int:
+        return self.created + self.updated + self.unchanged + self.skipped
+
+    def __str__(self) -> str:
+        return (f"created {self.created}, updated {self.updated}, "
+                f"unchanged {self.unchanged}, skipped {self.skipped}")
+
+
+class ProductIngestService:
+    """
+    Batched upsert of scraped products keyed on ``Product.source_key``
+
+    Each batch costs one SELECT of the existing rows (to classify them and
+    skip unchanged ones) and one ``INSERT ... ON CONFLICT (source_key) DO
+    UPDATE`` for the rest, instead of a SELECT plus INSERT/UPDATE per
+    product. bulk_create skips model signals, so the search index,
+    category counts and cache namespaces are updated here per batch.
+    """
+    # Columns overwritten when a product already exists
+    UPDATE_FIELDS = ('name', 'description', 'price', 'stock', 'image_url', 'source_url', 'updated_at')
+    # Columns that make a product "changed"; a new tracking parameter on
+    # the source URL doesn't
+    COMPARED_FIELDS = ('name', 'description', 'price', 'stock', 'image_url')
+    TEXT_FIELDS = ('name', 'description')
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+
+    def ingest(self,
+               items: Iterable[Dict],
+               on_batch: Optional[Callable[[IngestResult], None]] = None) -> IngestResult:
+        """
+        Upsert scraped products in batches
+
+        Args:
+            items: Dicts with name, price, source_url and optionally
+                description, stock, image_url and category/category_id;
+                without either, an existing product keeps its category
+            on_batch: Called with the result of every batch
+
+        Returns:
+            IngestResult: Totals over all batches
+        """
+        items = iter(items)
+        total = IngestResult()
+        while True:
+            batch = list(islice(items, self.batch_size))
+            if not batch:
+                return total
+            result = self.upsert_batch(batch)
+            if on_batch is not None:
+                on_batch(result)
+            total += result
+
+    def upsert_batch(self, items: List[Dict]) -> IngestResult:
+        """
+        Upsert one batch of products
+
+        Args:
+            items: Scraped product dicts; later duplicates of a source URL win
+
+        Returns:
+            IngestResult: Counts for this batch
+        """
+        result = IngestResult()
+        rows = {}
+        for item in items:
+            try:
+                row = self._clean(item)
+            except (KeyError, TypeError, ValueError, InvalidOperation) as e:
+                logger.warning(f"Skipping product {item.get('source_url', 'Unknown')}: {str(e)}")
+                result.skipped += 1
+                continue
+            rows[row['source_key']] = row
+        # Repeats of a source URL within the batch are folded into one row
+        result.skipped += len(items) - result.skipped - len(rows)
+
+        if not rows:
+            return result
+
+        with transaction.atomic():
+            existing = {
+                current['source_key']: current
+                for current in Product.objects.filter(source_key__in=list(rows))
+                .values('source_key', 'category_id', *self.COMPARED_FIELDS)
+            }
+
+            # Split on whether the item set a category, so the upsert only
+            # overwrites the category of products whose item had one
+            to_write = {False: [], True: []}
+            reindex = []
+            category_deltas = Counter()
+            for key, row in rows.items():
+                current = existing.get(key)
+                categorised = 'category_id' in row
+                compared = self.COMPARED_FIELDS + (('category_id',) if categorised else ())
+                if current is None:
+                    result.created += 1
+                    category_deltas[row.get('category_id')] += 1
+                    reindex.append(key)
+                elif any(current[field] != row[field] for field in compared):
+                    result.updated += 1
+                    if categorised:
+                        category_deltas[current['category_id']] -= 1
+                        category_deltas[row['category_id']] += 1
+                    if any(current[field] != row[field] for field in self.TEXT_FIELDS):
+                        reindex.append(key)
+                else:
+                    result.unchanged += 1
+                    continue
+                to_write[categorised].append(Product(**row))
+
+            for categorised, products in to_write.items():
+                if products:
+                    Product.objects.bulk_create(
+                        products,
+                        update_conflicts=True,
+                        unique_fields=['source_key'],
+                        update_fields=self.UPDATE_FIELDS + (('category',) if categorised else ())
+                    )
+            if reindex:
+                search.index_products(list(
+                    Product.objects.filter(source_key__in=reindex).values_list('pk', flat=True)
+                ))
+            for category_id, delta in category_deltas.items():
+                Category.adjust_product_count(category_id, delta)
+
+        if any(to_write.values()):
+            bump_namespace('product')
+        if any(delta for category_id, delta in category_deltas.items() if category_id is not None):
+            bump_namespace(CATEGORY_TREE_NAMESPACE)
+        return result
+
+    def _clean(self, item: Dict) -> Dict:
+        source_url = item['source_url'].strip()
+        source_key = normalize_source_url(source_url)
+        # A key without a host ('/...') means the URL wasn't absolute
+        if source_key.startswith('/') or len(source_key) > Product._meta.get_field('source_key').max_length:
+            raise ValueError('unusable source URL')
+        row = {
+            'source_key': source_key,
+            'source_url': source_url,
+            'name': item['name'].strip(),
+            'description': item.get('description') or '',
+            'price': Decimal(str(item['price'])).quantize(Decimal('0.01')),
+            'stock': int(item.get('stock', 0)),
+            'image_url': item.get('image_url') or '',
+        }
+        if 'category' in item:
+            category = item['category']
+            row['category_id'] = category.pk if category is not None else None
+        elif 'category_id' in item:
+            row['category_id'] = item['category_id']
+        return row
+
+
+# Create a singleton instance
+product_ingest_service = ProductIngestService()
@@ -1,11 +1,19 @@
-from typing import Dict, List, Optional
-from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Optional, Sequence
+from decimal import Decimal, ROUND_CEILING, ROUND_HALF_UP
+import hashlib
+import numpy as np
 
 class OrderCalculator:
     FULFILLMENT_COMMISSION_RATE = Decimal('0.02')  # 2%
     BASE_SHIPPING_FEE = Decimal('5.99')  # Base shipping fee
     FREE_SHIPPING_THRESHOLD = Decimal('50.00')  # Free shipping over $50
 
+    @classmethod
+    def config_version(cls) -> str:
+        """Short hash of the fee constants; changes whenever any of them does"""
+        constants = (cls.FULFILLMENT_COMMISSION_RATE, cls.BASE_SHIPPING_FEE, cls.FREE_SHIPPING_THRESHOLD)
+        return hashlib.sha256('|'.join(map(str, constants)).encode()).hexdigest()[:16]
+
     @classmethod
     def calculate_order_totals(cls, 
                              subtotal: Decimal,
@@ -75,5 +83,109 @@ class OrderCalculator:
 
         return shipping_fee.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
+    @classmethod
+    def calculate_batch_totals(cls, subtotals: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Vectorized ``calculate_order_totals`` over many subtotals at once
+
+        Everything is in integer minor units (cents). The commission is
+        rounded half up with integer arithmetic, so each result equals the
+        scalar path's Decimal result times 100 exactly. The shipping
+        address has no effect on the fee yet, so it isn't taken here.
+
+        Args:
+            subtotals: Order subtotals in minor units
+
+        Returns:
+            Dict of int64 arrays: subtotal, fulfillment_commission,
+            shipping_fee and total, all in minor units
+        """
+        subtotals = np.asarray(subtotals, dtype=np.int64)
+        rate_numerator, rate_denominator = cls.FULFILLMENT_COMMISSION_RATE.as_integer_ratio()
+        # ROUND_HALF_UP rounds ties away from zero: round the magnitude, keep the sign
+        quotient, remainder = np.divmod(np.abs(subtotals) * rate_numerator, rate_denominator)
+        fulfillment_commission = np.sign(subtotals) * (quotient + (2 * remainder >= rate_denominator))
+
+        threshold = int((cls.FREE_SHIPPING_THRESHOLD * 100).to_integral_value(rounding=ROUND_CEILING))
+        base_fee = int((cls.BASE_SHIPPING_FEE * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+        shipping_fee = np.where(subtotals >= threshold, 0, base_fee).astype(np.int64)
+
+        return {
+            'subtotal': subtotals,
+            'fulfillment_commission': fulfillment_commission,
+            'shipping_fee': shipping_fee,
+            'total': subtotals + fulfillment_commission + shipping_fee,
+        }
+
+    @classmethod
+    def quote_carts(cls, carts: Iterable[List[Dict]]) -> Dict[str, np.ndarray]:
+        """
+        Quote many carts of ``{'price', 'quantity'}`` items in one pass
+
+        Args:
+            carts: Item lists, as passed to ``calculate_order_totals``
+
+        Returns:
+            ``calculate_batch_totals`` arrays, one entry per cart
+
+        Raises:
+            ValueError: If a price has fractions of a cent
+        """
+        minor_units: Dict = {}
+        prices = []
+        quantities = []
+        ends = []
+        for items in carts:
+            for item in items:
+                price = item['price']
+                if price not in minor_units:
+                    minor_units[price] = cls.to_minor_units([price])[0]
+                prices.append(minor_units[price])
+                quantities.append(item['quantity'])
+            ends.append(len(prices))
+
+        line_totals = np.asarray(prices, dtype=np.int64) * np.asarray(quantities, dtype=np.int64)
+        # Cart subtotals are differences of the running total at cart boundaries (empty carts give 0)
+        running = np.concatenate(([0], np.cumsum(line_totals, dtype=np.int64)))
+        ends = np.asarray(ends, dtype=np.int64)
+        starts = np.concatenate(([0], ends[:-1])).astype(np.int64)
+        return cls.calculate_batch_totals(running[ends] - running[starts])
+
+    @classmethod
+    def quote_matrix(cls, prices: Sequence, quantities) -> Dict[str, np.ndarray]:
+        """
+        Quote a product-by-quantity matrix: row i is cart i, column j is product j
+
+        Args:
+            prices: One price per product (column)
+            quantities: (carts x products) integer matrix
+
+        Returns:
+            ``calculate_batch_totals`` arrays, one entry per row
+        """
+        quantities = np.asarray(quantities, dtype=np.int64)
+        return cls.calculate_batch_totals(quantities @ cls.to_minor_units(prices))
+
+    @staticmethod
+    def to_minor_units(prices: Sequence) -> np.ndarray:
+        """
+        Convert prices to an int64 array of cents
+
+        Raises:
+            ValueError: If a price has fractions of a cent
+        """
+        minor_units = []
+        for price in prices:
+            cents = Decimal(str(price)) * 100
+            if cents != cents.to_integral_value():
+                raise ValueError(f"Price {price} has fractions of a cent")
+            minor_units.append(int(cents))
+        return np.asarray(minor_units, dtype=np.int64)
+
+    @staticmethod
+    def from_minor_units(value) -> Decimal:
+        """One minor-unit result as a Decimal amount, e.g. 3149 -> Decimal('31.49')"""
+        return Decimal(int(value)).scaleb(-2)
+
 # Create a singleton instance
 order_calculator = OrderCalculator() 
\ No newline at end of file
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+MONEY_FIELDS = ('subtotal', 'fulfillment_commission', 'shipping_fee', 'total')
+
+
+def quote_id_for(items: List[Dict], shipping_address: Optional[Dict], config_version: str) -> str:
+    """Content address of a quote: canonical JSON of the cart and address under one fee config"""
+    payload = json.dumps(
+        [config_version, items, shipping_address],
+        sort_keys=True, separators=(',', ':'), default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+class QuoteCache(ABC):
+    """
+    Content-addressed order summaries
+
+    A quote's id is the hash of its items, shipping address and the
+    ``OrderCalculator`` fee-config version, so an identical cart quoted
+    again is a cache hit and a change to the fee constants gives every
+    cart a new id. Each entry also records the fee-config version and the
+    cache generation it was stored under, and is only returned while both
+    are current: ``invalidate`` (called when FX rates change) moves to a
+    new generation, which drops every earlier quote. Entries expire
+    after ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl: int = 600):
+        self.ttl = ttl
+
+    def get(self, quote_id: str, config_version: str) -> Optional[Dict]:
+        """
+        A current quote by id
+
+        Args:
+            quote_id: Id from ``quote_id_for``
+            config_version: Current ``OrderCalculator.config_version()``
+
+        Returns:
+            Dict with items, shipping_address and summary, or None if the
+            quote expired or was invalidated
+        """
+        entry, generation = self._read(quote_id)
+        if entry is None:
+            return None
+        entry = json.loads(entry)
+        if entry['generation'] != generation or entry['config_version'] != config_version:
+            return None
+        for field in MONEY_FIELDS:
+            entry['summary'][field] = Decimal(entry['summary'][field])
+        return entry
+
+    def put(self, quote_id: str, items: List[Dict], shipping_address: Optional[Dict], summary: Dict,
+            config_version: str, generation: Optional[int] = None) -> None:
+        """
+        Store a quote
+
+        Args:
+            generation: Generation read before the summary was computed, so a
+                quote computed across an invalidation is stored already stale
+        """
+        entry = {
+            'items': items,
+            'shipping_address': shipping_address,
+            'summary': summary,
+            'config_version': config_version,
+            'generation': self.generation() if generation is None else generation,
+        }
+        self._write(quote_id, json.dumps(entry, default=str))
+
+    @abstractmethod
+    def generation(self) -> int:
+        """Current cache generation, moved on by ``invalidate``"""
+
+    @abstractmethod
+    def invalidate(self) -> None:
+        """Drop every stored quote"""
+
+    @abstractmethod
+    def _read(self, quote_id: str) -> Tuple[Optional[str], int]:
+        """The stored entry (or None) and the current generation"""
+
+    @abstractmethod
+    def _write(self, quote_id: str, entry: str) -> None:
+        """Store a serialized entry for ``ttl`` seconds"""
+
+
+class LocalQuoteCache(QuoteCache):
+    """
+    In-process quotes
+
+    A quote id issued by one worker process is unknown to the others, so
+    with several workers checkout needs the Redis cache. Expired entries
+    are purged on write, at most every ``purge_interval`` seconds.
+    """
+
+    def __init__(self, ttl: int = 600, purge_interval: float = 60):
+        super().__init__(ttl)
+        self.purge_interval = purge_interval
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[str, float]] = {}
+        self._generation = 0
+        self._next_purge = time.monotonic() + purge_interval
+
+    def generation(self) -> int:
+        return self._generation
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def _read(self, quote_id: str) -> Tuple[Optional[str], int]:
+        with self._lock:
+            entry = self._entries.get(quote_id)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._entries[quote_id]
+                entry = None
+            return (entry[0] if entry is not None else None), self._generation
+
+    def _write(self, quote_id: str, entry: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_purge:
+                # Entries are otherwise only dropped when their quote id is read again
+                self._entries = {key: value for key, value in self._entries.items() if value[1] > now}
+                self._next_purge = now + self.purge_interval
+            self._entries[quote_id] = (entry, now + self.ttl)
+
+
+class RedisQuoteCache(QuoteCache):
+    """
+    Quotes shared by the Flask and Django workers
+
+    A lookup reads the entry and the generation counter in one MGET;
+    invalidated entries are left to expire.
+    """
+
+    KEY_PREFIX = 'quote:'
+    GENERATION_KEY = 'quotes:generation'
+
+    def __init__(self, redis_url: str, ttl: int = 600):
+        super().__init__(ttl)
+        import redis
+        self.client = redis.Redis.from_url(redis_url)
+
+    def generation(self) -> int:
+        return int(self.client.get(self.GENERATION_KEY) or 0)
+
+    def invalidate(self) -> None:
+        self.client.incr(self.GENERATION_KEY)
+
+    def _read(self, quote_id: str) -> Tuple[Optional[str], int]:
+        entry, generation = self.client.mget(self.KEY_PREFIX + quote_id, self.GENERATION_KEY)
+        return entry, int(generation or 0)
+
+    def _write(self, quote_id: str, entry: str) -> None:
+        self.client.set(self.KEY_PREFIX + quote_id, entry, ex=self.ttl)
+
+
+def create_quote_cache() -> QuoteCache:
+    """Redis when REDIS_URL is set, in-process otherwise (the Flask app has no Django settings)"""
+    ttl = int(os.environ.get('QUOTE_CACHE_TTL', 600))
+    redis_url = os.environ.get('REDIS_URL')
+    if redis_url:
+        return RedisQuoteCache(redis_url, ttl=ttl)
+    return LocalQuoteCache(ttl=ttl)
+
+
+# Create a singleton instance
+quote_cache = create_quote_cache()
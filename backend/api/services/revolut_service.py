@@ -1,5 +1,9 @@
 from typing import Dict, List, Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import asyncio
+import itertools
+import weakref
+import httpx
 import requests
 from decimal import Decimal
 
@@ -19,6 +23,10 @@ class MerchantLockError(RevolutServiceError):
     """Raised when merchant locking fails"""
     pass
 
+class RevolutUnavailableError(RevolutServiceError):
+    """Raised when the API can't be reached, times out or fails with a server error"""
+    pass
+
 class APIResponse:
     """Standardized API response format"""
     def __init__(self, data: Dict, headers: Dict, status_code: int):
@@ -30,14 +38,26 @@ class RevolutService:
     API_VERSION = '2024-09-01'
     BASE_URL = 'https://api.revolut.com/business/v1'
     CARD_EXPIRY_HOURS = 24
+    # Async client pool: connections kept open between requests, spread over
+    # POOL_SHARDS clients because httpcore rescans every queued request against
+    # every connection of a pool, which gets quadratic under high concurrency
+    POOL_SHARDS = 8
+    POOL_LIMITS = httpx.Limits(max_connections=16, max_keepalive_connections=16, keepalive_expiry=30)
+    TIMEOUT = httpx.Timeout(10.0, connect=5.0)
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, base_url: Optional[str] = None):
         self.api_key = api_key
+        if base_url:
+            self.BASE_URL = base_url
         self.default_headers = {
             'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json',
             'Revolut-Api-Version': self.API_VERSION
         }
+        # AsyncClients per event loop: a client's connections belong to the loop that opened them
+        self._clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, List[httpx.AsyncClient]]' = \
+            weakref.WeakKeyDictionary()
+        self._next_client = itertools.count()
 
     def _validate_api_version(self, headers: Dict) -> None:
         """Validate the API version in the request headers"""
@@ -47,7 +67,7 @@ class RevolutService:
         if version != self.API_VERSION:
             raise InvalidAPIVersionError(f'Invalid API version. Expected {self.API_VERSION}, got {version}')
 
-    def _handle_response(self, response: requests.Response) -> APIResponse:
+    def _handle_response(self, response) -> APIResponse:
         """Handle API response and raise appropriate errors"""
         if response.status_code == 400:
             error_data = response.json()
@@ -57,7 +77,7 @@ class RevolutService:
         elif response.status_code == 404:
             raise CardNotFoundError('Card not found')
         elif response.status_code >= 500:
-            raise RevolutServiceError('Internal server error')
+            raise RevolutUnavailableError('Internal server error')
         
         return APIResponse(
             data=response.json(),
@@ -85,7 +105,7 @@ class RevolutService:
             result = self._handle_response(response)
             return result.data
         except requests.RequestException as e:
-            raise RevolutServiceError(f'Failed to create virtual card: {str(e)}')
+            raise RevolutUnavailableError(f'Failed to create virtual card: {str(e)}')
 
     def get_card(self, card_id: str) -> Dict:
         """Get card details"""
@@ -97,7 +117,7 @@ class RevolutService:
             result = self._handle_response(response)
             return result.data
         except requests.RequestException as e:
-            raise RevolutServiceError(f'Failed to get card: {str(e)}')
+            raise RevolutUnavailableError(f'Failed to get card: {str(e)}')
 
     def process_transaction(self, card_id: str, amount: int, merchant: str, description: str) -> Dict:
         """Process a transaction with the card"""
@@ -105,8 +125,10 @@ class RevolutService:
             # First verify the card exists and is not expired
             card = self.get_card(card_id)
             expiry_time = datetime.fromisoformat(card['expiry_time'].replace('Z', '+00:00'))
+            if expiry_time.tzinfo is None:
+                expiry_time = expiry_time.replace(tzinfo=timezone.utc)
             
-            if datetime.utcnow() > expiry_time:
+            if datetime.now(timezone.utc) > expiry_time:
                 raise RevolutServiceError('Card has expired')
 
             # Process the transaction
@@ -125,7 +147,7 @@ class RevolutService:
         except CardNotFoundError:
             raise
         except requests.RequestException as e:
-            raise RevolutServiceError(f'Failed to process transaction: {str(e)}')
+            raise RevolutUnavailableError(f'Failed to process transaction: {str(e)}')
 
     def get_transactions(self, card_id: Optional[str] = None, page: int = 1, limit: int = 10) -> Dict:
         """Get transaction history with pagination"""
@@ -145,7 +167,74 @@ class RevolutService:
             result = self._handle_response(response)
             return result.data
         except requests.RequestException as e:
-            raise RevolutServiceError(f'Failed to get transactions: {str(e)}')
+            raise RevolutUnavailableError(f'Failed to get transactions: {str(e)}')
+
+    def _client(self) -> httpx.AsyncClient:
+        """A shared keep-alive client for the running event loop, round-robin over the pool shards"""
+        loop = asyncio.get_running_loop()
+        clients = self._clients.get(loop)
+        if clients is None:
+            clients = self._clients[loop] = [None] * self.POOL_SHARDS
+        shard = next(self._next_client) % self.POOL_SHARDS
+        client = clients[shard]
+        if client is None or client.is_closed:
+            client = clients[shard] = httpx.AsyncClient(
+                base_url=self.BASE_URL,
+                headers=self.default_headers,
+                limits=self.POOL_LIMITS,
+                timeout=self.TIMEOUT
+            )
+        return client
+
+    async def aget_card(self, card_id: str) -> Dict:
+        """Get card details (async, pooled connection)"""
+        try:
+            response = await self._client().get(f'/cards/{card_id}')
+            return self._handle_response(response).data
+        except httpx.HTTPError as e:
+            raise RevolutUnavailableError(f'Failed to get card: {str(e)}')
+
+    async def avalidate_card(self, card_id: str) -> Dict:
+        """Get a card and check it hasn't expired"""
+        card = await self.aget_card(card_id)
+        expiry_time = datetime.fromisoformat(card['expiry_time'].replace('Z', '+00:00'))
+        if expiry_time.tzinfo is None:
+            expiry_time = expiry_time.replace(tzinfo=timezone.utc)
+        if datetime.now(timezone.utc) > expiry_time:
+            raise RevolutServiceError('Card has expired')
+        return card
+
+    async def aprocess_transaction(self,
+                                   card_id: str,
+                                   amount: int,
+                                   merchant: str,
+                                   description: str,
+                                   card: Optional[Dict] = None) -> Dict:
+        """
+        Process a transaction with the card (async, pooled connection)
+        
+        Args:
+            card: Result of ``avalidate_card`` when the caller already
+                validated the card; validated here otherwise
+        """
+        if card is None:
+            await self.avalidate_card(card_id)
+        try:
+            response = await self._client().post('/transactions', json={
+                'card_id': card_id,
+                'amount': amount,
+                'merchant': merchant,
+                'description': description
+            })
+            return self._handle_response(response).data
+        except httpx.HTTPError as e:
+            raise RevolutUnavailableError(f'Failed to process transaction: {str(e)}')
+
+    async def aclose(self) -> None:
+        """Close the running loop's clients and their pooled connections"""
+        for client in self._clients.pop(asyncio.get_running_loop(), []):
+            if client is not None:
+                await client.aclose()
 
 # Create a singleton instance
 revolut_service = RevolutService(api_key='test-api-key')  # Replace with actual API key from environment 
\ No newline at end of file
@@ -0,0 +1,229 @@
+import logging
+import random
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+from ..caching import bump_namespace
+from ..models import OrderItem, Product
+
+logger = logging.getLogger(__name__)
+
+AVAILABLE_KEY = 'stock_reservations:available:{}:{}'
+HELD_KEY = 'stock_reservations:held:{}:{}'
+HOLD_KEY = 'stock_reservations:hold:{}:{}'
+RECONCILE_LOCK_KEY = 'stock_reservations:reconcile'
+
+
+class StockReservationService:
+    """
+    Time-limited stock holds for flash-sale products (``Product.reserve_stock``)
+
+    Carting a product takes units from a counter in the cache instead of
+    checking ``Product.stock``; each counter is split into shards so hot
+    products don't serialize on one key. A hold lasts ``ttl`` seconds and
+    checkout confirms it: the order items are written with
+    ``stock_pending`` and the database stock is brought down by
+    ``reconcile``, which runs periodically and also resets the shards to
+    stock - pending - held.
+
+    Holds are also counted per minute they were placed in, so expired and
+    released holds simply stop being counted and their units come back
+    at the next reconciliation. Shards are only ever raised by
+    ``reconcile``, and every step is ordered so a race leaves fewer
+    units on offer than there are, never more.
+    """
+
+    def __init__(self, ttl: Optional[int] = None, shards: Optional[int] = None, bucket_seconds: int = 60):
+        self.ttl = ttl or settings.STOCK_RESERVATION_TTL
+        self.shards = shards or settings.STOCK_RESERVATION_SHARDS
+        self.bucket_seconds = bucket_seconds
+
+    def reserve(self, user_id: int, product_id: int, quantity: int) -> bool:
+        """
+        Hold ``quantity`` units of a product for a user, replacing any earlier hold
+
+        Args:
+            user_id: Cart owner
+            product_id: Product to hold
+            quantity: Total units the user's cart needs
+
+        Returns:
+            bool: Whether the units are held; the earlier hold is kept if not
+        """
+        hold_key = HOLD_KEY.format(user_id, product_id)
+        hold: Optional[Tuple[int, int]] = cache.get(hold_key)
+        held = hold[0] if hold is not None else 0
+        bucket = self._bucket(time.time())
+        keys = self._shard_keys(product_id)
+        if not cache.get_many(keys):
+            self._rebalance([product_id], fill_only=True)
+
+        # Counted as held before it is taken, so a reconciliation in between
+        # can only under-count what is available
+        self._add_held(product_id, bucket, quantity)
+        if quantity > held and not self._take(keys, quantity - held):
+            self._add_held(product_id, bucket, -quantity)
+            return False
+        if hold is not None:
+            self._add_held(product_id, hold[1], -hold[0])
+        cache.set(hold_key, (quantity, bucket), self.ttl)
+        return True
+
+    def confirm(self, user_id: int, quantities: Dict[int, int]) -> List[int]:
+        """
+        Make sure the user holds every quantity, re-reserving expired or short holds
+
+        Args:
+            user_id: Cart owner
+            quantities: Product id -> units being ordered
+
+        Returns:
+            List[int]: Products that couldn't be held
+        """
+        holds = cache.get_many([HOLD_KEY.format(user_id, pk) for pk in quantities])
+        short = []
+        for product_id, quantity in quantities.items():
+            hold = holds.get(HOLD_KEY.format(user_id, product_id))
+            if (hold is None or hold[0] < quantity) and not self.reserve(user_id, product_id, quantity):
+                short.append(product_id)
+        return sorted(short)
+
+    def release(self, user_id: int, product_ids: Iterable[int]) -> None:
+        """Drop the user's holds; the units are back on offer after the next reconciliation"""
+        keys = {HOLD_KEY.format(user_id, pk): pk for pk in product_ids}
+        holds = cache.get_many(list(keys))
+        if not holds:
+            return
+        cache.delete_many(list(holds))
+        for key, (quantity, bucket) in holds.items():
+            self._add_held(keys[key], bucket, -quantity)
+
+    def reconcile(self) -> int:
+        """
+        Apply sold reservations to the database and reset the counters from it
+
+        Returns:
+            int: Number of order items applied to product stock
+        """
+        if not cache.add(RECONCILE_LOCK_KEY, 1, 60):
+            return 0
+        try:
+            applied = self._apply_pending()
+            self._rebalance(list(Product.objects.filter(reserve_stock=True).values_list('pk', flat=True)))
+            return applied
+        finally:
+            cache.delete(RECONCILE_LOCK_KEY)
+
+    def _bucket(self, now: float) -> int:
+        return int(now // self.bucket_seconds)
+
+    def _add_held(self, product_id: int, bucket: int, quantity: int) -> None:
+        key = HELD_KEY.format(product_id, bucket)
+        try:
+            cache.incr(key, quantity)
+        except ValueError:
+            # The bucket has aged out; nothing to take back from it
+            if quantity > 0 and not cache.add(key, quantity, self.ttl + 3 * self.bucket_seconds):
+                cache.incr(key, quantity)
+
+    def _held(self, product_ids: List[int]) -> Dict[int, int]:
+        """Units held per product, counting a hold for up to a minute after it expires"""
+        now = time.time()
+        # One extra bucket of grace covers a checkout confirmed just before expiry
+        buckets = range(self._bucket(now - self.ttl) - 1, self._bucket(now) + 1)
+        counts = cache.get_many([HELD_KEY.format(pk, b) for pk in product_ids for b in buckets])
+        held = Counter()
+        for pk in product_ids:
+            held[pk] = sum(counts.get(HELD_KEY.format(pk, b), 0) for b in buckets)
+        return held
+
+    def _shard_keys(self, product_id: int) -> List[str]:
+        return [AVAILABLE_KEY.format(product_id, shard) for shard in range(self.shards)]
+
+    def _take(self, keys: List[str], quantity: int) -> bool:
+        """Take units from the shards, starting at a random one; all or nothing"""
+        start = random.randrange(self.shards)
+        taken = []
+        remaining = quantity
+        for key in keys[start:] + keys[:start]:
+            try:
+                left = cache.decr(key, remaining)
+            except ValueError:
+                # Evicted shard: empty until the next reconciliation
+                continue
+            # Overdrawn: keep what the shard had and give back the rest
+            got = min(remaining, max(remaining + left, 0))
+            if got < remaining:
+                cache.incr(key, remaining - got)
+            if got:
+                taken.append((key, got))
+                remaining -= got
+            if not remaining:
+                return True
+        for key, got in taken:
+            cache.incr(key, got)
+        return False
+
+    def _apply_pending(self) -> int:
+        with transaction.atomic():
+            pending = list(
+                OrderItem.objects.select_for_update().filter(stock_pending=True)
+                .values_list('pk', 'product_id', 'quantity')
+            )
+            if not pending:
+                return 0
+            sold = Counter()
+            for _, product_id, quantity in pending:
+                sold[product_id] += quantity
+            quantity = Case(
+                *[When(pk=pk, then=Value(qty)) for pk, qty in sold.items()],
+                output_field=IntegerField()
+            )
+            Product.objects.filter(pk__in=list(sold)).update(
+                stock=F('stock') - quantity, updated_at=timezone.now()
+            )
+            OrderItem.objects.filter(pk__in=[pk for pk, _, _ in pending]).update(stock_pending=False)
+            transaction.on_commit(lambda: bump_namespace('product'))
+        logger.info(f"Applied {len(pending)} reserved order items to stock of {len(sold)} products")
+        return len(pending)
+
+    def _rebalance(self, product_ids: List[int], fill_only: bool = False) -> None:
+        """
+        Set each product's shards to an even split of stock - pending - held
+
+        The shards are read first, then the holds, then the database: a
+        reservation counts itself as held before taking from a shard and a
+        checkout writes its pending items before dropping the hold, so
+        any interleaving counts a unit twice rather than not at all.
+        """
+        if not product_ids:
+            return
+        keys = {pk: self._shard_keys(pk) for pk in product_ids}
+        current = cache.get_many([key for shard_keys in keys.values() for key in shard_keys])
+        held = self._held(product_ids)
+        rows = (
+            Product.objects.filter(pk__in=product_ids)
+            .annotate(pending=Sum('orderitem__quantity', filter=Q(orderitem__stock_pending=True)))
+            .values_list('pk', 'stock', 'pending')
+        )
+        for product_id, stock, pending in rows:
+            available = max(stock - (pending or 0) - held[product_id], 0)
+            share, extra = divmod(available, self.shards)
+            for shard, key in enumerate(keys[product_id]):
+                target = share + (1 if shard < extra else 0)
+                if key not in current:
+                    cache.add(key, target, None)
+                elif not fill_only:
+                    # A negative shard is mid-overdraw and settles at zero
+                    delta = target - max(current[key], 0)
+                    if delta:
+                        cache.incr(key, delta)
+
+
+# Create a singleton instance
+stock_reservations = StockReservationService()
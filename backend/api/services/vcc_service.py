@@ -4,7 +4,7 @@ from decimal import Decimal
 import requests
 from datetime import datetime, timedelta
 from django.conf import settings
-from .fx import fx_service
+from .fx import InsufficientBalanceError as FXInsufficientBalanceError, fx_service
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +24,10 @@ class CardNotFoundError(VCCServiceError):
     """Raised when card is not found"""
     pass
 
+class ProviderUnavailableError(VCCServiceError):
+    """Raised when the Revolut API can't be reached, times out or fails with a server error"""
+    pass
+
 class VCCService:
     """Service for managing virtual credit cards with Revolut"""
     
@@ -55,7 +59,7 @@ class VCCService:
         elif response.status_code == 403:
             raise VCCServiceError('Insufficient permissions')
         elif response.status_code >= 500:
-            raise VCCServiceError('Revolut API error')
+            raise ProviderUnavailableError('Revolut API error')
         
         try:
             return response.json()
@@ -89,39 +93,35 @@ class VCCService:
         Raises:
             VCCServiceError: If card creation fails
             InsufficientBalanceError: If insufficient USD balance
+            ProviderUnavailableError: If Revolut can't be reached or fails
         """
         try:
             # Validate merchant
             merchant_details = self._validate_merchant(merchant)
             
-            # Check Payoneer USD balance
-            usd_balance = fx_service.get_usd_balance()
-            if amount > usd_balance:
-                raise InsufficientBalanceError(
-                    f"Insufficient USD balance. Required: {amount}, Available: {usd_balance}"
-                )
-            
             # Calculate expiry (24 hours from now)
             expiry = datetime.utcnow() + timedelta(hours=24)
             
-            # Create virtual card
-            response = requests.post(
-                f'{self.BASE_URL}/cards',
-                headers=self.default_headers,
-                json={
-                    'type': 'virtual',
-                    'currency': 'USD',
-                    'limit': str(amount),
-                    'expiry_date': expiry.isoformat(),
-                    'merchant_restrictions': {
-                        'merchant_id': merchant_details['merchant_id'],
-                        'category': merchant_details['category']
-                    },
-                    'description': description or f"VCC for {merchant_details['name']}"
-                }
-            )
-            
-            data = self._handle_response(response)
+            # Hold the card limit on the local USD ledger instead of asking Payoneer
+            with fx_service.hold_usd(amount, reference=f"vcc:{merchant_details['name']}") as hold:
+                response = requests.post(
+                    f'{self.BASE_URL}/cards',
+                    headers=self.default_headers,
+                    json={
+                        'type': 'virtual',
+                        'currency': 'USD',
+                        'limit': str(amount),
+                        'expiry_date': expiry.isoformat(),
+                        'merchant_restrictions': {
+                            'merchant_id': merchant_details['merchant_id'],
+                            'category': merchant_details['category']
+                        },
+                        'description': description or f"VCC for {merchant_details['name']}"
+                    }
+                )
+                
+                data = self._handle_response(response)
+                hold.reference = f"vcc:{data['id']}"
             
             # Log card creation
             logger.info(
@@ -139,8 +139,12 @@ class VCCService:
                 'limit': amount
             }
             
-        except InsufficientBalanceError:
+        except FXInsufficientBalanceError as e:
+            raise InsufficientBalanceError(str(e))
+        except ProviderUnavailableError:
             raise
+        except requests.RequestException as e:
+            raise ProviderUnavailableError(f"Failed to create virtual card: {str(e)}")
         except Exception as e:
             raise CardCreationError(f"Failed to create virtual card: {str(e)}")
 
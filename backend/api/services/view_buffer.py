@@ -0,0 +1,188 @@
+import atexit
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from ..models import Product, UserActivity
+
+logger = logging.getLogger(__name__)
+
+# (user_id, product_id) pairs waiting to become UserActivity rows
+ActivityBatch = List[Tuple[int, int]]
+
+
+class ViewBuffer(ABC):
+    """
+    Write-behind buffer for product detail views
+
+    Views are recorded in memory or Redis and periodically flushed to the
+    database as one F()-based counter UPDATE and one activity bulk_create
+    per batch, so page views never wait on database writes.
+    """
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+
+    @abstractmethod
+    def record(self, product_id: int, user_id: int) -> None:
+        """Buffer a single product view"""
+
+    @abstractmethod
+    def drain(self) -> Tuple[Dict[int, int], ActivityBatch]:
+        """Atomically take up to one batch of buffered views"""
+
+    @abstractmethod
+    def requeue(self, counts: Dict[int, int], activities: ActivityBatch) -> None:
+        """Put a drained batch back after a failed flush"""
+
+    def flush(self) -> int:
+        """
+        Write all buffered views to the database
+
+        Returns:
+            int: Number of views flushed
+        """
+        flushed = 0
+        while True:
+            counts, activities = self.drain()
+            if not counts and not activities:
+                return flushed
+            try:
+                self._apply(counts, activities)
+            except Exception:
+                self.requeue(counts, activities)
+                raise
+            flushed += sum(counts.values())
+
+    def _apply(self, counts: Dict[int, int], activities: ActivityBatch) -> None:
+        product_ids = set(counts) | {product_id for _, product_id in activities}
+        with transaction.atomic():
+            # Products deleted since the view was buffered are skipped
+            existing = set(
+                Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True)
+            )
+            if counts:
+                increment = Case(
+                    *[When(pk=pk, then=Value(count)) for pk, count in counts.items() if pk in existing],
+                    default=Value(0),
+                    output_field=IntegerField()
+                )
+                Product.objects.filter(pk__in=existing & set(counts)).update(
+                    views_count=F('views_count') + increment
+                )
+            UserActivity.objects.bulk_create([
+                UserActivity(user_id=user_id, product_id=product_id, activity_type='view')
+                for user_id, product_id in activities
+                if product_id in existing
+            ], batch_size=self.batch_size)
+
+
+class LocalViewBuffer(ViewBuffer):
+    """
+    In-process buffer, flushed by a per-process background thread
+
+    Each worker process drains its own buffer, so no shared store is needed.
+    """
+
+    def __init__(self, batch_size: int = 1000, flush_interval: float = 10):
+        super().__init__(batch_size)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counts: Counter = Counter()
+        self._activities: ActivityBatch = []
+        self._flusher: Optional[threading.Thread] = None
+
+    def record(self, product_id: int, user_id: int) -> None:
+        with self._lock:
+            self._counts[product_id] += 1
+            self._activities.append((user_id, product_id))
+            if self._flusher is None and self.flush_interval > 0:
+                self._start_flusher()
+
+    def drain(self) -> Tuple[Dict[int, int], ActivityBatch]:
+        with self._lock:
+            counts, self._counts = dict(self._counts), Counter()
+            activities = self._activities[:self.batch_size]
+            del self._activities[:self.batch_size]
+        return counts, activities
+
+    def requeue(self, counts: Dict[int, int], activities: ActivityBatch) -> None:
+        with self._lock:
+            self._counts.update(counts)
+            self._activities[:0] = activities
+
+    def _start_flusher(self) -> None:
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(self.flush_interval):
+                self._safe_flush()
+
+        self._flusher = threading.Thread(target=run, name='view-buffer-flush', daemon=True)
+        self._flusher.start()
+        atexit.register(lambda: (stop.set(), self._safe_flush()))
+
+    def _safe_flush(self) -> None:
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Product view flush failed: {str(e)}")
+
+
+class RedisViewBuffer(ViewBuffer):
+    """Redis-backed buffer shared by all workers and drained by Celery"""
+
+    COUNTS_KEY = 'product_views:counts'
+    ACTIVITY_KEY = 'product_views:activity'
+
+    def __init__(self, redis_url: str, batch_size: int = 1000):
+        super().__init__(batch_size)
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url)
+
+    def record(self, product_id: int, user_id: int) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hincrby(self.COUNTS_KEY, product_id, 1)
+        pipe.rpush(self.ACTIVITY_KEY, json.dumps([user_id, product_id]))
+        pipe.execute()
+
+    def drain(self) -> Tuple[Dict[int, int], ActivityBatch]:
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hgetall(self.COUNTS_KEY)
+        pipe.delete(self.COUNTS_KEY)
+        pipe.lrange(self.ACTIVITY_KEY, 0, self.batch_size - 1)
+        pipe.ltrim(self.ACTIVITY_KEY, self.batch_size, -1)
+        raw_counts, _, raw_activities, _ = pipe.execute()
+        counts = {int(pk): int(count) for pk, count in raw_counts.items()}
+        activities = [tuple(json.loads(item)) for item in raw_activities]
+        return counts, activities
+
+    def requeue(self, counts: Dict[int, int], activities: ActivityBatch) -> None:
+        pipe = self.client.pipeline(transaction=True)
+        for pk, count in counts.items():
+            pipe.hincrby(self.COUNTS_KEY, pk, count)
+        if activities:
+            pipe.lpush(self.ACTIVITY_KEY, *[json.dumps(list(item)) for item in reversed(activities)])
+        pipe.execute()
+
+
+def create_view_buffer() -> ViewBuffer:
+    """Build the buffer configured by VIEW_BUFFER_BACKEND ('local' or 'redis')"""
+    backend = getattr(settings, 'VIEW_BUFFER_BACKEND', 'local')
+    batch_size = getattr(settings, 'VIEW_BUFFER_BATCH_SIZE', 1000)
+    if backend == 'redis':
+        return RedisViewBuffer(settings.VIEW_BUFFER_REDIS_URL, batch_size=batch_size)
+    return LocalViewBuffer(
+        batch_size=batch_size,
+        flush_interval=getattr(settings, 'VIEW_BUFFER_FLUSH_INTERVAL', 10)
+    )
+
+
+# Create a singleton instance
+view_buffer = create_view_buffer()
@@ -0,0 +1,91 @@
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from . import search
+from .caching import bump_namespace
+from .category_tree import CATEGORY_TREE_NAMESPACE, ancestor_ids
+from .models import Category, Product, Review
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, update_fields=None, **kwargs):
+    """Keep the full-text index in sync with product text"""
+    if update_fields is not None and not set(update_fields) & set(search.INDEXED_FIELDS):
+        return
+    search.index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """Drop deleted products from the full-text index"""
+    search.remove_products([instance.pk])
+
+
+def _saves_category(instance, update_fields) -> bool:
+    # Deferred categories aren't written by save()
+    if 'category_id' not in instance.__dict__:
+        return False
+    return update_fields is None or 'category' in update_fields
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_category(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Note which category a saved product is leaving"""
+    if raw or instance._state.adding or not _saves_category(instance, update_fields):
+        return
+    if not hasattr(instance, '_loaded_category_id'):
+        instance._loaded_category_id = (
+            Product.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Product)
+def count_product_in_category(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Keep the stored category product counts in step with product saves"""
+    if raw or not _saves_category(instance, update_fields):
+        return
+    previous = None if created else instance._loaded_category_id
+    if previous != instance.category_id:
+        Category.adjust_product_count(previous, -1)
+        Category.adjust_product_count(instance.category_id, 1)
+        bump_namespace(CATEGORY_TREE_NAMESPACE)
+    instance._loaded_category_id = instance.category_id
+
+
+@receiver(post_delete, sender=Product)
+def uncount_deleted_product(sender, instance, **kwargs):
+    category_id = instance.__dict__.get('category_id')
+    if category_id is not None:
+        Category.adjust_product_count(category_id, -1)
+        bump_namespace(CATEGORY_TREE_NAMESPACE)
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_count(sender, instance, **kwargs):
+    # The instance being deleted may have been loaded before its counts moved
+    instance._stored_tree = Category.objects.filter(pk=instance.pk).values_list('path', 'product_count').first()
+
+
+@receiver(post_delete, sender=Category)
+def uncount_deleted_category(sender, instance, **kwargs):
+    """
+    A deleted category's products are uncategorised; take them off the
+    surviving ancestors (cascaded subcategories each remove their own)
+    """
+    path, product_count = getattr(instance, '_stored_tree', None) or (instance.path, instance.product_count)
+    if product_count and path:
+        Category.objects.filter(pk__in=ancestor_ids(path)[:-1]).update(
+            subtree_product_count=F('subtree_product_count') - product_count,
+            updated_at=timezone.now()
+        )
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Review)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_catalog_caches(sender, **kwargs):
+    """Bump the cache namespace of whatever catalog model changed"""
+    bump_namespace(sender._meta.model_name)
+    if sender is Category:
+        bump_namespace(CATEGORY_TREE_NAMESPACE)
@@ -1,5 +1,8 @@
 from celery import shared_task
 from django.core.management import call_command
+from .services.cart_store import cart_store
+from .services.stock_reservations import stock_reservations
+from .services.view_buffer import view_buffer
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,4 +16,62 @@ def process_orders():
         logger.info("Order processing task completed successfully")
     except Exception as e:
         logger.error(f"Order processing task failed: {str(e)}")
-        raise 
\ No newline at end of file
+        raise 
+
+@shared_task
+def flush_product_views():
+    """Drain buffered product views into view counters and activity rows"""
+    try:
+        flushed = view_buffer.flush()
+        if flushed:
+            logger.info(f"Flushed {flushed} buffered product views")
+    except Exception as e:
+        logger.error(f"Product view flush failed: {str(e)}")
+        raise
+
+@shared_task
+def flush_carts():
+    """Write carts changed in the cart store to the Cart/CartItem tables"""
+    try:
+        flushed = cart_store.flush()
+        if flushed:
+            logger.info(f"Flushed {flushed} carts")
+    except Exception as e:
+        logger.error(f"Cart flush failed: {str(e)}")
+        raise
+
+@shared_task
+def reconcile_stock_reservations():
+    """Apply sold reservations to product stock and reset the reservation counters"""
+    try:
+        applied = stock_reservations.reconcile()
+        if applied:
+            logger.info(f"Applied {applied} reserved order items to stock")
+    except Exception as e:
+        logger.error(f"Stock reservation reconciliation failed: {str(e)}")
+        raise
+
+@shared_task
+def refresh_fx_rate():
+    """Refresh the NGN→USD rate ahead of its expiry so checkout is never the one fetching it"""
+    # Imported here: the FX service reads the Payoneer credentials at import time
+    from .services.fx import fx_service
+    try:
+        if fx_service.refresh_rate():
+            stats = fx_service.get_rate_stats()
+            logger.info(f"Refreshed FX rate in {stats['last_refresh_ms']:.1f}ms")
+    except Exception as e:
+        logger.error(f"FX rate refresh failed: {str(e)}")
+        raise
+
+@shared_task
+def reconcile_usd_balance():
+    """Reset the local USD ledger to the Payoneer balance and settle recorded debits"""
+    # Imported here: the FX service reads the Payoneer credentials at import time
+    from .services.fx import fx_service
+    try:
+        available = fx_service.reconcile_usd_balance()
+        logger.info(f"Reconciled USD ledger, {available} available")
+    except Exception as e:
+        logger.error(f"USD balance reconciliation failed: {str(e)}")
+        raise
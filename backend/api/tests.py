@@ -1,12 +1,58 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
-from .models import Product
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from unittest.mock import patch
+from django.db import close_old_connections, connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from .models import (
+    BalanceEntry, BalanceLedger, Cart, CartItem, Category, FXTransaction, Order, OrderItem, Product, Review,
+    UserActivity, Wishlist, normalize_source_url
+)
+from .caching import bump_namespace, get_response_cache_stats
+from .fast_serializers import compile_serializer
+from .fieldsets import prune_fields
+from .payments import FlutterwaveUnavailableError
+from .renderers import MessagePackRenderer, ORJSONRenderer
+from .serializers import CartItemSerializer, ProductSerializer, UserActivitySerializer
+from .services.balance_ledger import (
+    BalanceLedgerService, InsufficientFundsError, LedgerNotReconciledError
+)
+from .services.cart_checkout import CartCheckoutService, InsufficientStockError
+from .services.cart_store import LocalCartStore
+from .services.idempotency import IdempotencyService, LocalIdempotencyStore
+from .services.stock_reservations import StockReservationService, stock_reservations
+from .services.ingest import IngestResult, ProductIngestService
+from .services.view_buffer import LocalViewBuffer
+from datetime import datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
+from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipUnless
+import base64
+import csv
+import json
+import msgpack
+import threading
+import time
+from types import SimpleNamespace
 
 User = get_user_model()
 
+class LocalCartStoreMixin:
+    """Serve cart views from a fresh in-process cart store that only flushes when told to"""
+
+    def use_local_cart_store(self) -> LocalCartStore:
+        self.store = LocalCartStore(flush_interval=0)
+        patcher = patch('api.views.cart_store', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return self.store
+
 class ProductModelTest(TestCase):
     def setUp(self):
         self.product = Product.objects.create(
@@ -66,7 +112,7 @@ class ProductAPITest(APITestCase):
     def test_get_products(self):
         response = self.client.get('/api/products/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_get_single_product(self):
         response = self.client.get(f'/api/products/{self.product.id}/')
@@ -136,4 +182,1591 @@ class AuthenticationAPITest(APITestCase):
         self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
         response = self.client.get('/api/auth/me/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data['email'], self.user_data['email']) 
\ No newline at end of file
+        self.assertEqual(response.data['email'], self.user_data['email']) 
+class ProductSearchTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='search@example.com',
+            username='searchuser',
+            password='testpass123',
+            name='Search User'
+        )
+        self.client.force_authenticate(user=self.user)
+        # Created first, so the default newest-first order would list it last
+        self.mouse = Product.objects.create(
+            name='Wireless Mouse',
+            description='Ergonomic mouse',
+            price=Decimal('29.99'),
+            stock=50,
+            image_url='https://example.com/mouse.jpg',
+            source_url='https://example.com/mouse'
+        )
+        self.laptop = Product.objects.create(
+            name='Gaming Laptop',
+            description='Fast laptop with a wireless mouse',
+            price=Decimal('1299.99'),
+            stock=5,
+            image_url='https://example.com/laptop.jpg',
+            source_url='https://example.com/laptop'
+        )
+
+    def search(self, text):
+        response = self.client.get('/api/products/', {'search': text})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in response.data['results']]
+
+    def test_results_are_ranked_by_relevance(self):
+        # A name hit outranks a description-only hit
+        self.assertEqual(self.search('wireless'), [self.mouse.id, self.laptop.id])
+
+    def test_ranked_results_page_by_relevance(self):
+        first = self.client.get('/api/products/', {'search': 'wireless', 'page_size': 1})
+        second = self.client.get(first.data['next'])
+        self.assertEqual(first.data['results'][0]['id'], self.mouse.id)
+        self.assertEqual(second.data['results'][0]['id'], self.laptop.id)
+        self.assertIsNone(second.data['next'])
+
+    def test_all_terms_must_match_with_prefixes(self):
+        self.assertEqual(self.search('gam lap'), [self.laptop.id])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.mouse.name = 'Bluetooth Trackpad'
+        self.mouse.description = 'Multi-touch trackpad'
+        self.mouse.save()
+        self.assertEqual(self.search('trackpad'), [self.mouse.id])
+        self.assertEqual(self.search('mouse'), [self.laptop.id])
+
+        self.mouse.delete()
+        self.assertEqual(self.search('trackpad'), [])
+
+class ProductRatingAggregateTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='rater@example.com',
+            username='rater',
+            password='testpass123',
+            name='Rater'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(
+            name='Rated Product',
+            description='Test Description',
+            price=Decimal('10.00'),
+            stock=10,
+            image_url='https://example.com/image.jpg',
+            source_url='https://example.com/rated'
+        )
+        self.reviews_url = f'/api/products/{self.product.id}/reviews/'
+
+    def assertAggregates(self, rating_sum, review_count, avg_rating):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_sum, rating_sum)
+        self.assertEqual(self.product.review_count, review_count)
+        self.assertAlmostEqual(self.product.avg_rating, avg_rating)
+
+    def test_review_lifecycle_updates_aggregates(self):
+        response = self.client.post(self.reviews_url, {
+            'product': self.product.id, 'rating': 4, 'comment': 'Good'
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertAggregates(4, 1, 4.0)
+
+        other = User.objects.create_user(
+            email='other@example.com', username='other', password='testpass123', name='Other'
+        )
+        Review.objects.create(product=self.product, user=other, rating=1, comment='Bad')
+        Product.apply_review_delta(self.product.id, 1, 1)
+        self.assertAggregates(5, 2, 2.5)
+
+        review_id = response.data['id']
+        response = self.client.patch(f'{self.reviews_url}{review_id}/', {'rating': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertAggregates(3, 2, 1.5)
+
+        response = self.client.delete(f'{self.reviews_url}{review_id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertAggregates(1, 1, 1.0)
+
+    def test_min_rating_filter_uses_stored_average(self):
+        Product.apply_review_delta(self.product.id, 9, 2)
+        response = self.client.get('/api/products/', {'min_rating': '4.5'})
+        self.assertEqual([item['id'] for item in response.data['results']], [self.product.id])
+        response = self.client.get('/api/products/', {'min_rating': '4.6'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_backfill_recomputes_from_reviews(self):
+        Review.objects.create(product=self.product, user=self.user, rating=5, comment='Great')
+        call_command('backfill_rating_aggregates', chunk_size=1, stdout=StringIO())
+        self.assertAggregates(5, 1, 5.0)
+
+class ProductViewBufferTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='viewer@example.com',
+            username='viewer',
+            password='testpass123',
+            name='Viewer'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(
+            name='Viewed Product',
+            description='Test Description',
+            price=Decimal('10.00'),
+            stock=10,
+            image_url='https://example.com/image.jpg',
+            source_url='https://example.com/viewed'
+        )
+        self.buffer = LocalViewBuffer(flush_interval=0)
+        patcher = patch('api.views.view_buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def view(self):
+        response = self.client.get(f'/api/products/{self.product.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_views_are_written_on_flush(self):
+        self.view()
+        self.view()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.views_count, 0)
+        self.assertFalse(UserActivity.objects.exists())
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.views_count, 2)
+        self.assertEqual(UserActivity.objects.filter(activity_type='view', product=self.product).count(), 2)
+
+    def test_failed_flush_requeues_views(self):
+        self.view()
+        with patch.object(self.buffer, '_apply', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.views_count, 1)
+
+class ProductPaginationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='pager@example.com',
+            username='pager',
+            password='testpass123',
+            name='Pager'
+        )
+        self.client.force_authenticate(user=self.user)
+        # Repeated prices exercise the (price, id) tie-breaker
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}',
+                description='Paged product',
+                price=Decimal('10.00') + (i % 3),
+                stock=1,
+                image_url='https://example.com/image.jpg',
+                source_url=f'https://example.com/paged/{i}'
+            )
+            for i in range(7)
+        ]
+
+    def walk(self, params):
+        ids = []
+        response = self.client.get('/api/products/', params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(item['id'] for item in response.data['results'])
+            if not response.data['next']:
+                return ids, response
+            response = self.client.get(response.data['next'])
+
+    def test_default_order_is_newest_first(self):
+        ids, _ = self.walk({'page_size': 3})
+        self.assertEqual(ids, [p.id for p in reversed(self.products)])
+
+    def test_price_order_breaks_ties_on_id(self):
+        ids, _ = self.walk({'page_size': 2, 'ordering': 'price'})
+        expected = sorted(self.products, key=lambda p: (p.price, p.id))
+        self.assertEqual(ids, [p.id for p in expected])
+
+    def test_previous_link_returns_prior_page(self):
+        first = self.client.get('/api/products/', {'page_size': 3, 'ordering': '-price'})
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get('/api/products/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tampered_cursor_value_is_not_found(self):
+        for ordering, field in (('-created_at', 'created_at'), ('price', 'price')):
+            cursor = base64.urlsafe_b64encode(json.dumps({'f': field, 'v': 'garbage', 'id': 1}).encode()).decode()
+            response = self.client.get('/api/products/', {'ordering': ordering, 'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class ConditionalGetTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='poller@example.com',
+            username='poller',
+            password='testpass123',
+            name='Poller'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.category = Category.objects.create(name='Gaming')
+        self.product = Product.objects.create(
+            name='Console',
+            description='Test Description',
+            price=Decimal('399.99'),
+            stock=3,
+            image_url='https://example.com/image.jpg',
+            source_url='https://example.com/console',
+            category=self.category
+        )
+        patcher = patch('api.views.view_buffer', LocalViewBuffer(flush_interval=0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def revalidate(self, url, **headers):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertIn('ETag', first)
+        return first, self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'], **headers)
+
+    def test_product_list_not_modified_until_catalog_changes(self):
+        first, second = self.revalidate('/api/products/')
+        self.assertEqual(second.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Product.objects.create(
+            name='Controller',
+            description='Test Description',
+            price=Decimal('59.99'),
+            stock=10,
+            image_url='https://example.com/image.jpg',
+            source_url='https://example.com/controller'
+        )
+        third = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(third.status_code, status.HTTP_200_OK)
+
+    def test_product_list_etag_depends_on_filters(self):
+        first = self.client.get('/api/products/')
+        filtered = self.client.get('/api/products/', {'in_stock': 'true'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(filtered.status_code, status.HTTP_200_OK)
+
+    def test_product_detail_tracks_category_changes(self):
+        url = f'/api/products/{self.product.id}/'
+        first, second = self.revalidate(url)
+        self.assertEqual(second.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertIn('Last-Modified', first)
+
+        self.category.name = 'Consoles'
+        self.category.save()
+        third = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(third.status_code, status.HTTP_200_OK)
+        self.assertEqual(third.data['category']['name'], 'Consoles')
+
+    def test_category_list_not_modified(self):
+        _, second = self.revalidate('/api/categories/')
+        self.assertEqual(second.status_code, status.HTTP_304_NOT_MODIFIED)
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ProductListCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='cached@example.com',
+            username='cached',
+            password='testpass123',
+            name='Cached'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(
+            name='Cached Product',
+            description='Test Description',
+            price=Decimal('10.00'),
+            stock=10,
+            image_url='https://example.com/image.jpg',
+            source_url='https://example.com/cached'
+        )
+
+    def test_hit_skips_database(self):
+        first = self.client.get('/api/products/', {'in_stock': 'true', 'min_price': '5'})
+        with self.assertNumQueries(0):
+            # Parameter order and blank values don't change the key
+            second = self.client.get('/api/products/?min_price=5&category=&in_stock=true')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(get_response_cache_stats('product_list'), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_model_changes_invalidate(self):
+        self.client.get('/api/products/')
+        self.product.price = Decimal('12.00')
+        self.product.save()
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.data['results'][0]['price'], '12.00')
+
+        Category.objects.create(name='New')
+        self.client.get('/api/products/')
+        self.assertEqual(get_response_cache_stats('product_list')['misses'], 3)
+
+    def test_bumped_namespace_invalidates(self):
+        self.client.get('/api/products/')
+        Product.objects.filter(pk=self.product.pk).update(name='Renamed')
+        bump_namespace('product')
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.data['results'][0]['name'], 'Renamed')
+
+
+class SparseFieldsetTest(LocalCartStoreMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='sparse@example.com',
+            username='sparse',
+            password='testpass123',
+            name='Sparse'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.use_local_cart_store()
+        self.product = Product.objects.create(
+            name='Sparse Product',
+            description='A very long description ' * 50,
+            price=Decimal('10.00'),
+            stock=10,
+            image_url='https://example.com/image.jpg',
+            source_url='https://example.com/sparse'
+        )
+
+    def product_selects(self, queries):
+        return [q['sql'] for q in queries if 'FROM "api_product"' in q['sql'] and q['sql'].startswith('SELECT')]
+
+    def test_product_list_projection(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/products/', {'fields': 'id,name,price'})
+        self.assertEqual(list(response.data['results'][0]), ['id', 'name', 'price'])
+        page_query = self.product_selects(ctx.captured_queries)[-1]
+        self.assertIn('"name"', page_query)
+        self.assertNotIn('"description"', page_query)
+        self.assertNotIn('search_vector', page_query)
+
+    def test_product_list_paginates_with_projection(self):
+        Product.objects.create(
+            name='Second', description='', price=Decimal('5.00'), stock=1,
+            image_url='https://example.com/image.jpg', source_url='https://example.com/second'
+        )
+        first = self.client.get('/api/products/', {'fields': 'name', 'page_size': 1, 'ordering': 'price'})
+        self.assertEqual(first.data['results'], [{'name': 'Second'}])
+        second = self.client.get(first.data['next'])
+        self.assertEqual(second.data['results'], [{'name': 'Sparse Product'}])
+
+    def test_product_detail_nested_fields(self):
+        response = self.client.get(f'/api/products/{self.product.pk}/', {'fields': 'name,average_rating'})
+        self.assertEqual(response.data, {'name': 'Sparse Product', 'average_rating': 0.0})
+
+    def test_cart_nested_projection(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/carts/{cart.pk}/', {'fields': 'id,items.subtotal,items.product.name'})
+        self.assertEqual(response.data['id'], cart.pk)
+        self.assertEqual(response.data['items'], [{'product': {'name': 'Sparse Product'}, 'subtotal': '20.00'}])
+        item_query = [q['sql'] for q in ctx.captured_queries if 'FROM "api_cartitem"' in q['sql']][0]
+        self.assertNotIn('"description"', item_query)
+
+    def test_order_and_wishlist_fields(self):
+        order = Order.objects.create(user=self.user, total_amount=Decimal('10.00'), shipping_address={})
+        OrderItem.objects.create(order=order, product=self.product, quantity=1, price=Decimal('10.00'))
+        response = self.client.get(f'/api/orders/{order.pk}/', {'fields': 'id,items.product.price'})
+        self.assertEqual(response.data, {'id': order.pk, 'items': [{'product': {'price': '10.00'}}]})
+        response = self.client.get('/api/orders/', {'fields': 'id,item_count'})
+        self.assertEqual(response.data['results'], [{'id': order.pk, 'item_count': 1}])
+
+        wishlist = Wishlist.objects.create(user=self.user)
+        wishlist.products.add(self.product)
+        response = self.client.get(f'/api/wishlists/{wishlist.pk}/', {'fields': 'products.name'})
+        self.assertEqual(response.data, {'products': [{'name': 'Sparse Product'}]})
+
+    def test_writes_ignore_fields(self):
+        response = self.client.post('/api/products/?fields=id', {
+            'name': 'Created', 'description': 'd', 'price': '1.00', 'stock': 1,
+            'image_url': 'https://example.com/image.jpg', 'source_url': 'https://example.com/created'
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('name', response.data)
+
+
+class QueryBudgetTest(LocalCartStoreMixin, APITestCase):
+    """Each endpoint runs a fixed number of queries however many rows it returns"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='budget@example.com',
+            username='budget',
+            password='testpass123',
+            name='Budget'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.category = Category.objects.create(name='Budget')
+        self.product = self.make_product(0)
+        self.cart = Cart.objects.create(user=self.user)
+        self.order = Order.objects.create(user=self.user, total_amount=Decimal('0.00'), shipping_address={})
+        self.wishlist = Wishlist.objects.create(user=self.user)
+        self.counter = 0
+        self.use_local_cart_store()
+
+    def make_product(self, i):
+        return Product.objects.create(
+            name=f'Budget {i}', description='Description', price=Decimal('2.50'), stock=100,
+            image_url='https://example.com/image.jpg', source_url=f'https://example.com/budget/{i}',
+            category=self.category
+        )
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.counter += 1
+            product = self.make_product(self.counter)
+            reviewer = User.objects.create_user(
+                email=f'reviewer{self.counter}@example.com', username=f'reviewer{self.counter}',
+                password='testpass123', name='Reviewer'
+            )
+            Review.objects.create(user=reviewer, product=self.product, rating=4)
+            # Carts live in the cart store
+            self.store.add(self.user.pk, product.pk, 2)
+            OrderItem.objects.create(order=self.order, product=product, quantity=1, price=product.price)
+            self.wishlist.products.add(product)
+            UserActivity.objects.create(user=self.user, product=product, activity_type='view')
+
+    def count_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data)
+        self.assertLess(response.status_code, 400, response.data)
+        return len(ctx)
+
+    def assertQueryBudget(self, budget, url, method='get', data=None):
+        self.add_rows(1)
+        small = self.count_queries(method, url, data)
+        self.add_rows(5)
+        large = self.count_queries(method, url, data)
+        self.assertEqual(large, small, f'{url} queries grow with the number of rows')
+        self.assertLessEqual(large, budget, f'{url} is over its query budget')
+
+    def test_product_list(self):
+        self.assertQueryBudget(2, '/api/products/')
+
+    def test_product_detail(self):
+        self.assertQueryBudget(4, f'/api/products/{self.product.pk}/')
+
+    def test_product_reviews(self):
+        self.assertQueryBudget(1, f'/api/products/{self.product.pk}/reviews/')
+
+    def test_cart(self):
+        self.assertQueryBudget(2, f'/api/carts/{self.cart.pk}/')
+        self.assertQueryBudget(2, '/api/carts/')
+        self.assertQueryBudget(2, f'/api/carts/{self.cart.pk}/', data={'fields': 'total'})
+
+    def test_cart_add_item(self):
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        self.assertQueryBudget(
+            5, f'/api/carts/{self.cart.pk}/add_item/', 'post', {'product_id': self.product.pk}
+        )
+
+    def test_orders(self):
+        self.assertQueryBudget(1, '/api/orders/')
+        self.assertQueryBudget(3, f'/api/orders/{self.order.pk}/')
+
+    def test_wishlist(self):
+        self.assertQueryBudget(2, f'/api/wishlists/{self.wishlist.pk}/')
+
+    def test_activities(self):
+        self.assertQueryBudget(1, '/api/activities/')
+
+
+class ProductFacetsTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='facets@example.com',
+            username='facets',
+            password='testpass123',
+            name='Facets'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.phones = Category.objects.create(name='Phones')
+        self.laptops = Category.objects.create(name='Laptops')
+        for i, (name, price, stock, category) in enumerate([
+            ('Budget phone', '19.99', 5, self.phones),
+            ('Wireless phone', '49.99', 0, self.phones),
+            ('Flagship phone', '999.00', 3, self.phones),
+            ('Wireless laptop', '1299.00', 2, self.laptops),
+            ('Loose cable', '5.00', 1, None),
+        ]):
+            Product.objects.create(
+                name=name, description='', price=Decimal(price), stock=stock, category=category,
+                image_url='https://example.com/image.jpg', source_url=f'https://example.com/facet/{i}'
+            )
+
+    def test_counts_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/products/facets/')
+        self.assertEqual(response.data['total'], 5)
+        self.assertEqual(
+            [(c['name'], c['count']) for c in response.data['categories']],
+            [('Phones', 3), (None, 1), ('Laptops', 1)]
+        )
+        buckets = {b['min']: b['count'] for b in response.data['price_buckets']}
+        self.assertEqual(buckets, {'0': 2, '25': 1, '50': 0, '100': 0, '250': 0, '500': 1, '1000': 1})
+        self.assertIsNone(response.data['price_buckets'][-1]['max'])
+        self.assertEqual(response.data['stock'], {'in_stock': 4, 'out_of_stock': 1})
+
+    def test_counts_follow_filters(self):
+        response = self.client.get('/api/products/facets/', {'search': 'wireless', 'in_stock': 'true'})
+        self.assertEqual(response.data['total'], 1)
+        self.assertEqual(response.data['categories'], [{'id': self.laptops.pk, 'name': 'Laptops', 'count': 1}])
+
+    def test_query_count_flat_with_more_categories(self):
+        for i in range(20):
+            category = Category.objects.create(name=f'Extra {i}')
+            Product.objects.create(
+                name=f'Extra {i}', description='', price=Decimal('10.00'), stock=1, category=category,
+                image_url='https://example.com/image.jpg', source_url=f'https://example.com/extra/{i}'
+            )
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/products/facets/')
+        self.assertEqual(len(response.data['categories']), 23)
+
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_cached_until_products_change(self):
+        self.client.get('/api/products/facets/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/products/facets/')
+        Product.objects.filter(name='Loose cable').first().delete()
+        response = self.client.get('/api/products/facets/')
+        self.assertEqual(response.data['total'], 4)
+
+
+class CategoryTreeTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='tree@example.com',
+            username='tree',
+            password='testpass123',
+            name='Tree'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.electronics = Category.objects.create(name='Electronics')
+        self.computers = Category.objects.create(name='Computers', parent=self.electronics)
+        self.laptops = Category.objects.create(name='Laptops', parent=self.computers)
+        self.garden = Category.objects.create(name='Garden')
+        self.counter = 0
+
+    def make_product(self, category):
+        self.counter += 1
+        return Product.objects.create(
+            name=f'Tree {self.counter}', description='', price=Decimal('1.00'), stock=1, category=category,
+            image_url='https://example.com/image.jpg', source_url=f'https://example.com/tree/{self.counter}'
+        )
+
+    def counts(self):
+        return {
+            c.name: (c.product_count, c.subtree_product_count)
+            for c in Category.objects.all()
+        }
+
+    def test_paths(self):
+        self.laptops.refresh_from_db()
+        self.assertEqual(self.laptops.path, f'/{self.electronics.pk}/{self.computers.pk}/{self.laptops.pk}/')
+        self.assertEqual(self.laptops.depth, 2)
+
+    def test_move_rewrites_subtree(self):
+        self.make_product(self.laptops)
+        self.computers.parent = self.garden
+        self.computers.save()
+        self.laptops.refresh_from_db()
+        self.assertEqual(self.laptops.path, f'/{self.garden.pk}/{self.computers.pk}/{self.laptops.pk}/')
+        self.assertEqual(self.laptops.depth, 2)
+        self.assertEqual(self.counts()['Electronics'], (0, 0))
+        self.assertEqual(self.counts()['Garden'], (0, 1))
+
+    def test_stale_save_keeps_tree_and_counts(self):
+        stale_computers = Category.objects.get(pk=self.computers.pk)
+        stale_laptops = Category.objects.get(pk=self.laptops.pk)
+        self.make_product(self.laptops)
+        self.electronics.parent = self.garden
+        self.electronics.save()
+
+        stale_computers.description = 'Edited'
+        stale_computers.save()
+        stale_laptops.name = 'Notebooks'
+        stale_laptops.save()
+
+        path = f'/{self.garden.pk}/{self.electronics.pk}/{self.computers.pk}/{self.laptops.pk}/'
+        self.assertEqual((stale_laptops.path, stale_laptops.depth), (path, 3))
+        stale_laptops.refresh_from_db()
+        self.assertEqual((stale_laptops.name, stale_laptops.path, stale_laptops.depth), ('Notebooks', path, 3))
+        self.assertEqual(self.counts()['Computers'], (0, 1))
+        self.assertEqual(self.counts()['Notebooks'], (1, 1))
+        response = self.client.get('/api/categories/', {'ancestor': self.garden.pk})
+        self.assertEqual({c['name'] for c in response.data}, {'Electronics', 'Computers', 'Notebooks'})
+
+    def test_cannot_move_under_descendant(self):
+        response = self.client.patch(f'/api/categories/{self.electronics.pk}/', {'parent': self.laptops.pk})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_product_counts(self):
+        product = self.make_product(self.laptops)
+        self.make_product(self.computers)
+        self.assertEqual(self.counts()['Electronics'], (0, 2))
+        self.assertEqual(self.counts()['Laptops'], (1, 1))
+
+        product.category = self.garden
+        product.save()
+        self.assertEqual(self.counts()['Electronics'], (0, 1))
+        self.assertEqual(self.counts()['Garden'], (1, 1))
+
+        product.delete()
+        self.assertEqual(self.counts()['Garden'], (0, 0))
+
+        self.computers.delete()
+        self.assertEqual(self.counts(), {'Electronics': (0, 0), 'Garden': (0, 0)})
+
+    def test_subtree_filter(self):
+        laptop = self.make_product(self.laptops)
+        computer = self.make_product(self.computers)
+        self.make_product(self.garden)
+        response = self.client.get('/api/products/', {'category_tree': self.electronics.pk})
+        self.assertEqual({p['id'] for p in response.data['results']}, {laptop.pk, computer.pk})
+        response = self.client.get('/api/products/', {'category_tree': 999})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get('/api/categories/', {'ancestor': self.electronics.pk})
+        self.assertEqual({c['name'] for c in response.data}, {'Computers', 'Laptops'})
+        response = self.client.get('/api/categories/', {'ancestor': 'garbage'})
+        self.assertEqual((response.status_code, response.data), (status.HTTP_200_OK, []))
+
+    def test_rebuild_command(self):
+        self.make_product(self.laptops)
+        expected = self.counts()
+        Category.objects.update(path='', depth=0, product_count=0, subtree_product_count=0)
+        call_command('rebuild_category_tree', stdout=StringIO())
+        self.assertEqual(self.counts(), expected)
+        self.laptops.refresh_from_db()
+        self.assertEqual(self.laptops.path, f'/{self.electronics.pk}/{self.computers.pk}/{self.laptops.pk}/')
+
+
+class CategoryTreeSnapshotTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=User.objects.create_user(
+            email='snapshot@example.com', username='snapshot', password='testpass123', name='Snapshot'
+        ))
+        self.electronics = Category.objects.create(name='Electronics')
+        self.phones = Category.objects.create(name='Phones', parent=self.electronics)
+        self.audio = Category.objects.create(name='Audio', parent=self.electronics)
+        self.product = Product.objects.create(
+            name='Phone', description='', price=Decimal('1.00'), stock=1, category=self.phones,
+            image_url='https://example.com/image.jpg', source_url='https://example.com/snapshot'
+        )
+
+    def test_nested_tree(self):
+        response = self.client.get('/api/categories/tree/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        (root,) = response.data
+        self.assertEqual((root['name'], root['subtree_product_count']), ('Electronics', 1))
+        self.assertEqual(
+            [(c['name'], c['product_count']) for c in root['children']],
+            [('Audio', 0), ('Phones', 1)]
+        )
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.get('/api/categories/tree/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_hot_cache_skips_database(self):
+        first = self.client.get('/api/categories/tree/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/categories/tree/')
+            not_modified = self.client.get('/api/categories/tree/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_invalidated_by_category_and_product_moves(self):
+        first = self.client.get('/api/categories/tree/')
+        self.product.category = self.audio
+        self.product.save()
+        moved = self.client.get('/api/categories/tree/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(moved.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(c['name'], c['product_count']) for c in moved.data[0]['children']],
+            [('Audio', 1), ('Phones', 0)]
+        )
+
+        self.audio.name = 'Sound'
+        self.audio.save()
+        renamed = self.client.get('/api/categories/tree/')
+        self.assertIn('Sound', [c['name'] for c in renamed.data[0]['children']])
+
+
+class ProductIngestTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.phones = Category.objects.create(name='Phones')
+        self.service = ProductIngestService(batch_size=2)
+
+    def item(self, i, **overrides):
+        item = {
+            'name': f'Scraped {i}',
+            'description': 'Scraped description',
+            'price': '10.00',
+            'stock': 1,
+            'image_url': 'https://example.com/image.jpg',
+            'source_url': f'https://www.example.com/item/{i}/',
+        }
+        item.update(overrides)
+        return item
+
+    def test_normalize_source_url(self):
+        self.assertEqual(
+            normalize_source_url('HTTPS://WWW.Example.com:443/p/1/?b=2&utm_source=x&a=1#reviews'),
+            normalize_source_url('http://example.com/p/1?a=1&b=2')
+        )
+        self.assertNotEqual(normalize_source_url('https://example.com/p/1'), normalize_source_url('https://example.com/p/2'))
+
+    def test_batch_counts(self):
+        batches = []
+        first = self.service.ingest([self.item(1), self.item(2), self.item(3)], on_batch=batches.append)
+        self.assertEqual(first, IngestResult(created=3))
+        self.assertEqual(batches, [IngestResult(created=2), IngestResult(created=1)])
+
+        second = self.service.ingest([
+            self.item(1),
+            self.item(2, price='12.50'),
+            # Same page behind a tracking link
+            self.item(3, source_url='https://example.com/item/3?utm_campaign=spring'),
+            self.item(4),
+            {'name': 'Broken'},
+        ])
+        self.assertEqual(second, IngestResult(created=1, updated=1, unchanged=2, skipped=1))
+        self.assertEqual(Product.objects.count(), 4)
+        self.assertEqual(Product.objects.get(name='Scraped 2').price, Decimal('12.50'))
+
+    def test_index_and_category_counts(self):
+        self.service.ingest([self.item(1, name='Wireless earbuds', category=self.phones), self.item(2)])
+        self.phones.refresh_from_db()
+        self.assertEqual((self.phones.product_count, self.phones.subtree_product_count), (1, 1))
+        self.client.force_authenticate(user=User.objects.create_user(
+            email='ingest@example.com', username='ingest', password='testpass123', name='Ingest'
+        ))
+        response = self.client.get('/api/products/', {'search': 'earbuds'})
+        self.assertEqual([p['name'] for p in response.data['results']], ['Wireless earbuds'])
+
+        self.service.ingest([self.item(1, name='Wireless earbuds', category_id=None)])
+        self.phones.refresh_from_db()
+        self.assertEqual(self.phones.product_count, 0)
+
+    def test_item_without_category_keeps_existing_one(self):
+        self.service.ingest([self.item(1, category=self.phones)])
+
+        # What scrape_products sends: no category at all
+        self.assertEqual(self.service.ingest([self.item(1)]), IngestResult(unchanged=1))
+        self.assertEqual(self.service.ingest([self.item(1, price='12.50')]), IngestResult(updated=1))
+        product = Product.objects.get(name='Scraped 1')
+        self.assertEqual((product.category_id, product.price), (self.phones.pk, Decimal('12.50')))
+        self.phones.refresh_from_db()
+        self.assertEqual((self.phones.product_count, self.phones.subtree_product_count), (1, 1))
+
+    def test_single_saves_set_key(self):
+        product = Product.objects.create(
+            name='Manual', description='', price=Decimal('1.00'), stock=1,
+            image_url='https://example.com/image.jpg', source_url='https://www.example.com/manual/'
+        )
+        self.assertEqual(product.source_key, 'example.com/manual')
+        result = self.service.ingest([self.item(1, source_url='https://example.com/manual')])
+        self.assertEqual(result, IngestResult(updated=1))
+
+    def test_load_sample_products(self):
+        out = StringIO()
+        call_command('load_sample_products', stdout=out)
+        call_command('load_sample_products', stdout=out)
+        self.assertEqual(Product.objects.count(), 11)
+        self.assertEqual(Category.objects.get(name='Laptops').product_count, 2)
+
+
+class CatalogExportTest(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            email='admin@example.com',
+            username='admin',
+            password='testpass123',
+            name='Admin',
+            is_staff=True
+        )
+        self.client.force_authenticate(user=self.admin)
+        phones = Category.objects.create(name='Phones')
+        self.old = Product.objects.create(
+            name='Old, "quoted" phone', description='Line one\nline two', price=Decimal('99.90'), stock=2,
+            image_url='https://example.com/image.jpg', source_url='https://example.com/export/old', category=phones
+        )
+        self.new = Product.objects.create(
+            name='New phone', description='', price=Decimal('199.00'), stock=0,
+            image_url='https://example.com/image.jpg', source_url='https://example.com/export/new'
+        )
+        Product.objects.filter(pk=self.old.pk).update(updated_at=datetime(2020, 1, 1, tzinfo=dt_timezone.utc))
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson(self):
+        response = self.client.get('/api/reports/catalog_export/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('X-Export-Started-At', response)
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.old.pk, self.new.pk])
+        self.assertEqual(rows[0]['category_name'], 'Phones')
+        self.assertEqual(rows[0]['price'], '99.90')
+        self.assertEqual(rows[0]['description'], 'Line one\nline two')
+        self.assertIn('avg_rating', rows[0])
+
+    def test_csv_updated_since(self):
+        response = self.client.get('/api/reports/catalog_export/', {
+            'export_format': 'csv', 'updated_since': '2021-01-01'
+        })
+        rows = list(csv.DictReader(StringIO(self.read(response))))
+        self.assertEqual([row['name'] for row in rows], ['New phone'])
+        self.assertEqual(rows[0]['category_name'], '')
+
+        response = self.client.get('/api/reports/catalog_export/', {'updated_since': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_admin_only(self):
+        self.client.force_authenticate(user=User.objects.create_user(
+            email='shopper@example.com', username='shopper', password='testpass123', name='Shopper'
+        ))
+        response = self.client.get('/api/reports/catalog_export/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_command(self):
+        out, err = StringIO(), StringIO()
+        call_command('export_catalog', '--format', 'csv', stdout=out, stderr=err)
+        rows = list(csv.DictReader(StringIO(out.getvalue())))
+        self.assertEqual([row['name'] for row in rows], ['Old, "quoted" phone', 'New phone'])
+        self.assertIn('Export started at', err.getvalue())
+
+
+class RendererNegotiationTest(LocalCartStoreMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='testuser',
+            password='testpass123',
+            name='Test User'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(
+            name='Test Product', description='Test Description', price=Decimal('19.90'), stock=5,
+            image_url='https://example.com/image.jpg', source_url='https://example.com/product'
+        )
+        self.order = Order.objects.create(
+            user=self.user, total_amount=Decimal('39.80'), shipping_address={'city': 'Lagos'}
+        )
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=2, price=Decimal('19.90'))
+
+    def get_both(self, url):
+        as_json = self.client.get(url, HTTP_ACCEPT='application/json')
+        as_msgpack = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(as_json['Content-Type'], 'application/json')
+        self.assertEqual(as_msgpack['Content-Type'], 'application/msgpack')
+        return json.loads(as_json.content), msgpack.unpackb(as_msgpack.content, raw=False)
+
+    def test_formats_match(self):
+        as_json, as_msgpack = self.get_both('/api/products/')
+        self.assertEqual(as_json, as_msgpack)
+        self.assertEqual(as_msgpack['results'][0]['price'], '19.90')
+
+        as_json, as_msgpack = self.get_both(f'/api/orders/{self.order.pk}/')
+        self.assertEqual(as_json, as_msgpack)
+        self.assertEqual(as_msgpack['total_amount'], '39.80')
+        self.assertEqual(as_msgpack['items'][0]['subtotal'], '39.80')
+
+    def test_default_is_json(self):
+        response = self.client.get('/api/products/', HTTP_ACCEPT='*/*')
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_encodes_raw_values_like_drf(self):
+        data = {'amount': Decimal('10.50'), 'at': datetime(2024, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc)}
+        expected = {'amount': '10.50', 'at': '2024-01-02T03:04:05Z'}
+        self.assertEqual(json.loads(ORJSONRenderer().render(data)), expected)
+        self.assertEqual(msgpack.unpackb(MessagePackRenderer().render(data), raw=False), expected)
+
+    def test_msgpack_request_body(self):
+        cart = Cart.objects.create(user=self.user)
+        self.use_local_cart_store()
+        response = self.client.post(
+            f'/api/carts/{cart.pk}/add_item/',
+            msgpack.packb({'product_id': self.product.pk, 'quantity': 2}),
+            content_type='application/msgpack'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['items'][0]['quantity'], 2)
+
+        response = self.client.post(
+            f'/api/carts/{cart.pk}/add_item/', b'{"product_id":', content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FastSerializerTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='testuser',
+            password='testpass123',
+            name='Test User'
+        )
+        self.client.force_authenticate(user=self.user)
+        phones = Category.objects.create(name='Phones')
+        self.phone = Product.objects.create(
+            name='Phone', description='Smart', price=Decimal('199.90'), stock=3,
+            image_url='https://example.com/phone.jpg', source_url='https://example.com/phone',
+            category=phones
+        )
+        self.cable = Product.objects.create(
+            name='Cable', description='', price=Decimal('5.00'), stock=0,
+            image_url='https://example.com/cable.jpg', source_url='https://example.com/cable'
+        )
+        UserActivity.objects.create(user=self.user, activity_type='view', product=self.phone,
+                                    details={'source': 'search', 'position': 2})
+        UserActivity.objects.create(user=self.user, activity_type='search', details={'query': 'phone'})
+
+    def assertSameOutput(self, serializer_class, queryset):
+        compiled = compile_serializer(serializer_class())
+        self.assertIsNotNone(compiled)
+        fast = compiled.serialize(compiled.values(queryset))
+        regular = serializer_class(queryset, many=True).data
+        self.assertEqual(fast, regular)
+        renderer = ORJSONRenderer()
+        self.assertEqual(renderer.render(fast), renderer.render(regular))
+
+    def test_product_serializer(self):
+        self.assertSameOutput(ProductSerializer, Product.objects.order_by('pk'))
+
+    def test_user_activity_serializer(self):
+        self.assertSameOutput(UserActivitySerializer, UserActivity.objects.order_by('pk'))
+
+    def test_compiled_once_per_class(self):
+        self.assertIs(compile_serializer(ProductSerializer()), compile_serializer(ProductSerializer(many=True)))
+
+    def test_compiled_cache_is_bounded(self):
+        from . import fast_serializers
+        with patch.object(fast_serializers, 'COMPILED_CACHE_SIZE', 2):
+            for name in ('name', 'price', 'stock'):
+                serializer = ProductSerializer()
+                prune_fields(serializer, {'id': {}, name: {}})
+                self.assertEqual(list(compile_serializer(serializer).serialize([{'id': 1, name: None}])[0]),
+                                 ['id', name])
+            self.assertLessEqual(len(fast_serializers._compiled), 2)
+
+    def test_fields_without_columns_are_not_compiled(self):
+        # CartItem.subtotal is a property
+        self.assertIsNone(compile_serializer(CartItemSerializer()))
+
+    def test_list_endpoints(self):
+        response = self.client.get('/api/products/', {'fields': 'id,price'})
+        self.assertEqual(response.data['results'], [
+            {'id': self.cable.pk, 'price': '5.00'},
+            {'id': self.phone.pk, 'price': '199.90'},
+        ])
+
+        response = self.client.get('/api/activities/')
+        expected = UserActivitySerializer(UserActivity.objects.filter(user=self.user), many=True).data
+        self.assertEqual(response.data, expected)
+
+
+class CartStoreTest(LocalCartStoreMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='testuser',
+            password='testpass123',
+            name='Test User'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.phone = Product.objects.create(
+            name='Phone', description='Smart', price=Decimal('199.90'), stock=5,
+            image_url='https://example.com/phone.jpg', source_url='https://example.com/phone'
+        )
+        self.cable = Product.objects.create(
+            name='Cable', description='', price=Decimal('5.00'), stock=10,
+            image_url='https://example.com/cable.jpg', source_url='https://example.com/cable'
+        )
+        self.use_local_cart_store()
+
+    def add(self, product, quantity=1):
+        return self.client.post('/api/carts/0/add_item/', {'product_id': product.pk, 'quantity': quantity})
+
+    def stored(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity'))
+
+    def test_add_and_remove_write_behind(self):
+        self.add(self.phone)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.add(self.phone, 2)
+        self.assertEqual(len(ctx), 2)  # stock check and product rendering
+        item, = response.data['items']
+        self.assertEqual((item['id'], item['quantity'], item['subtotal']), (self.phone.pk, 3, '599.70'))
+        self.assertEqual(response.data['total'], '599.70')
+        self.add(self.cable, 4)
+        self.assertEqual(self.stored(), {})
+
+        self.assertEqual(self.store.flush(), 1)
+        self.assertEqual(self.stored(), {self.phone.pk: 3, self.cable.pk: 4})
+
+        response = self.client.post('/api/carts/0/remove_item/', {'product_id': self.phone.pk})
+        self.assertEqual([item['id'] for item in response.data['items']], [self.cable.pk])
+        self.add(self.cable)
+        self.store.flush()
+        self.assertEqual(self.stored(), {self.cable.pk: 5})
+
+    def test_loads_database_cart(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.cable, quantity=2)
+        response = self.client.get('/api/carts/0/')
+        self.assertEqual(response.data['id'], cart.pk)
+        self.assertEqual(response.data['items'][0]['quantity'], 2)
+
+        response = self.client.post('/api/carts/0/remove_item/', {'item_id': self.phone.pk})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.add(self.cable, 0)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_checkout_persists_cart(self):
+        self.add(self.phone, 2)
+        self.add(self.cable)
+        response = self.client.post('/api/carts/0/checkout/', {'shipping_address': {'city': 'Lagos'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_amount'], '404.80')
+        self.assertEqual(len(response.data['items']), 2)
+        self.assertEqual(self.stored(), {})
+        self.assertEqual(self.client.get('/api/carts/0/').data['items'], [])
+
+    def test_items_added_during_checkout_stay_in_cart(self):
+        self.add(self.phone, 2)
+        place_order = CartCheckoutService().checkout
+
+        def checkout(user, shipping_address):
+            order = place_order(user, shipping_address)
+            # Lands after the cart was persisted for the order
+            self.store.add(self.user.pk, self.phone.pk, 1)
+            self.store.add(self.user.pk, self.cable.pk, 1)
+            return order
+
+        with patch('api.views.cart_checkout_service.checkout', side_effect=checkout):
+            response = self.client.post('/api/carts/0/checkout/', {'shipping_address': {'city': 'Lagos'}},
+                                        format='json')
+        self.assertEqual([(item['product']['id'], item['quantity']) for item in response.data['items']],
+                         [(self.phone.pk, 2)])
+        cart = self.client.get('/api/carts/0/').data
+        self.assertEqual({item['id']: item['quantity'] for item in cart['items']},
+                         {self.phone.pk: 1, self.cable.pk: 1})
+        self.store.flush()
+        self.assertEqual(self.stored(), {self.phone.pk: 1, self.cable.pk: 1})
+
+    def test_failed_flush_requeues_carts(self):
+        self.add(self.phone)
+        with patch.object(CartItem.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.store.flush()
+        self.assertEqual(self.store.flush(), 1)
+        self.assertEqual(self.stored(), {self.phone.pk: 1})
+
+
+class CartCheckoutTest(LocalCartStoreMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='testuser',
+            password='testpass123',
+            name='Test User'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}', description='', price=Decimal('10.00'), stock=5,
+                image_url='https://example.com/image.jpg', source_url=f'https://example.com/checkout/{i}'
+            )
+            for i in range(6)
+        ]
+        self.use_local_cart_store()
+
+    def checkout(self):
+        return self.client.post('/api/carts/0/checkout/', {'shipping_address': {'city': 'Lagos'}}, format='json')
+
+    def test_query_count_does_not_grow_with_cart(self):
+        service = CartCheckoutService()
+        counts = []
+        for size in (1, 5):
+            for product in self.products[:size]:
+                CartItem.objects.create(cart=self.cart, product=product, quantity=1)
+            with CaptureQueriesContext(connection) as ctx:
+                order = service.checkout(self.user, {})
+            counts.append(len(ctx))
+            self.assertEqual(order.items.count(), size)
+        self.assertEqual(counts[0], counts[1])
+        self.assertFalse(self.cart.items.exists())
+
+    def test_reprices_at_checkout(self):
+        CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=2)
+        Product.objects.filter(pk=self.products[0].pk).update(price=Decimal('12.50'))
+        response = self.checkout()
+        self.assertEqual(response.data['total_amount'], '25.00')
+        self.assertEqual(response.data['items'][0]['price'], '12.50')
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock, 3)
+
+    def test_short_stock_writes_nothing(self):
+        CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=6)
+        response = self.checkout()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['product_ids'], [self.products[1].pk])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(
+            list(Product.objects.filter(pk__in=[p.pk for p in self.products[:2]]).values_list('stock', flat=True)),
+            [5, 5]
+        )
+        self.assertEqual(self.cart.items.count(), 2)
+
+    def test_empty_cart(self):
+        response = self.checkout()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs concurrent writers (Postgres)')
+class CartCheckoutConcurrencyTest(TransactionTestCase):
+    def test_concurrent_checkouts_do_not_oversell(self):
+        product = Product.objects.create(
+            name='PlayStation 5', description='', price=Decimal('499.99'), stock=3,
+            image_url='https://example.com/ps5.jpg', source_url='https://example.com/ps5'
+        )
+        users = []
+        for i in range(12):
+            user = User.objects.create_user(
+                email=f'buyer{i}@example.com', username=f'buyer{i}', password='testpass123', name='Buyer'
+            )
+            CartItem.objects.create(cart=Cart.objects.create(user=user), product=product, quantity=1)
+            users.append(user)
+
+        service = CartCheckoutService()
+
+        def buy(user):
+            try:
+                service.checkout(user, {})
+                return True
+            except InsufficientStockError:
+                return False
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(max_workers=len(users)) as pool:
+            results = list(pool.map(buy, users))
+
+        product.refresh_from_db()
+        self.assertEqual(results.count(True), 3)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), 3)
+
+
+class StockReservationTest(LocalCartStoreMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='testuser',
+            password='testpass123',
+            name='Test User'
+        )
+        self.other = User.objects.create_user(
+            email='other@example.com',
+            username='otheruser',
+            password='testpass123',
+            name='Other User'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(
+            name='PlayStation 5', description='', price=Decimal('499.99'), stock=5, reserve_stock=True,
+            image_url='https://example.com/ps5.jpg', source_url='https://example.com/ps5'
+        )
+        self.service = StockReservationService(ttl=900, shards=4)
+        self.use_local_cart_store()
+
+    def test_reserves_up_to_stock_across_shards(self):
+        self.assertTrue(self.service.reserve(self.user.pk, self.product.pk, 4))
+        self.assertFalse(self.service.reserve(self.other.pk, self.product.pk, 2))
+        self.assertTrue(self.service.reserve(self.other.pk, self.product.pk, 1))
+        self.assertFalse(self.service.reserve(self.other.pk, self.product.pk, 2))
+        # Growing a hold only takes the difference
+        self.assertTrue(self.service.reserve(self.user.pk, self.product.pk, 4))
+
+    def test_released_units_return_after_reconcile(self):
+        self.assertTrue(self.service.reserve(self.user.pk, self.product.pk, 5))
+        self.service.release(self.user.pk, [self.product.pk])
+        self.assertFalse(self.service.reserve(self.other.pk, self.product.pk, 1))
+        self.service.reconcile()
+        self.assertTrue(self.service.reserve(self.other.pk, self.product.pk, 5))
+
+    def test_expired_holds_return_after_reconcile(self):
+        now = time.time()
+        with patch('api.services.stock_reservations.time.time', return_value=now):
+            self.assertTrue(self.service.reserve(self.user.pk, self.product.pk, 5))
+        with patch('api.services.stock_reservations.time.time', return_value=now + 600):
+            self.service.reconcile()
+            self.assertFalse(self.service.reserve(self.other.pk, self.product.pk, 1))
+        with patch('api.services.stock_reservations.time.time', return_value=now + 1100):
+            self.service.reconcile()
+            self.assertTrue(self.service.reserve(self.other.pk, self.product.pk, 5))
+
+    def test_checkout_leaves_stock_pending_until_reconciled(self):
+        response = self.client.post('/api/carts/0/add_item/', {'product_id': self.product.pk, 'quantity': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/carts/0/checkout/', {'shipping_address': {'city': 'Lagos'}},
+                                        format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_amount'], '999.98')
+        item = OrderItem.objects.get(order_id=response.data['id'])
+        self.assertTrue(item.stock_pending)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(stock_reservations.reconcile(), 1)
+        item.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertFalse(item.stock_pending)
+        self.assertEqual(self.product.stock, 3)
+        # The sold units stay sold once the hold is gone
+        self.assertTrue(stock_reservations.reserve(self.other.pk, self.product.pk, 3))
+        self.assertFalse(stock_reservations.reserve(self.other.pk, self.product.pk, 4))
+
+    def test_add_item_beyond_reservable_stock(self):
+        self.assertTrue(stock_reservations.reserve(self.other.pk, self.product.pk, 4))
+        response = self.client.post('/api/carts/0/add_item/', {'product_id': self.product.pk, 'quantity': 2})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.store.get(self.user.pk).items, {})
+
+    def test_cancel_pending_order(self):
+        self.client.post('/api/carts/0/add_item/', {'product_id': self.product.pk, 'quantity': 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            order_id = self.client.post('/api/carts/0/checkout/', {'shipping_address': {'city': 'Lagos'}},
+                                        format='json').data['id']
+        response = self.client.post(f'/api/orders/{order_id}/cancel/')
+        self.assertEqual(response.data['status'], 'cancelled')
+        self.assertFalse(OrderItem.objects.filter(stock_pending=True).exists())
+
+        stock_reservations.reconcile()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertTrue(stock_reservations.reserve(self.other.pk, self.product.pk, 5))
+
+
+class IdempotencyKeyTest(LocalCartStoreMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='testuser',
+            password='testpass123',
+            name='Test User'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(
+            name='Test Product', description='', price=Decimal('10.00'), stock=5,
+            image_url='https://example.com/image.jpg', source_url='https://example.com/idempotency'
+        )
+        CartItem.objects.create(cart=Cart.objects.create(user=self.user), product=self.product, quantity=2)
+        self.use_local_cart_store()
+        patcher = patch('api.middleware.idempotency_service', IdempotencyService(LocalIdempotencyStore()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def checkout(self, key, city='Lagos'):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post('/api/carts/0/checkout/', {'shipping_address': {'city': city}},
+                                format='json', **headers)
+
+    def test_retried_checkout_places_one_order(self):
+        first = self.checkout('order-attempt-1')
+        retry = self.checkout('order-attempt-1')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+
+    def test_key_reused_with_different_body(self):
+        self.checkout('order-attempt-1')
+        response = self.checkout('order-attempt-1', city='Abuja')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(response.data['error_type'], 'idempotency_key_reused')
+
+    def test_without_key(self):
+        self.assertEqual(self.checkout(None).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.checkout(None).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_payment_provider_failure_is_retried(self):
+        outcomes = [FlutterwaveUnavailableError('Failed to initialize payment: timed out'), {'status': 'success'}]
+        with patch('api.views.FlutterwavePayment.initialize_payment', side_effect=outcomes) as initialize:
+            for expected in (status.HTTP_502_BAD_GATEWAY, status.HTTP_200_OK):
+                response = self.client.post('/api/payments/initialize/', {'amount': '20.00'},
+                                            format='json', HTTP_IDEMPOTENCY_KEY='payment-attempt-1')
+                self.assertEqual(response.status_code, expected)
+        self.assertEqual(initialize.call_count, 2)
+
+class OrderHistoryTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='history@example.com',
+            username='history',
+            password='testpass123',
+            name='History'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}', description='', price=Decimal('5.00'), stock=10,
+                image_url=f'https://example.com/{i}.jpg', source_url=f'https://example.com/history/{i}'
+            )
+            for i in range(2)
+        ]
+        self.orders = []
+        for i in range(5):
+            order = Order.objects.create(user=self.user, total_amount=Decimal('5.00') * i, shipping_address={})
+            for product in self.products[:i]:
+                OrderItem.objects.create(order=order, product=product, quantity=2, price=product.price)
+            self.orders.append(order)
+        other = User.objects.create_user(
+            email='other@example.com', username='other', password='testpass123', name='Other'
+        )
+        Order.objects.create(user=other, total_amount=Decimal('1.00'), shipping_address={})
+
+    def test_list_is_summary(self):
+        response = self.client.get('/api/orders/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        newest = response.data['results'][0]
+        self.assertEqual(set(newest), {'id', 'status', 'total_amount', 'item_count', 'thumbnail', 'created_at'})
+        self.assertEqual(newest['id'], self.orders[-1].pk)
+        self.assertEqual(newest['total_amount'], '20.00')
+        self.assertEqual(newest['item_count'], 2)
+        self.assertEqual(newest['thumbnail'], 'https://example.com/0.jpg')
+
+        empty = response.data['results'][-1]
+        self.assertEqual((empty['id'], empty['item_count'], empty['thumbnail']), (self.orders[0].pk, 0, None))
+
+    def test_keyset_pages_cover_own_orders(self):
+        ids = []
+        response = self.client.get('/api/orders/', {'page_size': 2})
+        while True:
+            ids.extend(order['id'] for order in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(ids, [order.pk for order in reversed(self.orders)])
+
+    def test_list_is_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/orders/')
+        self.assertEqual(len(ctx), 1)
+        self.assertNotIn('GROUP BY', ctx.captured_queries[0]['sql'].split('FROM "api_order"')[-1])
+
+    def test_retrieve_keeps_full_detail(self):
+        response = self.client.get(f'/api/orders/{self.orders[2].pk}/')
+        self.assertEqual(response.data['user']['email'], 'history@example.com')
+        self.assertEqual([item['product']['id'] for item in response.data['items']],
+                         [product.pk for product in self.products])
+
+class FXRateCacheTest(TestCase):
+    def setUp(self):
+        from .services.fx import FXService
+        cache.clear()
+        self.service = FXService(api_key='test')
+        self.fetches = []
+        self.release = None
+        patcher = patch('api.services.fx.requests.get', side_effect=self.fetch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('api.services.fx.quote_cache')
+        self.quote_cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self, *args, **kwargs):
+        self.fetches.append(kwargs['params']['amount'])
+        if self.release is not None:
+            self.release.wait(5)
+        response = SimpleNamespace(status_code=200)
+        response.json = lambda: {'rate': '0.00065', 'fee': '0.50'}
+        return response
+
+    def cache_rate(self, age, rate='0.00060'):
+        fetched_at = datetime.utcnow() - timedelta(seconds=age)
+        cache.set(self.service.RATE_CACHE_KEY, (Decimal(rate), Decimal('0.50'), fetched_at), None)
+
+    def test_fresh_rate_is_not_fetched(self):
+        self.cache_rate(age=10)
+        self.assertEqual(self.service.get_exchange_rate(Decimal('1000')), (Decimal('0.00060'), Decimal('0.50')))
+        self.assertEqual(self.fetches, [])
+
+    def test_stale_rate_served_while_one_worker_refreshes(self):
+        self.cache_rate(age=self.service.RATE_CACHE_TTL + 5)
+        self.release = threading.Event()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            rates = list(pool.map(self.service.get_exchange_rate, [Decimal('1000')] * 8))
+        # Everyone got the stale rate without waiting on the blocked fetch
+        self.assertEqual(set(rates), {(Decimal('0.00060'), Decimal('0.50'))})
+        self.release.set()
+        for _ in range(100):
+            if cache.get(self.service.RATE_LOCK_KEY) is None:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(self.fetches), 1)
+        self.assertEqual(self.service.get_exchange_rate(Decimal('1000'))[0], Decimal('0.00065'))
+        self.assertEqual(self.service.get_rate_stats()['stale_served'], 8)
+        self.quote_cache.invalidate.assert_called_once()
+
+    def test_missing_rate_is_fetched_once(self):
+        self.release = threading.Event()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(self.service.get_exchange_rate, Decimal('1000')) for _ in range(8)]
+            time.sleep(0.1)
+            self.release.set()
+            rates = [future.result() for future in futures]
+        self.assertEqual(set(rates), {(Decimal('0.00065'), Decimal('0.50'))})
+        self.assertEqual(self.fetches, ['1000'])
+
+    def test_expired_grace_period_fetches(self):
+        self.cache_rate(age=self.service.RATE_CACHE_TTL + self.service.RATE_GRACE_PERIOD + 1)
+        self.assertEqual(self.service.get_exchange_rate(Decimal('1000'))[0], Decimal('0.00065'))
+        self.assertEqual(self.fetches, ['1000'])
+
+    def test_refresh_ahead_of_expiry(self):
+        self.cache_rate(age=10)
+        self.assertFalse(self.service.refresh_rate())
+        self.cache_rate(age=self.service.RATE_CACHE_TTL - self.service.RATE_REFRESH_AHEAD + 1)
+        self.assertTrue(self.service.refresh_rate())
+        self.assertEqual(self.fetches, [str(self.service.RATE_REFERENCE_AMOUNT)])
+
+        stats = self.service.get_rate_stats()
+        self.assertLess(stats['rate_age_seconds'], 5)
+        self.assertFalse(stats['stale'])
+        self.assertEqual(stats['refreshes'], 1)
+        self.assertGreater(stats['avg_refresh_ms'], 0)
+
+    def test_failed_fetch_is_counted(self):
+        with patch('api.services.fx.requests.get', return_value=SimpleNamespace(status_code=503)):
+            with self.assertRaises(Exception):
+                self.service.get_exchange_rate(Decimal('1000'))
+        self.assertEqual(self.service.get_rate_stats()['refresh_failures'], 1)
+        self.assertIsNone(cache.get(self.service.RATE_LOCK_KEY))
+
+class BalanceLedgerTest(TestCase):
+    def setUp(self):
+        self.ledger = BalanceLedgerService('USD')
+        self.ledger.reconcile(lambda: Decimal('100.00'))
+
+    def test_reservations_reduce_available(self):
+        entry = self.ledger.reserve(Decimal('60.00'), 'card-1')
+        self.assertEqual(self.ledger.available(), Decimal('40.00'))
+        with self.assertRaises(InsufficientFundsError):
+            self.ledger.reserve(Decimal('40.01'))
+        self.ledger.release(entry)
+        self.assertEqual(self.ledger.available(), Decimal('100.00'))
+
+    def test_unreconciled_ledger(self):
+        with self.assertRaises(LedgerNotReconciledError):
+            BalanceLedgerService('EUR').reserve(Decimal('1.00'))
+
+    def test_reconcile_settles_debits_the_balance_includes(self):
+        settled = self.ledger.reserve(Decimal('30.00'))
+        self.ledger.debit(settled, 'card-1')
+        later = self.ledger.reserve(Decimal('20.00'))
+
+        def payoneer_balance():
+            # Debited after Payoneer's balance was read, so not yet reflected in it
+            self.ledger.debit(later, 'card-2')
+            return Decimal('70.00')
+
+        ledger = self.ledger.reconcile(payoneer_balance)
+        self.assertEqual((ledger.reconciled_balance, ledger.held), (Decimal('70.00'), Decimal('20.00')))
+        self.assertEqual(BalanceEntry.objects.get(pk=settled.pk).status, 'settled')
+        self.assertEqual(BalanceEntry.objects.get(pk=later.pk).status, 'debited')
+
+        self.ledger.reconcile(lambda: Decimal('50.00'))
+        self.assertEqual(self.ledger.available(), Decimal('50.00'))
+
+    def test_reconcile_releases_abandoned_reservations(self):
+        entry = self.ledger.reserve(Decimal('25.00'))
+        BalanceEntry.objects.filter(pk=entry.pk).update(
+            created_at=timezone.now() - timedelta(seconds=self.ledger.RESERVATION_TIMEOUT + 1)
+        )
+        self.ledger.reconcile(lambda: Decimal('100.00'))
+        self.assertEqual(self.ledger.available(), Decimal('100.00'))
+        self.assertEqual(BalanceEntry.objects.get(pk=entry.pk).status, 'released')
+
+    def test_fx_transaction_total_cost(self):
+        fx = FXTransaction(target_amount=Decimal('100.00'), fee=Decimal('1.50'))
+        self.assertEqual(fx.total_cost, Decimal('101.50'))
+
+    def test_virtual_cards_use_the_ledger(self):
+        from .services.fx import fx_service
+        from .services.vcc_service import InsufficientBalanceError, ProviderUnavailableError, VCCService
+        BalanceLedger.objects.all().delete()
+        service = VCCService(api_key='test')
+        created = SimpleNamespace(status_code=200, json=lambda: {'id': 'card-1', 'last4': '4242'})
+        failed = SimpleNamespace(status_code=502)
+
+        with patch.object(fx_service, 'get_usd_balance', return_value=Decimal('100.00')) as balance, \
+                patch('api.services.vcc_service.requests.post', side_effect=[created, failed, created]):
+            service.create_virtual_card(Decimal('60.00'), 'newegg')
+            with self.assertRaises(ProviderUnavailableError):
+                service.create_virtual_card(Decimal('30.00'), 'newegg')
+            service.create_virtual_card(Decimal('40.00'), 'backmarket')
+            with self.assertRaises(InsufficientBalanceError):
+                service.create_virtual_card(Decimal('0.01'), 'newegg')
+
+        # One reconciliation on first use, no balance call per card
+        self.assertEqual(balance.call_count, 1)
+        self.assertEqual(
+            list(BalanceEntry.objects.order_by('id').values_list('status', 'reference')),
+            [('debited', 'vcc:card-1'), ('released', 'vcc:Newegg'), ('debited', 'vcc:card-1')]
+        )
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs concurrent writers (Postgres)')
+class BalanceLedgerConcurrencyTest(TransactionTestCase):
+    def test_concurrent_reservations_do_not_overspend(self):
+        ledger = BalanceLedgerService('USD')
+        ledger.reconcile(lambda: Decimal('100.00'))
+
+        def reserve(_):
+            try:
+                ledger.reserve(Decimal('30.00'))
+                return True
+            except InsufficientFundsError:
+                return False
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(reserve, range(8)))
+
+        self.assertEqual(results.count(True), 3)
+        self.assertEqual(ledger.available(), Decimal('10.00'))
+
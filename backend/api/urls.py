@@ -9,7 +9,7 @@ from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
 from .views import (
-    ProductViewSet, CategoryViewSet, OrderViewSet,
+    ProductViewSet, CategoryViewSet, CartViewSet, OrderViewSet,
     ReviewViewSet, WishlistViewSet, UserActivityViewSet,
     UserViewSet, PaymentViewSet, ReportViewSet
 )
@@ -31,6 +31,7 @@ schema_view = get_schema_view(
 router = DefaultRouter()
 router.register(r'products', ProductViewSet)
 router.register(r'categories', CategoryViewSet)
+router.register(r'carts', CartViewSet, basename='cart')
 router.register(r'orders', OrderViewSet, basename='order')
 router.register(r'reviews', ReviewViewSet, basename='review')
 router.register(r'wishlists', WishlistViewSet, basename='wishlist')
@@ -3,14 +3,16 @@ from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.contrib.auth import get_user_model
-from django.db.models import Q, Count, Avg
+from django.db import transaction
+from django.db.models import Q, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from .models import (
     Product, Cart, CartItem, Order, OrderItem,
     Category, Review, Wishlist, UserActivity
 )
 from .serializers import (
     UserSerializer, ProductSerializer, ProductDetailSerializer,
-    CartSerializer, CartItemSerializer, OrderSerializer,
+    CartSerializer, CartItemSerializer, OrderSerializer, OrderSummarySerializer,
     UserPreferencesSerializer, CategorySerializer, ReviewSerializer,
     WishlistSerializer, UserActivitySerializer
 )
@@ -22,10 +24,33 @@ from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.conf import settings
-from .payments import FlutterwavePayment
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from .payments import FlutterwavePayment, FlutterwavePaymentError
 from .reports import SalesReport
+from .caching import (
+    ConditionalGetMixin, ResponseCacheMixin, get_response_cache_stats, get_versioned_snapshot
+)
+from .category_tree import CATEGORY_TREE_NAMESPACE, build_tree_snapshot
+from . import export
+from .facets import compute_facets
+from .fast_serializers import FastListMixin
+from .fieldsets import prefetch_for_instance, project_queryset
+from .middleware import idempotent_action
+from .pagination import OrderCursorPagination, ProductCursorPagination
+from .search import ProductSearchFilter
+from .services.cart_checkout import (
+    EmptyCartError, InsufficientStockError, OrderNotCancellableError, cart_checkout_service
+)
+from .services.cart_store import cart_store
+from .services.stock_reservations import stock_reservations
+from .services.view_buffer import view_buffer
 import jwt
 import datetime
+from decimal import Decimal
+from types import SimpleNamespace
 
 User = get_user_model()
 
@@ -37,12 +62,17 @@ def format_response(data=None, message=None, status_code=status.HTTP_200_OK):
         response_data['message'] = message
     return Response(response_data, status=status_code)
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ResponseCacheMixin, ConditionalGetMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['name', 'description']
+    filter_backends = [ProductSearchFilter, filters.OrderingFilter]
     ordering_fields = ['price', 'created_at', 'name']
+    pagination_class = ProductCursorPagination
+    cache_prefix = 'product_list'
+    # Listings embed ratings and filter on category
+    cache_namespaces = ('product', 'review', 'category')
+    # The detail representation nests the category
+    detail_last_modified_fields = ('updated_at', 'category__updated_at')
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -50,20 +80,14 @@ class ProductViewSet(viewsets.ModelViewSet):
         return ProductSerializer
     
     def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
+        response = super().retrieve(request, *args, **kwargs)
         
-        # Track product view
-        if request.user.is_authenticated:
-            UserActivity.objects.create(
-                user=request.user,
-                activity_type='view',
-                product=instance
-            )
-            instance.views_count += 1
-            instance.save()
+        # Track product view (including 304 revalidations); buffered and
+        # written to the database in batches
+        if request.user.is_authenticated and response.status_code in (200, 304):
+            view_buffer.record(int(kwargs['pk']), request.user.id)
         
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        return response
     
     def get_queryset(self):
         queryset = Product.objects.all()
@@ -86,124 +110,217 @@ class ProductViewSet(viewsets.ModelViewSet):
         if category_id:
             queryset = queryset.filter(category_id=category_id)
             
+        # Filter by category including all of its subcategories
+        category_tree = self.request.query_params.get('category_tree')
+        if category_tree:
+            queryset = queryset.filter(category__path__startswith=self.get_category_path(category_tree))
+            
         # Filter by rating
         min_rating = self.request.query_params.get('min_rating')
         if min_rating:
-            queryset = queryset.annotate(avg_rating=Avg('reviews__rating')).filter(avg_rating__gte=min_rating)
+            queryset = queryset.filter(avg_rating__gte=min_rating)
+            
+        # Only read the columns being rendered (honours ?fields=); the
+        # paginator reads the ordering keys off each row
+        if self.action in ('list', 'retrieve'):
+            queryset = project_queryset(queryset, self.get_serializer(), self.ordering_fields)
             
         return queryset
+    
+    def get_category_path(self, category_id):
+        try:
+            path = Category.objects.filter(pk=category_id).values_list('path', flat=True).first()
+        except (TypeError, ValueError):
+            path = None
+        if not path:
+            raise NotFound('Category not found')
+        return path
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Category, price bucket and stock counts for the current filters"""
+        queryset = ProductSearchFilter().filter_queryset(request, self.get_queryset(), self)
+        if not getattr(settings, 'RESPONSE_CACHE_ENABLED', False):
+            return Response(compute_facets(queryset))
+        
+        key = self.get_list_cache_key(request, prefix='product_facets')
+        facets = cache.get(key)
+        if facets is None:
+            facets = compute_facets(queryset)
+            cache.set(key, facets, getattr(settings, 'RESPONSE_CACHE_TTL', 300))
+        return Response(facets)
 
 class CartViewSet(viewsets.ModelViewSet):
+    """
+    The user's cart, kept in ``cart_store`` and written to the database
+    behind the requests (and before checkout)
+
+    Cart lines are keyed by product, so an item's ``id`` is its product id.
+    """
     serializer_class = CartSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        queryset = Cart.objects.filter(user=self.request.user)
+        if self.request.method in permissions.SAFE_METHODS:
+            queryset = project_queryset(queryset, self.get_serializer())
+        return queryset
     
     def get_object(self):
         cart, created = Cart.objects.get_or_create(user=self.request.user)
         return cart
     
+    def cart_response(self, snapshot):
+        """Render a resident cart with one (projected) product query"""
+        serializer = self.get_serializer()
+        items_field = serializer.fields.get('items')
+        product_serializer = items_field.child.fields.get('product') if items_field is not None else None
+        products = {}
+        if snapshot.items:
+            queryset = Product.objects.filter(pk__in=list(snapshot.items))
+            # Subtotals and the total always need the price
+            if product_serializer is not None:
+                queryset = project_queryset(queryset, product_serializer, ('price',))
+            else:
+                queryset = queryset.only('price')
+            products = queryset.in_bulk()
+        
+        items = [
+            CartItem(id=product_id, product=products[product_id], quantity=quantity)
+            for product_id, quantity in snapshot.items.items()
+            if product_id in products
+        ]
+        serializer.instance = SimpleNamespace(
+            id=snapshot.cart_id,
+            items=items,
+            total=sum((item.subtotal for item in items), Decimal('0.00')),
+            created_at=snapshot.created_at,
+            updated_at=snapshot.updated_at
+        )
+        return Response(serializer.data)
+    
+    def list(self, request, *args, **kwargs):
+        response = self.cart_response(cart_store.get(request.user.pk))
+        response.data = [response.data]
+        return response
+    
+    def retrieve(self, request, *args, **kwargs):
+        return self.cart_response(cart_store.get(request.user.pk))
+    
+    def perform_destroy(self, instance):
+        held = list(cart_store.get(self.request.user.pk).items)
+        super().perform_destroy(instance)
+        cart_store.discard(self.request.user.pk)
+        stock_reservations.release(self.request.user.pk, held)
+    
     @action(detail=True, methods=['post'])
     def add_item(self, request, pk=None):
-        cart = self.get_object()
         product_id = request.data.get('product_id')
         quantity = int(request.data.get('quantity', 1))
+        if quantity < 1:
+            return Response({'error': 'Quantity must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
+            product = Product.objects.only('stock', 'reserve_stock').get(id=product_id)
+        except (Product.DoesNotExist, TypeError, ValueError):
             return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
             
-        if product.stock < quantity:
+        if product.reserve_stock:
+            # Hold the whole cart line, not just the units being added
+            in_cart = cart_store.get(request.user.pk).items.get(product.pk, 0)
+            if not stock_reservations.reserve(request.user.pk, product.pk, in_cart + quantity):
+                return Response({'error': 'Not enough stock'}, status=status.HTTP_400_BAD_REQUEST)
+        elif product.stock < quantity:
             return Response({'error': 'Not enough stock'}, status=status.HTTP_400_BAD_REQUEST)
             
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': quantity}
-        )
-        
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
-            
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return self.cart_response(cart_store.add(request.user.pk, product.pk, quantity))
     
     @action(detail=True, methods=['post'])
     def remove_item(self, request, pk=None):
-        cart = self.get_object()
-        item_id = request.data.get('item_id')
-        
+        # item_id is accepted for older clients; item ids are product ids
+        product_id = request.data.get('product_id', request.data.get('item_id'))
         try:
-            item = CartItem.objects.get(id=item_id, cart=cart)
-            item.delete()
-        except CartItem.DoesNotExist:
+            removed, snapshot = cart_store.remove(request.user.pk, int(product_id))
+        except (TypeError, ValueError):
+            removed = False
+        if not removed:
             return Response({'error': 'Item not found'}, status=status.HTTP_404_NOT_FOUND)
             
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        stock_reservations.release(request.user.pk, [int(product_id)])
+        return self.cart_response(snapshot)
     
     @action(detail=True, methods=['post'])
+    @idempotent_action('cart_checkout')
     def checkout(self, request, pk=None):
-        cart = self.get_object()
         shipping_address = request.data.get('shipping_address')
         
         if not shipping_address:
             return Response({'error': 'Shipping address is required'}, 
                           status=status.HTTP_400_BAD_REQUEST)
             
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            total_amount=cart.total,
-            shipping_address=shipping_address
-        )
-        
-        # Create order items
-        for item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product=item.product,
-                quantity=item.quantity,
-                price=item.product.price
-            )
-            
-            # Update product stock
-            item.product.stock -= item.quantity
-            item.product.save()
-            
-        # Clear cart
-        cart.items.all().delete()
+        # Orders are built from the database copy of the cart
+        cart_store.persist(request.user.pk)
+        try:
+            order = cart_checkout_service.checkout(request.user, shipping_address)
+        except EmptyCartError:
+            return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
+        except InsufficientStockError as e:
+            return Response({'error': 'Not enough stock', 'product_ids': e.product_ids},
+                          status=status.HTTP_400_BAD_REQUEST)
         
         serializer = OrderSerializer(order)
+        prefetch_for_instance(order, serializer)
+        # Not discard(): items added while the order was placed must stay in the cart
+        cart_store.settle(request.user.pk, {item.product_id: item.quantity for item in order.items.all()})
         return Response(serializer.data)
 
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
+    
+    def get_serializer_class(self):
+        # History pages are summaries; the nested user and items are only on the detail
+        if self.action == 'list':
+            return OrderSummarySerializer
+        return OrderSerializer
     
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        queryset = Order.objects.filter(user=self.request.user)
+        if self.action == 'list':
+            return self.annotate_summary(queryset, self.get_serializer())
+        if self.request.method in permissions.SAFE_METHODS:
+            queryset = project_queryset(queryset, self.get_serializer())
+        return queryset
+    
+    def annotate_summary(self, queryset, serializer):
+        """
+        Summary rows in one query
+        
+        Item count and thumbnail are correlated subqueries rather than a
+        join with GROUP BY, so the page is still read straight off the
+        (user, created_at, id) index and only its rows are aggregated.
+        """
+        queryset = project_queryset(queryset, serializer, ['created_at'])
+        items = OrderItem.objects.filter(order=OuterRef('pk')).order_by()
+        if 'item_count' in serializer.fields:
+            item_count = items.values('order').annotate(count=Count('id')).values('count')
+            queryset = queryset.annotate(item_count=Coalesce(Subquery(item_count), 0))
+        if 'thumbnail' in serializer.fields:
+            first_image = items.order_by('id').values('product__image_url')[:1]
+            queryset = queryset.annotate(thumbnail=Subquery(first_image))
+        return queryset
     
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
-        order = self.get_object()
-        
-        if order.status != 'pending':
+        try:
+            order = cart_checkout_service.cancel(self.get_object())
+        except OrderNotCancellableError:
             return Response({'error': 'Only pending orders can be cancelled'}, 
                           status=status.HTTP_400_BAD_REQUEST)
             
-        order.status = 'cancelled'
-        order.save()
-        
-        # Restore product stock
-        for item in order.items.all():
-            item.product.stock += item.quantity
-            item.product.save()
-            
         serializer = OrderSerializer(order)
+        prefetch_for_instance(order, serializer)
         return Response(serializer.data)
 
 class UserPreferencesViewSet(viewsets.ModelViewSet):
@@ -320,9 +437,10 @@ def get_user_profile(request):
 def product_list(request):
     try:
         if request.method == 'GET':
-            products = Product.objects.all()
+            paginator = ProductCursorPagination()
+            products = paginator.paginate_queryset(Product.objects.all(), request)
             serializer = ProductSerializer(products, many=True)
-            return format_response(data=serializer.data)
+            return format_response(data=paginator.get_paginated_response_data(serializer.data))
         
         elif request.method == 'POST':
             serializer = ProductSerializer(data=request.data)
@@ -338,6 +456,8 @@ def product_list(request):
                 message='Validation failed',
                 status_code=status.HTTP_400_BAD_REQUEST
             )
+    except NotFound:
+        raise
     except Exception as e:
         return format_response(
             message='An unexpected error occurred',
@@ -383,7 +503,7 @@ def product_detail(request, pk):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated]
@@ -393,18 +513,43 @@ class CategoryViewSet(viewsets.ModelViewSet):
         parent_id = self.request.query_params.get('parent')
         if parent_id:
             queryset = queryset.filter(parent_id=parent_id)
+            
+        # All descendants of a category, at any depth
+        ancestor_id = self.request.query_params.get('ancestor')
+        if ancestor_id:
+            try:
+                ancestor = Category.objects.filter(pk=ancestor_id).values_list('path', flat=True).first()
+            except (TypeError, ValueError):
+                ancestor = None
+            queryset = queryset.filter(path__startswith=ancestor).exclude(pk=ancestor_id) if ancestor else queryset.none()
         return queryset
+    
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """Nested category tree with product counts, served from one cached snapshot"""
+        version, tree = get_versioned_snapshot(
+            'category_tree:snapshot',
+            CATEGORY_TREE_NAMESPACE,
+            lambda: build_tree_snapshot(Category)
+        )
+        etag = self.make_etag(request, version)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        return self.set_validators(Response(tree), etag)
 
 class ReviewViewSet(viewsets.ModelViewSet):
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Review.objects.filter(product_id=self.kwargs['product_pk'])
+        return Review.objects.filter(product_id=self.kwargs['product_pk']).select_related('user')
     
+    @transaction.atomic
     def perform_create(self, serializer):
         product = Product.objects.get(id=self.kwargs['product_pk'])
-        serializer.save(user=self.request.user, product=product)
+        review = serializer.save(user=self.request.user, product=product)
+        Product.apply_review_delta(product.id, review.rating, 1)
         
         # Track activity
         UserActivity.objects.create(
@@ -413,15 +558,46 @@ class ReviewViewSet(viewsets.ModelViewSet):
             product=product,
             details={'rating': serializer.validated_data['rating']}
         )
+    
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_product_id = serializer.instance.product_id
+        old_rating = serializer.instance.rating
+        review = serializer.save()
+        
+        # Keep the stored product rating aggregates in step with the edit
+        if review.product_id == old_product_id:
+            Product.apply_review_delta(review.product_id, review.rating - old_rating, 0)
+        else:
+            Product.apply_review_delta(old_product_id, -old_rating, -1)
+            Product.apply_review_delta(review.product_id, review.rating, 1)
+    
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        product_id, rating = instance.product_id, instance.rating
+        instance.delete()
+        Product.apply_review_delta(product_id, -rating, -1)
 
 class WishlistViewSet(viewsets.ModelViewSet):
     serializer_class = WishlistSerializer
     permission_classes = [IsAuthenticated]
     
+    def get_queryset(self):
+        queryset = Wishlist.objects.filter(user=self.request.user)
+        if self.request.method in permissions.SAFE_METHODS:
+            queryset = project_queryset(queryset, self.get_serializer())
+        return queryset
+    
     def get_object(self):
         wishlist, created = Wishlist.objects.get_or_create(user=self.request.user)
         return wishlist
     
+    def retrieve(self, request, *args, **kwargs):
+        wishlist = self.get_object()
+        serializer = self.get_serializer(wishlist)
+        prefetch_for_instance(wishlist, serializer)
+        return Response(serializer.data)
+    
     @action(detail=True, methods=['post'])
     def add_product(self, request, pk=None):
         wishlist = self.get_object()
@@ -439,6 +615,7 @@ class WishlistViewSet(viewsets.ModelViewSet):
             )
             
             serializer = self.get_serializer(wishlist)
+            prefetch_for_instance(wishlist, serializer)
             return Response(serializer.data)
         except Product.DoesNotExist:
             return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -460,16 +637,17 @@ class WishlistViewSet(viewsets.ModelViewSet):
             )
             
             serializer = self.get_serializer(wishlist)
+            prefetch_for_instance(wishlist, serializer)
             return Response(serializer.data)
         except Product.DoesNotExist:
             return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
 
-class UserActivityViewSet(viewsets.ReadOnlyModelViewSet):
+class UserActivityViewSet(FastListMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = UserActivitySerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return UserActivity.objects.filter(user=self.request.user)
+        return UserActivity.objects.filter(user=self.request.user).select_related('product')
     
     @action(detail=False, methods=['get'])
     def analytics(self, request):
@@ -555,6 +733,7 @@ class PaymentViewSet(viewsets.ViewSet):
         self.payment = FlutterwavePayment()
     
     @action(detail=False, methods=['post'])
+    @idempotent_action('payment_initialize')
     def initialize(self, request):
         """Initialize a payment transaction"""
         try:
@@ -565,6 +744,9 @@ class PaymentViewSet(viewsets.ViewSet):
                 payment_type=request.data.get('payment_type', 'card')
             )
             return Response(payment)
+        except FlutterwavePaymentError as e:
+            # 502 when Flutterwave is unavailable, so an idempotent retry runs again
+            return Response({'error': str(e)}, status=e.status_code)
         except Exception as e:
             return Response({'error': str(e)}, status=400)
     
@@ -645,4 +827,42 @@ class ReportViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'])
     def comprehensive(self, request):
         """Get comprehensive report"""
-        return Response(SalesReport.get_comprehensive_report()) 
\ No newline at end of file
+        return Response(SalesReport.get_comprehensive_report())
+    
+    @action(detail=False, methods=['get'])
+    def fx_rate(self, request):
+        """Get FX rate cache metrics: rate age, refresh latency and stale serves"""
+        # Imported here: the FX service reads the Payoneer credentials at import time
+        from .services.fx import fx_service
+        return Response(fx_service.get_rate_stats())
+    
+    @action(detail=False, methods=['get'])
+    def catalog_export(self, request):
+        """Stream the full catalog as NDJSON or CSV (``?export_format=``, ``?updated_since=``)"""
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in export.CONTENT_TYPES:
+            return Response({'error': 'export_format must be ndjson or csv'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        updated_since = request.query_params.get('updated_since')
+        if updated_since:
+            updated_since = export.parse_updated_since(updated_since)
+            if updated_since is None:
+                return Response({'error': 'updated_since must be an ISO 8601 date or datetime'},
+                              status=status.HTTP_400_BAD_REQUEST)
+        
+        # Taken before the first row is read, for the client's next updated_since
+        started_at = timezone.now()
+        response = StreamingHttpResponse(
+            export.stream_catalog(export_format, updated_since or None),
+            content_type=export.CONTENT_TYPES[export_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="catalog.{export_format}"'
+        response['X-Export-Started-At'] = started_at.isoformat()
+        return response
+    
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        """Get response cache hit/miss counters"""
+        return Response({
+            'product_list': get_response_cache_stats(ProductViewSet.cache_prefix)
+        }) 
\ No newline at end of file
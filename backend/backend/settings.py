@@ -152,8 +152,58 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # JSON by default; 'Accept: application/msgpack' selects MessagePack
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.ORJSONRenderer',
+        'api.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.renderers.ORJSONParser',
+        'api.renderers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
+# Cache: shared Redis when REDIS_URL is set, per-process memory otherwise
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Catalog response cache (api.caching.ResponseCacheMixin)
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'False') == 'True'
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 300))  # seconds
+
+# Product view buffering (api.services.view_buffer)
+# 'local' flushes from a per-process thread; 'redis' is shared and drained by Celery
+VIEW_BUFFER_BACKEND = os.environ.get('VIEW_BUFFER_BACKEND', 'local')
+VIEW_BUFFER_REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+VIEW_BUFFER_FLUSH_INTERVAL = 10  # seconds
+VIEW_BUFFER_BATCH_SIZE = 1000
+
+# Cache-resident carts (api.services.cart_store)
+# 'local' keeps carts per process (tests and single-process development only);
+# 'redis' is shared and flushed by Celery, and the default when REDIS_URL is set
+CART_STORE_BACKEND = os.environ.get('CART_STORE_BACKEND', 'redis' if os.environ.get('REDIS_URL') else 'local')
+CART_STORE_REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+CART_STORE_FLUSH_INTERVAL = 5  # seconds
+CART_STORE_BATCH_SIZE = 500
+CART_STORE_TTL = 7 * 24 * 3600  # idle carts are reloaded from the database after this
+
+STOCK_RESERVATION_TTL = 15 * 60  # seconds a carted flash-sale unit stays held
+STOCK_RESERVATION_SHARDS = 8
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -18,5 +18,40 @@ app.conf.beat_schedule = {
         'options': {
             'expires': 3600  # Task expires after 1 hour
         }
+    },
+    'flush-product-views': {
+        'task': 'api.tasks.flush_product_views',
+        'schedule': 10.0,  # Every 10 seconds
+        'options': {
+            'expires': 10
+        }
+    },
+    'flush-carts': {
+        'task': 'api.tasks.flush_carts',
+        'schedule': 5.0,  # Every 5 seconds
+        'options': {
+            'expires': 5
+        }
+    },
+    'reconcile-stock-reservations': {
+        'task': 'api.tasks.reconcile_stock_reservations',
+        'schedule': 10.0,  # Every 10 seconds
+        'options': {
+            'expires': 10
+        }
+    },
+    'refresh-fx-rate': {
+        'task': 'api.tasks.refresh_fx_rate',
+        'schedule': 60.0,  # Every minute; refreshes once the rate is within 90s of expiry
+        'options': {
+            'expires': 60
+        }
+    },
+    'reconcile-usd-balance': {
+        'task': 'api.tasks.reconcile_usd_balance',
+        'schedule': crontab(minute='*/5'),  # Every 5 minutes
+        'options': {
+            'expires': 300
+        }
     }
 } 
\ No newline at end of file
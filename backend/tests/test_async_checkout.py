@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+from decimal import Decimal
+from api.benchmarks.mock_revolut import MockRevolutServer
+from api.routes import checkout as checkout_routes
+from api.services.aio import run_coroutine
+from api.services.checkout_service import CheckoutError, CheckoutService
+from api.services.quote_cache import LocalQuoteCache
+from api.services.revolut_service import RevolutService
+
+ITEMS = [
+    {'id': '1', 'name': 'Product 1', 'price': '25.00', 'quantity': 1},
+    {'id': '2', 'name': 'Product 2', 'price': '15.00', 'quantity': 1}
+]
+ADDRESS = {'street': '123 Test St', 'city': 'Test City', 'country': 'US'}
+
+@pytest.fixture
+def server():
+    with MockRevolutServer() as server:
+        yield server
+
+@pytest.fixture
+def service(server):
+    service = CheckoutService()
+    service.payment_service = RevolutService(api_key='test-api-key', base_url=server.base_url)
+    service.quote_cache = LocalQuoteCache()
+    yield service
+    run_coroutine(service.payment_service.aclose())
+
+def test_async_checkout(service, server):
+    result = run_coroutine(service.aprocess_checkout(ITEMS, ADDRESS, 'card-1'))
+    assert result['status'] == 'success'
+    assert result['order']['totals']['total'] == Decimal('46.79')
+    assert result['payment']['amount'] == 4679
+    assert result['order']['payment']['transaction_id'] == result['payment']['id']
+    assert server.stats['transactions'] == 1
+
+def test_async_checkout_matches_sync_totals(service):
+    result = run_coroutine(service.aprocess_checkout(ITEMS, ADDRESS, 'card-1'))
+    assert result['order']['totals'] == service.get_order_summary(ITEMS, ADDRESS)
+
+def test_declined_payment(service):
+    result = run_coroutine(service.aprocess_checkout(ITEMS, ADDRESS, 'declined-1'))
+    assert result['status'] == 'failed'
+
+@pytest.mark.parametrize('card_id', ['missing-1', 'expired-1'])
+def test_card_errors(service, server, card_id):
+    with pytest.raises(CheckoutError):
+        run_coroutine(service.aprocess_checkout(ITEMS, ADDRESS, card_id))
+    assert server.stats['transactions'] == 0
+
+def test_unreachable_provider_is_payment_error(server):
+    service = CheckoutService()
+    service.payment_service = RevolutService(api_key='test-api-key', base_url=server.base_url)
+    server.stop()
+    with pytest.raises(CheckoutError, match='Payment processing failed'):
+        run_coroutine(service.aprocess_checkout(ITEMS, ADDRESS, 'card-1'))
+
+def test_connections_reused_across_checkouts(service, server):
+    for _ in range(20):
+        run_coroutine(service.aprocess_checkout(ITEMS, ADDRESS, 'card-1'))
+    assert server.stats['transactions'] == 20
+    # 40 requests, at most one connection per pool shard
+    assert server.stats['connections'] <= RevolutService.POOL_SHARDS
+
+def test_concurrent_checkouts(service, server):
+    async def checkouts():
+        return await asyncio.gather(*(
+            service.aprocess_checkout(ITEMS, ADDRESS, f'card-{n}') for n in range(20)
+        ))
+
+    results = run_coroutine(checkouts())
+    assert all(result['status'] == 'success' for result in results)
+    assert server.stats['transactions'] == 20
+
+def test_async_quote(service):
+    quote = service.quote(ITEMS, ADDRESS)
+    result = run_coroutine(service.aprocess_quote(quote['quote_id'], 'card-1'))
+    assert result['order']['totals']['total'] == quote['total']
+
+def test_process_route(monkeypatch, service, server):
+    from flask import Flask
+    app = Flask(__name__)
+    app.register_blueprint(checkout_routes.checkout_bp)
+    monkeypatch.setattr(checkout_routes, 'checkout_service', service)
+    client = app.test_client()
+
+    body = {'items': ITEMS, 'shipping_address': ADDRESS, 'payment_card_id': 'card-1'}
+    response = client.post('/api/checkout/process', json=body)
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'success'
+
+    missing = client.post('/api/checkout/process', json={**body, 'payment_card_id': 'missing-1'})
+    assert missing.status_code == 400
+    assert missing.get_json()['error_type'] == 'checkout_error'
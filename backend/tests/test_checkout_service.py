@@ -1,6 +1,8 @@
 import pytest
 from decimal import Decimal
-from api.services.checkout_service import checkout_service
+from api.services.checkout_service import CheckoutService, QuoteExpiredError, checkout_service
+from api.services.order_calculator import OrderCalculator
+from api.services.quote_cache import LocalQuoteCache
 from api.services.privacy_service import PrivacyServiceError
 
 def test_successful_checkout():
@@ -138,4 +140,80 @@ def test_free_shipping_checkout():
 
     # Verify payment amount
     payment = result['payment']
-    assert payment['amount'] == 6120  # 61.20 in cents 
\ No newline at end of file
+    assert payment['amount'] == 6120  # 61.20 in cents 
+
+@pytest.fixture
+def quoting_service(monkeypatch):
+    service = CheckoutService()
+    service.quote_cache = LocalQuoteCache()
+    calculations = []
+    calculate = service.order_calculator.calculate_order_totals
+
+    def counting_calculate(**kwargs):
+        calculations.append(kwargs)
+        return calculate(**kwargs)
+
+    monkeypatch.setattr(service.order_calculator, 'calculate_order_totals', counting_calculate)
+    service.calculations = calculations
+    return service
+
+QUOTE_ITEMS = [
+    {'id': '1', 'name': 'Product 1', 'price': '15.00', 'quantity': 2},
+    {'id': '2', 'name': 'Product 2', 'price': '10.00', 'quantity': 1}
+]
+QUOTE_ADDRESS = {'street': '123 Test St', 'city': 'Test City', 'country': 'US'}
+
+def test_identical_carts_share_a_quote(quoting_service):
+    first = quoting_service.quote(QUOTE_ITEMS, QUOTE_ADDRESS)
+    # Same cart, keys in a different order
+    again = quoting_service.quote([dict(reversed(list(item.items()))) for item in QUOTE_ITEMS], dict(QUOTE_ADDRESS))
+
+    assert again == first
+    assert first['total'] == Decimal('46.79')
+    assert len(quoting_service.calculations) == 1
+
+    quoting_service.quote(QUOTE_ITEMS[:1], QUOTE_ADDRESS)
+    assert len(quoting_service.calculations) == 2
+
+def test_fee_change_gives_a_new_quote(quoting_service, monkeypatch):
+    first = quoting_service.quote(QUOTE_ITEMS, QUOTE_ADDRESS)
+    monkeypatch.setattr(OrderCalculator, 'BASE_SHIPPING_FEE', Decimal('6.99'))
+    again = quoting_service.quote(QUOTE_ITEMS, QUOTE_ADDRESS)
+
+    assert again['quote_id'] != first['quote_id']
+    assert again['total'] == Decimal('47.79')
+    with pytest.raises(QuoteExpiredError):
+        quoting_service.process_quote(first['quote_id'], 'test-card-1')
+
+def test_redeem_quote_without_recalculating(quoting_service, monkeypatch):
+    charges = []
+
+    def process_transaction(**kwargs):
+        charges.append(kwargs)
+        return {'id': 'txn-1', 'status': 'approved', 'amount': kwargs['amount']}
+
+    monkeypatch.setattr(quoting_service.payment_service, 'process_transaction', process_transaction)
+    quote = quoting_service.quote(QUOTE_ITEMS, QUOTE_ADDRESS)
+    result = quoting_service.process_quote(quote['quote_id'], 'test-card-1')
+
+    assert result['status'] == 'success'
+    assert result['order']['items'] == QUOTE_ITEMS
+    assert result['order']['totals']['total'] == Decimal('46.79')
+    assert charges[0]['amount'] == 4679
+    assert len(quoting_service.calculations) == 1
+
+def test_invalidated_quotes_cannot_be_redeemed(quoting_service):
+    quote = quoting_service.quote(QUOTE_ITEMS, QUOTE_ADDRESS)
+    quoting_service.quote_cache.invalidate()
+
+    with pytest.raises(QuoteExpiredError):
+        quoting_service.process_quote(quote['quote_id'], 'test-card-1')
+    assert quoting_service.quote(QUOTE_ITEMS, QUOTE_ADDRESS)['quote_id'] == quote['quote_id']
+    assert len(quoting_service.calculations) == 2
+
+
+def test_expired_quotes_are_purged_on_write():
+    cache = LocalQuoteCache(ttl=0, purge_interval=0)
+    for n in range(10):
+        cache.put(f'quote-{n}', QUOTE_ITEMS, QUOTE_ADDRESS, {}, 'v1')
+    assert list(cache._entries) == ['quote-9']
@@ -0,0 +1,155 @@
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from api.routes import checkout as checkout_routes
+from api.services.checkout_service import PaymentUnavailableError
+from api.services.idempotency import (
+    IdempotencyKeyReusedError, IdempotencyRecord, IdempotencyService, InvalidIdempotencyKeyError,
+    LocalIdempotencyStore
+)
+
+@pytest.fixture
+def service():
+    return IdempotencyService(LocalIdempotencyStore(), wait_timeout=5)
+
+def test_replay_returns_stored_response(service):
+    calls = []
+
+    def handler():
+        calls.append(1)
+        return 201, {'card_id': 'card-1'}
+
+    assert service.execute('card_create', 'key-1', 'fp', handler) == (201, {'card_id': 'card-1'}, False)
+    assert service.execute('card_create', 'key-1', 'fp', handler) == (201, {'card_id': 'card-1'}, True)
+    assert len(calls) == 1
+
+def test_keys_are_scoped(service):
+    service.execute('card_create', 'key-1', 'fp', lambda: (200, {'n': 1}))
+    assert service.execute('checkout_process', 'key-1', 'fp', lambda: (200, {'n': 2})) == (200, {'n': 2}, False)
+
+def test_key_reused_for_different_request(service):
+    service.execute('card_create', 'key-1', 'fp', lambda: (200, {}))
+    with pytest.raises(IdempotencyKeyReusedError):
+        service.execute('card_create', 'key-1', 'other-fp', lambda: (200, {}))
+
+def test_invalid_key(service):
+    with pytest.raises(InvalidIdempotencyKeyError):
+        service.execute('card_create', ' ', 'fp', lambda: (200, {}))
+
+def test_run_reports_key_errors(service):
+    assert service.run('card_create', ' ', 'fp', lambda: (200, {}))[:2] == (
+        400, {'status': 'failed', 'error': 'Idempotency-Key must be 1 to 255 characters',
+              'error_type': 'validation_error'}
+    )
+
+def test_local_store_sweeps_expired_records():
+    store = LocalIdempotencyStore(ttl=0, sweep_interval=0)
+    service = IdempotencyService(store)
+    for n in range(10):
+        service.execute('card_create', f'key-{n}', 'fp', lambda: (200, {}))
+    store.claim('other', IdempotencyRecord(fingerprint='fp', token='t'))
+    assert list(store._records) == ['other']
+
+def test_server_errors_and_exceptions_are_retried(service):
+    def timeout():
+        raise RuntimeError('Provider timed out')
+
+    assert service.execute('card_create', 'key-1', 'fp', lambda: (502, {}))[2] is False
+    with pytest.raises(RuntimeError):
+        service.execute('card_create', 'key-1', 'fp', timeout)
+    assert service.execute('card_create', 'key-1', 'fp', lambda: (200, {'ok': True})) == (200, {'ok': True}, False)
+
+def test_concurrent_duplicate_waits_for_first(service):
+    started = threading.Event()
+    finish = threading.Event()
+    calls = []
+
+    def handler():
+        calls.append(1)
+        started.set()
+        finish.wait(5)
+        return 200, {'order_id': 'order-1'}
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(service.execute, 'checkout_process', 'key-1', 'fp', handler)
+        assert started.wait(5)
+        duplicate = pool.submit(service.execute, 'checkout_process', 'key-1', 'fp', handler)
+        finish.set()
+        assert first.result() == (200, {'order_id': 'order-1'}, False)
+        assert duplicate.result() == (200, {'order_id': 'order-1'}, True)
+    assert len(calls) == 1
+
+def test_checkout_process_route_replays(monkeypatch, service):
+    from flask import Flask
+    app = Flask(__name__)
+    app.register_blueprint(checkout_routes.checkout_bp)
+    monkeypatch.setattr(checkout_routes, 'idempotency_service', service)
+    calls = []
+
+    async def aprocess_checkout(**kwargs):
+        calls.append(kwargs)
+        return {'status': 'success', 'order': {'total': '31.49'}}
+
+    monkeypatch.setattr(checkout_routes.checkout_service, 'aprocess_checkout', aprocess_checkout)
+    body = {'items': [{'price': '25.00', 'quantity': 1}], 'shipping_address': {'city': 'Lagos'},
+            'payment_card_id': 'card-1'}
+    client = app.test_client()
+
+    first = client.post('/api/checkout/process', json=body, headers={'Idempotency-Key': 'key-1'})
+    retry = client.post('/api/checkout/process', json=body, headers={'Idempotency-Key': 'key-1'})
+    assert first.status_code == retry.status_code == 200
+    assert retry.get_json() == first.get_json()
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert len(calls) == 1
+
+    changed = client.post('/api/checkout/process', json={**body, 'payment_card_id': 'card-2'},
+                          headers={'Idempotency-Key': 'key-1'})
+    assert changed.status_code == 422
+
+def test_checkout_process_route_retries_provider_failures(monkeypatch, service):
+    from flask import Flask
+    app = Flask(__name__)
+    app.register_blueprint(checkout_routes.checkout_bp)
+    monkeypatch.setattr(checkout_routes, 'idempotency_service', service)
+    outcomes = [PaymentUnavailableError('Payment processing failed: timed out'), {'status': 'success'}]
+
+    async def aprocess_checkout(**kwargs):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(checkout_routes.checkout_service, 'aprocess_checkout', aprocess_checkout)
+    body = {'items': [{'price': '25.00', 'quantity': 1}], 'shipping_address': {'city': 'Lagos'},
+            'payment_card_id': 'card-1'}
+    client = app.test_client()
+
+    failed = client.post('/api/checkout/process', json=body, headers={'Idempotency-Key': 'key-1'})
+    assert failed.status_code == 502
+    assert failed.get_json()['error_type'] == 'payment_unavailable'
+    retry = client.post('/api/checkout/process', json=body, headers={'Idempotency-Key': 'key-1'})
+    assert retry.status_code == 200
+    assert 'Idempotent-Replayed' not in retry.headers
+    assert not outcomes
+
+def test_checkout_process_keys_are_per_client(monkeypatch, service):
+    from flask import Flask
+    app = Flask(__name__)
+    app.register_blueprint(checkout_routes.checkout_bp)
+    monkeypatch.setattr(checkout_routes, 'idempotency_service', service)
+    calls = []
+
+    async def aprocess_checkout(**kwargs):
+        calls.append(kwargs)
+        return {'status': 'success'}
+
+    monkeypatch.setattr(checkout_routes.checkout_service, 'aprocess_checkout', aprocess_checkout)
+    body = {'items': [{'price': '25.00', 'quantity': 1}], 'shipping_address': {'city': 'Lagos'},
+            'payment_card_id': 'card-1'}
+    client = app.test_client()
+
+    for address in ('10.0.0.1', '10.0.0.2'):
+        response = client.post('/api/checkout/process', json=body,
+                               headers={'Idempotency-Key': 'key-1', 'X-Forwarded-For': address})
+        assert 'Idempotent-Replayed' not in response.headers
+    assert len(calls) == 2
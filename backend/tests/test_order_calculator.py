@@ -1,3 +1,5 @@
+import random
+import numpy as np
 import pytest
 from decimal import Decimal
 from api.services.order_calculator import order_calculator
@@ -85,4 +87,57 @@ def test_breakdown_information():
     assert 'breakdown' in totals
     assert totals['breakdown']['items'] == items
     assert totals['breakdown']['fulfillment_rate'] == 0.02
-    assert totals['breakdown']['shipping_threshold'] == 50.00 
\ No newline at end of file
+    assert totals['breakdown']['shipping_threshold'] == 50.00 
+
+
+def scalar_quote(items):
+    subtotal = sum(Decimal(item['price']) * item['quantity'] for item in items)
+    return order_calculator.calculate_order_totals(Decimal(subtotal), items)
+
+def test_batch_matches_scalar_path():
+    rng = random.Random(20)
+    carts = [
+        [
+            {'price': f"{rng.randint(1, 20000) / 100:.2f}", 'quantity': rng.randint(1, 5)}
+            for _ in range(rng.randint(0, 6))
+        ]
+        for _ in range(2000)
+    ]
+    # Commission ties (x.xx5) and the free shipping boundary
+    carts += [
+        [{'price': '0.25', 'quantity': 1}],
+        [{'price': '0.75', 'quantity': 1}],
+        [{'price': '49.99', 'quantity': 1}],
+        [{'price': '25.00', 'quantity': 2}],
+        [{'price': '-0.25', 'quantity': 1}],
+    ]
+
+    batch = order_calculator.quote_carts(carts)
+
+    for i, items in enumerate(carts):
+        expected = scalar_quote(items)
+        for field in ('subtotal', 'fulfillment_commission', 'shipping_fee', 'total'):
+            assert order_calculator.from_minor_units(batch[field][i]) == expected[field], (field, items)
+
+def test_matrix_matches_carts():
+    prices = ['19.99', '5.05', '120.00']
+    quantities = np.array([[1, 0, 0], [0, 3, 0], [2, 1, 1], [0, 0, 0]])
+    carts = [
+        [{'price': price, 'quantity': int(quantity)} for price, quantity in zip(prices, row) if quantity]
+        for row in quantities
+    ]
+
+    matrix = order_calculator.quote_matrix(prices, quantities)
+    by_cart = order_calculator.quote_carts(carts)
+
+    for field in matrix:
+        assert matrix[field].tolist() == by_cart[field].tolist()
+    assert matrix['total'].tolist() == [2638, 2144, 16833, 599]
+
+def test_batch_rejects_sub_cent_prices():
+    with pytest.raises(ValueError):
+        order_calculator.quote_carts([[{'price': '9.999', 'quantity': 1}]])
+
+def test_batch_accepts_float_prices():
+    batch = order_calculator.quote_carts([[{'price': 19.99, 'quantity': 1}]])
+    assert batch['subtotal'].tolist() == [1999]